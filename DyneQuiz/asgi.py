@@ -14,15 +14,17 @@ django.setup()
 
 from channels.routing import ProtocolTypeRouter, URLRouter
 from channels.auth import AuthMiddlewareStack
+from core.metrics import MetricsEndpoint
 
 
 from quiz.routing import websocket_urlpatterns
 
-application = ProtocolTypeRouter({
+# Metrics are answered before Django's URL resolution and middleware
+application = MetricsEndpoint(ProtocolTypeRouter({
     "http": django_asgi_app,
     "websocket": AuthMiddlewareStack(
         URLRouter(
             websocket_urlpatterns
         )
     ),
-})
+}))
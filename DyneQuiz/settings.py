@@ -75,7 +75,7 @@ AUTH_USER_MODEL = 'members.User'
 REST_FRAMEWORK = {
     'EXCEPTION_HANDLER': 'members.utils.custom_exception_handler',
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'members.authentication.ClaimsJWTAuthentication',
         'oauth2_provider.contrib.rest_framework.OAuth2Authentication',
         'drf_social_oauth2.authentication.SocialAuthentication',
     ),
@@ -92,6 +92,7 @@ SIMPLE_JWT = {
 }
 
 MIDDLEWARE = [
+    'core.middleware.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     "whitenoise.middleware.WhiteNoiseMiddleware",
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -104,6 +105,32 @@ MIDDLEWARE = [
     'core.middleware.GuestPlayerMiddleware',
 ]
 
+# Per-request and per-consumer-call query counters (Server-Timing header and sampled
+# logs). Slow units of work are always logged.
+QUERY_INSTRUMENTATION = os.environ.get('QUERY_INSTRUMENTATION', '').lower() in ('1', 'true', 'yes')
+QUERY_INSTRUMENTATION_SAMPLE_RATE = float(os.environ.get('QUERY_INSTRUMENTATION_SAMPLE_RATE', 0.01))
+QUERY_INSTRUMENTATION_SLOW_MS = float(os.environ.get('QUERY_INSTRUMENTATION_SLOW_MS', 500))
+if QUERY_INSTRUMENTATION:
+    # First, so queries made by the other middleware are counted too
+    MIDDLEWARE.insert(0, 'core.middleware.QueryInstrumentationMiddleware')
+
+# Prometheus metrics of this worker, served by the ASGI app ahead of Django middleware.
+# Off unless METRICS_PATH is set. Scrapes must then carry "Authorization: Bearer
+# METRICS_TOKEN" and come from METRICS_ALLOWED_IPS (the peer address, so a proxy's
+# address when behind one), whichever are set. Collectors that query the database
+# or Redis run at most once per METRICS_COLLECT_SECONDS.
+METRICS_PATH = os.environ.get('METRICS_PATH', '')
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+METRICS_ALLOWED_IPS = [
+    s.strip() for s in os.environ.get('METRICS_ALLOWED_IPS', '').split(',') if s.strip()
+]
+METRICS_COLLECT_SECONDS = float(os.environ.get('METRICS_COLLECT_SECONDS', 5))
+
+# Event-loop lag monitor: wakes up every interval and logs a warning when the loop
+# ran its timer more than the threshold late (0 interval disables it)
+EVENT_LOOP_LAG_INTERVAL = float(os.environ.get('EVENT_LOOP_LAG_INTERVAL', 0.5))
+EVENT_LOOP_LAG_THRESHOLD = float(os.environ.get('EVENT_LOOP_LAG_THRESHOLD', 0.1))
+
 # set oauth authentication
 AUTHENTICATION_BACKENDS = (
  #   'drf_social_oauth2.backends.DjangoOAuth2Backend',  # Enables DRF token authentication
@@ -147,20 +174,105 @@ WSGI_APPLICATION = 'DyneQuiz.wsgi.application'
 ASGI_APPLICATION = 'DyneQuiz.asgi.application'
 
 # layer for Websocket
-# CHANNEL_LAYERS = {
-#     'default': {
-#         'BACKEND': 'channels_redis.core.RedisChannelLayer',
-#         'CONFIG': {
-#             "hosts": [('127.0.0.1', 6379)],
-#         },
-#     },
-# }
-
-CHANNEL_LAYERS = {
-    "default": {
-        "BACKEND": "channels.layers.InMemoryChannelLayer"
+# CHANNEL_LAYER_BACKEND picks the layer:
+#   redis  - shared by every worker and node, groups sharded by game PIN over REDIS_URLS
+#   local  - in-process broker shared by several layer instances (multi-worker tests)
+#   memory - single process only (development)
+CHANNEL_LAYER_BACKEND = os.environ.get('CHANNEL_LAYER_BACKEND', 'memory')
+REDIS_URLS = [
+    s.strip() for s in os.environ.get('REDIS_URLS', 'redis://127.0.0.1:6379').split(',') if s.strip()
+]
+
+if CHANNEL_LAYER_BACKEND == 'redis':
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'core.channel_layers.PinShardedRedisChannelLayer',
+            'CONFIG': {
+                'hosts': REDIS_URLS,
+                'capacity': int(os.environ.get('CHANNEL_LAYER_CAPACITY', 1000)),
+                'expiry': 10,
+                'group_expiry': 6 * 60 * 60,
+            },
+        },
     }
-}
+elif CHANNEL_LAYER_BACKEND == 'local':
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'core.channel_layers.LocalBrokerChannelLayer',
+            'CONFIG': {'broker': 'default'},
+        },
+    }
+else:
+    CHANNEL_LAYERS = {
+        "default": {
+            "BACKEND": "channels.layers.InMemoryChannelLayer"
+        }
+    }
+
+# Django cache (guest token revocations, stale JWT membership claims). CACHE_URL points
+# it at a Redis every worker shares. Without it the cache is per process and would hide
+# invalidations made by other workers, so JWT membership claims and guest tokens are
+# then checked against the database instead
+CACHE_URL = os.environ.get('CACHE_URL', '')
+if CACHE_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': CACHE_URL,
+        },
+    }
+
+# Answer ingestion: answers are buffered per question and written in batches
+QUIZ_ANSWER_BUFFER_SIZE = int(os.environ.get('QUIZ_ANSWER_BUFFER_SIZE', 500))
+QUIZ_ANSWER_BUFFER_MAX_AGE = float(os.environ.get('QUIZ_ANSWER_BUFFER_MAX_AGE', 5))
+QUIZ_ANSWER_SPOOL_DIR = os.environ.get('QUIZ_ANSWER_SPOOL_DIR', os.path.join(BASE_DIR, 'answer_spool'))
+
+# Game flow: seconds the answer and the leaderboard stay on screen before the
+# server advances the game on its own (0 leaves it to the host)
+QUIZ_REVEAL_SECONDS = float(os.environ.get('QUIZ_REVEAL_SECONDS', 5))
+QUIZ_LEADERBOARD_SECONDS = float(os.environ.get('QUIZ_LEADERBOARD_SECONDS', 5))
+
+# A game engine is unloaded from a worker once no socket has used it for this long;
+# a game still running is resumed from the database by the next socket
+QUIZ_ENGINE_IDLE_SECONDS = float(os.environ.get('QUIZ_ENGINE_IDLE_SECONDS', 60))
+
+# Only one worker runs a game: it holds a lease on the game in the channel layer,
+# renewed every third of this many seconds. Sockets on other workers send their
+# commands to it and wait up to QUIZ_ENGINE_CALL_SECONDS for an answer, after which
+# they are closed with 1012 (service restart) and reconnect
+QUIZ_ENGINE_LEASE_SECONDS = float(os.environ.get('QUIZ_ENGINE_LEASE_SECONDS', 15))
+QUIZ_ENGINE_CALL_SECONDS = float(os.environ.get('QUIZ_ENGINE_CALL_SECONDS', 10))
+
+# Lobby joins and leaves are batched into one lobby_update per window
+QUIZ_LOBBY_UPDATE_SECONDS = float(os.environ.get('QUIZ_LOBBY_UPDATE_SECONDS', 0.2))
+
+# Each worker subscribes once per game group and fans broadcasts out to its own
+# sockets, yielding to the event loop after every shard of this many sockets
+QUIZ_FANOUT_SHARD_SIZE = int(os.environ.get('QUIZ_FANOUT_SHARD_SIZE', 500))
+
+# Live answer histogram of the open question, pushed to hosts at most once per interval
+QUIZ_ANSWER_STATS_SECONDS = float(os.environ.get('QUIZ_ANSWER_STATS_SECONDS', 0.25))
+
+# Spectator screens get coalesced game state at most once per interval
+QUIZ_SPECTATOR_UPDATE_SECONDS = float(os.environ.get('QUIZ_SPECTATOR_UPDATE_SECONDS', 0.5))
+
+# Reconnects: sockets resume from the last sequence number they saw while the
+# event is still among the last QUIZ_REPLAY_BUFFER_SIZE broadcasts of the game,
+# and a lobby player is only dropped after the grace period
+QUIZ_REPLAY_BUFFER_SIZE = int(os.environ.get('QUIZ_REPLAY_BUFFER_SIZE', 256))
+QUIZ_RECONNECT_GRACE_SECONDS = float(os.environ.get('QUIZ_RECONNECT_GRACE_SECONDS', 10))
+
+# Identity resolved on websocket connect (user, host flag, player) is cached per pin
+QUIZ_IDENTITY_CACHE_SIZE = int(os.environ.get('QUIZ_IDENTITY_CACHE_SIZE', 10000))
+QUIZ_IDENTITY_CACHE_SECONDS = float(os.environ.get('QUIZ_IDENTITY_CACHE_SECONDS', 60))
+
+# Quiz snapshots shared by the views and consumers of a process; loaded games keep their own copy
+QUIZ_SNAPSHOT_CACHE_SIZE = int(os.environ.get('QUIZ_SNAPSHOT_CACHE_SIZE', 1000))
+QUIZ_SNAPSHOT_CACHE_SECONDS = float(os.environ.get('QUIZ_SNAPSHOT_CACHE_SECONDS', 600))
+
+# Guests authenticate with a signed token (player id, username, expiry) checked without
+# a query; revoked guests are kept in the cache for the lifetime of their tokens
+GUEST_TOKEN_LIFETIME_SECONDS = int(os.environ.get('GUEST_TOKEN_LIFETIME_SECONDS', 24 * 60 * 60))
 
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
@@ -0,0 +1,230 @@
+# benchmark.py
+import asyncio
+import platform
+import random
+import time
+import uuid
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import connection
+from django.test import AsyncClient, Client
+from django.test.utils import override_settings
+from django.urls import reverse
+from members.tokens import create_jwt_pair_for_user
+from organization.models import Organization, OrganizationMembership
+from question.models import Question
+from quiz.models import Quiz, GameSession
+from .stats import summarize
+
+PASSWORD = 'benchmark-password'
+BATCH_SIZE = 2000
+
+
+class Benchmark:
+    """
+    Seeds a realistic data volume and measures REST endpoints through the
+    test client (WSGI request path) and AsyncClient (ASGI request path).
+
+    Every request is made as a random member of a random organization, so
+    org-scoped endpoints see the per-org share of the seeded volume.
+    """
+
+    def __init__(self, orgs=50, members=20, questions=100000, quizzes=10000, questions_per_quiz=10,
+                 games=50, seed=None):
+        self.orgs = orgs
+        self.members = members
+        self.questions = questions
+        self.quizzes = quizzes
+        self.questions_per_quiz = questions_per_quiz
+        self.games = games
+        self.random = random.Random(seed)
+        self.run_id = uuid.uuid4().hex[:8]
+        self.organization_ids = []
+        self.users = []
+        self.quiz_ids = {}
+        self.pins = []
+
+    # ---- fixtures ----
+
+    def setup(self):
+        """Bulk insert organizations, members, questions, quizzes and game sessions"""
+        User = get_user_model()
+        password = make_password(PASSWORD)
+        organizations = Organization.objects.bulk_create([
+            Organization(name=f"Benchmark {self.run_id} {number}", slug=f"benchmark-{self.run_id}-{number}")
+            for number in range(self.orgs)
+        ])
+        self.organization_ids = [organization.id for organization in organizations]
+
+        users = User.objects.bulk_create([
+            User(
+                email=f"bench-{self.run_id}-{number}@example.com",
+                username=f"bench-{self.run_id}-{number}",
+                first_name="Bench",
+                last_name=str(number),
+                password=password
+            )
+            for number in range(self.orgs * self.members)
+        ], batch_size=BATCH_SIZE)
+        OrganizationMembership.objects.bulk_create([
+            OrganizationMembership(
+                user=user,
+                organization=organizations[number // self.members],
+                role='admin' if number % self.members == 0 else 'member'
+            )
+            for number, user in enumerate(users)
+        ], batch_size=BATCH_SIZE)
+        self.users = [
+            {'user': user, 'organization': organizations[number // self.members].id}
+            for number, user in enumerate(users)
+        ]
+        admins = users[::self.members]
+
+        questions = Question.objects.bulk_create([
+            Question(
+                text=f"Question {number}",
+                options=['A', 'B', 'C', 'D'],
+                correct_answer='A',
+                created_by=admins[number % self.orgs],
+                organization=organizations[number % self.orgs]
+            )
+            for number in range(self.questions)
+        ], batch_size=BATCH_SIZE)
+        questions_by_org = {}
+        for question in questions:
+            questions_by_org.setdefault(question.organization_id, []).append(question.id)
+
+        quizzes = Quiz.objects.bulk_create([
+            Quiz(
+                name=f"Quiz {number}",
+                description="Benchmark quiz",
+                difficulty=('easy', 'medium', 'hard')[number % 3],
+                tags=['benchmark'],
+                created_by=admins[number % self.orgs],
+                organization=organizations[number % self.orgs]
+            )
+            for number in range(self.quizzes)
+        ], batch_size=BATCH_SIZE)
+        for quiz in quizzes:
+            self.quiz_ids.setdefault(quiz.organization_id, []).append(quiz.id)
+        Through = Quiz.questions.through
+        Through.objects.bulk_create([
+            Through(quiz_id=quiz.id, question_id=question_id)
+            for quiz in quizzes
+            for question_id in self.random.sample(
+                questions_by_org.get(quiz.organization_id, []),
+                min(self.questions_per_quiz, len(questions_by_org.get(quiz.organization_id, [])))
+            )
+        ], batch_size=BATCH_SIZE)
+
+        for quiz in quizzes[:self.games]:
+            game = GameSession.objects.create(quiz=quiz, host_id=quiz.created_by_id)
+            self.pins.append(game.pin)
+
+        for entry in self.users:
+            entry['token'] = create_jwt_pair_for_user(entry['user'])['access']
+
+    def teardown(self):
+        """Delete everything created by setup, questions and quizzes go with their organizations"""
+        Organization.objects.filter(id__in=self.organization_ids).delete()
+        get_user_model().objects.filter(id__in=[entry['user'].id for entry in self.users]).delete()
+
+    # ---- requests ----
+
+    def endpoints(self):
+        """Name and request factory of every benchmarked endpoint"""
+        return [
+            ('quiz-list', lambda entry: ('get', reverse('list_quiz'), None)),
+            ('quiz-detail', lambda entry: (
+                'get', reverse('quiz-detail', args=[self.random.choice(self.quiz_ids[entry['organization']])]), None
+            )),
+            ('question-list', lambda entry: ('get', reverse('question-list-create'), None)),
+            ('game-session-detail', lambda entry: (
+                'get', reverse('game-session-detail', args=[self.random.choice(self.pins)]), None
+            )),
+            ('organization-members', lambda entry: ('get', reverse('organization-members'), None)),
+            ('login', lambda entry: (
+                'post', reverse('login'), {'email': entry['user'].email, 'password': PASSWORD}
+            )),
+        ]
+
+    def request_kwargs(self, entry, data):
+        kwargs = {'headers': {'Authorization': f"Bearer {entry['token']}"}}
+        if data is not None:
+            kwargs.update(data=data, content_type='application/json')
+        return kwargs
+
+    def run_sync(self, factory, count, warmup):
+        client = Client()
+        timings = []
+        errors = 0
+        started = None
+        for number in range(warmup + count):
+            if number == warmup:
+                started = time.perf_counter()
+            entry = self.random.choice(self.users)
+            method, path, data = factory(entry)
+            request_started = time.perf_counter()
+            response = getattr(client, method)(path, **self.request_kwargs(entry, data))
+            if number >= warmup:
+                timings.append(time.perf_counter() - request_started)
+                errors += response.status_code >= 400
+        return self.result(timings, errors, time.perf_counter() - started)
+
+    async def run_async(self, factory, count, warmup, concurrency):
+        client = AsyncClient()
+        timings = []
+        errors = 0
+        slots = asyncio.Semaphore(concurrency)
+
+        async def one(record):
+            nonlocal errors
+            entry = self.random.choice(self.users)
+            method, path, data = factory(entry)
+            async with slots:
+                request_started = time.perf_counter()
+                response = await getattr(client, method)(path, **self.request_kwargs(entry, data))
+            if record:
+                timings.append(time.perf_counter() - request_started)
+                errors += response.status_code >= 400
+
+        for _ in range(warmup):
+            await one(False)
+        started = time.perf_counter()
+        await asyncio.gather(*(one(True) for _ in range(count)))
+        return self.result(timings, errors, time.perf_counter() - started)
+
+    def result(self, timings, errors, elapsed):
+        result = summarize(timings)
+        result['errors'] = errors
+        result['rps'] = round(len(timings) / elapsed, 1) if elapsed else 0
+        return result
+
+    def run(self, requests=200, login_requests=20, warmup=5, concurrency=10, only=None):
+        """Measure every endpoint over both request paths and return the machine-readable report"""
+        report = {
+            'environment': {
+                'python': platform.python_version(),
+                'database': connection.vendor,
+                'debug': bool(settings.DEBUG),
+            },
+            'volume': {
+                'organizations': self.orgs,
+                'members': self.orgs * self.members,
+                'questions': self.questions,
+                'quizzes': self.quizzes,
+                'questions_per_quiz': self.questions_per_quiz,
+                'game_sessions': len(self.pins),
+            },
+            'wsgi': {},
+            'asgi': {},
+        }
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+            for name, factory in self.endpoints():
+                if only and name not in only:
+                    continue
+                count = login_requests if name == 'login' else requests
+                report['wsgi'][name] = self.run_sync(factory, count, warmup)
+                report['asgi'][name] = asyncio.run(self.run_async(factory, count, warmup, concurrency))
+        return report
@@ -0,0 +1,125 @@
+# channel_layers.py
+import re
+import time
+from channels.layers import InMemoryChannelLayer
+from channels_redis.core import RedisChannelLayer
+
+# Game groups are named <kind>_<pin>[_<suffix>], e.g. quiz_ABC123 or game_ABC123
+GAME_GROUP_RE = re.compile(r'^[a-z]+_(?P<pin>[A-Za-z0-9]+)')
+
+# Take the lease if it is free or already ours and (re)set its expiry, returns the holder
+ACQUIRE_LEASE = """
+local owner = redis.call('GET', KEYS[1])
+if owner and owner ~= ARGV[1] then
+    return owner
+end
+redis.call('SET', KEYS[1], ARGV[1], 'PX', ARGV[2])
+return ARGV[1]
+"""
+RELEASE_LEASE = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+class PinShardedRedisChannelLayer(RedisChannelLayer):
+    """
+    Redis channel layer that shards group membership by game PIN.
+
+    channels_redis picks the Redis host for a group by hashing the group name,
+    so quiz_<pin> and game_<pin> could land on different hosts. Hashing only
+    the PIN keeps every group of one game on the same shard.
+    """
+
+    def consistent_hash(self, value):
+        if isinstance(value, str):
+            match = GAME_GROUP_RE.match(value)
+            if match:
+                value = match.group('pin')
+        return super().consistent_hash(value)
+
+    async def acquire_lease(self, name, ttl, owner):
+        """Take or renew a lease for `owner`, returns whoever holds it"""
+        connection = self.connection(self.consistent_hash(name))
+        holder = await connection.eval(ACQUIRE_LEASE, 1, f"{self.prefix}lease:{name}", owner, int(ttl * 1000))
+        return holder.decode() if isinstance(holder, bytes) else holder
+
+    async def release_lease(self, name, owner):
+        connection = self.connection(self.consistent_hash(name))
+        await connection.eval(RELEASE_LEASE, 1, f"{self.prefix}lease:{name}", owner)
+
+
+_brokers = {}
+
+
+class LocalBrokerChannelLayer(InMemoryChannelLayer):
+    """
+    In-memory layer whose queues and groups are shared by every instance
+    created with the same broker name.
+
+    Each instance behaves like a separate worker attached to a common broker,
+    which lets tests exercise cross-worker group_send without a Redis server.
+    """
+
+    def __init__(self, broker='default', **kwargs):
+        super().__init__(**kwargs)
+        state = _brokers.setdefault(broker, {'channels': {}, 'groups': {}, 'leases': {}})
+        self.channels = state['channels']
+        self.groups = state['groups']
+        self.leases = state['leases']
+
+    async def flush(self):
+        # Clear in place so other workers on the broker see it too
+        self.channels.clear()
+        self.groups.clear()
+        self.leases.clear()
+
+    async def acquire_lease(self, name, ttl, owner):
+        """Take or renew a lease for `owner`, returns whoever holds it"""
+        holder, expires = self.leases.get(name, (None, 0))
+        now = time.monotonic()
+        if holder not in (None, owner) and expires > now:
+            return holder
+        self.leases[name] = (owner, now + ttl)
+        return owner
+
+    async def release_lease(self, name, owner):
+        if self.leases.get(name, (None, 0))[0] == owner:
+            del self.leases[name]
+
+
+async def acquire_lease(layer, name, ttl, owner):
+    """
+    Take or renew a named lease shared by every worker on the layer, returns
+    the owner holding it. Layers confined to one process have no other worker
+    to exclude and always grant it.
+    """
+    if not hasattr(layer, 'acquire_lease'):
+        return owner
+    return await layer.acquire_lease(name, ttl, owner)
+
+
+async def release_lease(layer, name, owner):
+    if hasattr(layer, 'release_lease'):
+        await layer.release_lease(name, owner)
+
+
+async def queue_depth(layer):
+    """
+    Messages waiting to be received by this process, by where they wait: 'local'
+    for the layer's in-process queues, 'redis' for this process's channel keys
+    still in Redis.
+    """
+    if isinstance(layer, RedisChannelLayer):
+        depth = {'local': sum(queue.qsize() for queue in list(layer.receive_buffer.values()))}
+        # All specific channels of a process share one sorted set per host
+        key = f"{layer.prefix}specific.{layer.client_prefix}!"
+        depth['redis'] = 0
+        for index in range(layer.ring_size):
+            depth['redis'] += await layer.connection(index).zcard(key)
+        return depth
+    if isinstance(layer, InMemoryChannelLayer):
+        return {'local': sum(queue.qsize() for queue in list(layer.channels.values()))}
+    return {}
@@ -0,0 +1,167 @@
+# instrumentation.py
+import functools
+import json
+import logging
+import random
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+from channels.db import database_sync_to_async as channels_database_sync_to_async
+from django.conf import settings
+from django.db import connection
+from django.db.backends.signals import connection_created
+from .metrics import Gauge
+
+logger = logging.getLogger(__name__)
+
+SLOWEST_SQL_LENGTH = 300
+
+
+class QueryStats:
+    """Query count, total SQL time and slowest statement of one unit of work"""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.slowest = 0.0
+        self.slowest_sql = None
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - started
+            self.count += 1
+            self.duration += duration
+            if duration >= self.slowest:
+                self.slowest = duration
+                self.slowest_sql = sql
+
+    @contextmanager
+    def capture(self):
+        """Count the queries run on this thread's connection while the block runs"""
+        with connection.execute_wrapper(self):
+            yield self
+
+    def server_timing(self):
+        """Value for a Server-Timing header, durations in milliseconds"""
+        return (
+            f'db;desc="{self.count} queries";dur={self.duration * 1000:.2f}, '
+            f'db-slowest;dur={self.slowest * 1000:.2f}'
+        )
+
+    def report(self, source, name, **extra):
+        """Log a sampled structured record, always logging slow units of work"""
+        slow = self.duration * 1000 >= settings.QUERY_INSTRUMENTATION_SLOW_MS
+        if not slow and random.random() >= settings.QUERY_INSTRUMENTATION_SAMPLE_RATE:
+            return
+        record = {
+            'source': source,
+            'name': name,
+            'queries': self.count,
+            'db_ms': round(self.duration * 1000, 2),
+            'slowest_ms': round(self.slowest * 1000, 2),
+            'slowest_sql': (self.slowest_sql or '')[:SLOWEST_SQL_LENGTH],
+            'slow': slow,
+            **extra,
+        }
+        logger.info(json.dumps(record))
+
+
+class ExecutorUsage:
+    """Calls made through database_sync_to_async that are waiting for, or running on, a thread"""
+
+    def __init__(self):
+        self.submitted = 0
+        self.running = 0
+        self._lock = threading.Lock()
+
+    def adjust(self, submitted=0, running=0):
+        with self._lock:
+            self.submitted += submitted
+            self.running += running
+
+    @property
+    def queued(self):
+        # A cancelled call stops counting as submitted while its thread still runs it
+        return max(self.submitted - self.running, 0)
+
+
+executor_usage = ExecutorUsage()
+
+Gauge(
+    'dynequiz_db_executor_queued',
+    'database_sync_to_async calls waiting for a thread',
+    callback=lambda: executor_usage.queued
+)
+Gauge(
+    'dynequiz_db_executor_busy_threads',
+    'database_sync_to_async calls currently running on a thread',
+    callback=lambda: executor_usage.running
+)
+
+
+def database_sync_to_async(func=None, *, name=None):
+    """
+    channels' database_sync_to_async that tracks executor usage, with the
+    request middleware's query counters around each call when
+    QUERY_INSTRUMENTATION is on.
+    """
+    if func is None:
+        return functools.partial(database_sync_to_async, name=name)
+    label = name or func.__qualname__
+
+    @functools.wraps(func)
+    def instrumented(*args, **kwargs):
+        executor_usage.adjust(running=1)
+        try:
+            if not settings.QUERY_INSTRUMENTATION:
+                return func(*args, **kwargs)
+            stats = QueryStats()
+            with stats.capture():
+                result = func(*args, **kwargs)
+            stats.report('ws', label)
+            return result
+        finally:
+            executor_usage.adjust(running=-1)
+
+    run = channels_database_sync_to_async(instrumented)
+
+    @functools.wraps(func)
+    async def tracked(*args, **kwargs):
+        executor_usage.adjust(submitted=1)
+        try:
+            return await run(*args, **kwargs)
+        finally:
+            executor_usage.adjust(submitted=-1)
+
+    return tracked
+
+
+# Database connections opened by any thread of this process, dropped once closed and collected
+_connections = weakref.WeakSet()
+_connections_lock = threading.Lock()
+
+
+def _track_connection(sender, connection, **kwargs):
+    with _connections_lock:
+        _connections.add(connection)
+
+
+connection_created.connect(_track_connection)
+
+
+def open_connections():
+    """Number of database connections of this process that are currently open"""
+    with _connections_lock:
+        wrappers = list(_connections)
+    return sum(wrapper.connection is not None for wrapper in wrappers)
+
+
+Gauge(
+    'dynequiz_db_connections_open',
+    'Database connections held open by this process',
+    callback=open_connections
+)
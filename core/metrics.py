@@ -0,0 +1,278 @@
+# metrics.py
+import asyncio
+import bisect
+import hmac
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class Registry:
+    """Process-wide set of metrics rendered in the Prometheus text format"""
+
+    def __init__(self):
+        self.metrics = {}
+        self.collectors = []
+        self._collected_at = None
+
+    def register(self, metric):
+        if metric.name in self.metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self.metrics[metric.name] = metric
+        return metric
+
+    def collector(self, func):
+        """Register a coroutine function run before every scrape, for values that need I/O"""
+        self.collectors.append(func)
+        return func
+
+    async def collect(self, max_age=0):
+        """Run the collectors, unless they already ran within the last `max_age` seconds"""
+        now = time.monotonic()
+        if max_age and self._collected_at is not None and now - self._collected_at < max_age:
+            return
+        self._collected_at = now
+        for func in self.collectors:
+            try:
+                await func()
+            except Exception:
+                logger.exception("Metrics collector %s failed", func.__qualname__)
+
+    def render(self):
+        lines = []
+        for metric in self.metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(metric.samples())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+
+def format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+def format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    type = None
+
+    def __init__(self, name, documentation, labelnames=(), registry=REGISTRY):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        registry.register(self)
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self):
+        with self._lock:
+            values = list(self._values.items())
+        return [f"{self.name}{format_labels(self.labelnames, key)} {format_value(value)}" for key, value in values]
+
+
+class Counter(Metric):
+    """Monotonically increasing count"""
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    """
+    Value that goes up and down. With `callback`, the value is read when the
+    metrics are rendered: the callback returns a number, or a dict mapping
+    label value tuples to numbers.
+    """
+    type = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=(), registry=REGISTRY, callback=None):
+        super().__init__(name, documentation, labelnames, registry)
+        self.callback = callback
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def samples(self):
+        if self.callback is None:
+            return super().samples()
+        try:
+            value = self.callback()
+        except Exception:
+            logger.exception("Could not collect %s", self.name)
+            return []
+        values = value.items() if isinstance(value, dict) else [((), value)]
+        return [
+            f"{self.name}{format_labels(self.labelnames, key)} {format_value(sample)}"
+            for key, sample in values
+        ]
+
+
+class Histogram(Metric):
+    """Distribution of observed values over fixed buckets"""
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), registry=REGISTRY, buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames, registry)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe how long the block takes, in seconds"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def samples(self):
+        with self._lock:
+            values = [(key, (list(state[0]), state[1], state[2])) for key, state in self._values.items()]
+        lines = []
+        for key, (counts, total, count) in values:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                labels = format_labels(self.labelnames, key, ('le', format_value(bound)))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+LOOP_LAG = Histogram(
+    'dynequiz_event_loop_lag_seconds',
+    'How late the event loop ran a timer scheduled by the lag monitor'
+)
+LOOP_BLOCKED = Counter(
+    'dynequiz_event_loop_blocked_total',
+    'Times the event loop was blocked beyond EVENT_LOOP_LAG_THRESHOLD'
+)
+
+_monitored_loops = set()
+
+
+async def monitor_loop_lag(interval, threshold):
+    """Sleep `interval` seconds at a time and record how much later than that the loop woke us"""
+    loop = asyncio.get_running_loop()
+    while True:
+        expected = loop.time() + interval
+        await asyncio.sleep(interval)
+        lag = max(loop.time() - expected, 0)
+        LOOP_LAG.observe(lag)
+        if lag > threshold:
+            LOOP_BLOCKED.inc()
+            logger.warning("Event loop was blocked for %.0f ms", lag * 1000)
+
+
+def start_loop_monitor():
+    """Start the lag monitor once for the running event loop"""
+    if not settings.EVENT_LOOP_LAG_INTERVAL:
+        return
+    loop = asyncio.get_running_loop()
+    if loop in _monitored_loops:
+        return
+    _monitored_loops.add(loop)
+    task = loop.create_task(monitor_loop_lag(settings.EVENT_LOOP_LAG_INTERVAL, settings.EVENT_LOOP_LAG_THRESHOLD))
+    task.add_done_callback(lambda _: _monitored_loops.discard(loop))
+
+
+class MetricsEndpoint:
+    """
+    ASGI wrapper serving the registry at METRICS_PATH and passing everything
+    else to the wrapped application. Also starts the event-loop lag monitor.
+
+    Scrapes are answered here, before any Django middleware, so access is
+    checked against METRICS_TOKEN and METRICS_ALLOWED_IPS when they are set.
+    """
+
+    def __init__(self, application, registry=REGISTRY):
+        self.application = application
+        self.registry = registry
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] in ('http', 'websocket'):
+            start_loop_monitor()
+        if scope['type'] == 'http' and settings.METRICS_PATH and scope['path'] == settings.METRICS_PATH:
+            status = self.check_access(scope)
+            if status is None:
+                await self.respond(send)
+            else:
+                await self.send_response(send, status, b'')
+            return
+        await self.application(scope, receive, send)
+
+    def check_access(self, scope):
+        """Error status for a scrape that is not allowed, None if it is"""
+        if settings.METRICS_ALLOWED_IPS:
+            client = scope.get('client')
+            if not client or client[0] not in settings.METRICS_ALLOWED_IPS:
+                return 403
+        if settings.METRICS_TOKEN:
+            authorization = dict(scope.get('headers', ())).get(b'authorization', b'')
+            if not hmac.compare_digest(authorization, f'Bearer {settings.METRICS_TOKEN}'.encode()):
+                return 401
+        return None
+
+    async def respond(self, send):
+        await self.registry.collect(max_age=settings.METRICS_COLLECT_SECONDS)
+        await self.send_response(send, 200, self.registry.render().encode())
+
+    async def send_response(self, send, status, body):
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [
+                (b'content-type', b'text/plain; version=0.0.4; charset=utf-8'),
+                (b'content-length', str(len(body)).encode()),
+            ],
+        })
+        await send({'type': 'http.response.body', 'body': body})
@@ -1,27 +1,88 @@
 # middleware.py
 import logging
-from django.utils import timezone
-from quiz.models import Player
+import time
+from django.utils.functional import SimpleLazyObject
+from quiz.guest_tokens import guest_lookup, read_guest_token
+from .instrumentation import QueryStats
+from .metrics import Counter, Histogram
 
 logger = logging.getLogger(__name__)
 
+HTTP_REQUESTS = Counter(
+    'dynequiz_http_requests_total',
+    'HTTP requests handled by this process',
+    ('view', 'method', 'status')
+)
+HTTP_REQUEST_SECONDS = Histogram(
+    'dynequiz_http_request_seconds',
+    'Time to handle one HTTP request, middleware included',
+    ('view',)
+)
+
 
 class GuestPlayerMiddleware:
+    """
+    Verifies the signed guest_token cookie without a query. The claims are set
+    as request.guest_claims; request.guest_player is only loaded from the
+    database when a view reads it.
+
+    Without a shared cache revocations are only known to the database, so
+    they are checked by that load: reading request.guest_player of a revoked
+    guest raises Player.DoesNotExist. The claims alone do not prove that the
+    guest still exists.
+    """
+
     def __init__(self, get_response):
         self.get_response = get_response
 
     def __call__(self, request):
-        if not request.user.is_authenticated:
-            guest_token = request.COOKIES.get('guest_token')
-            if guest_token:
-                try:
-                    request.guest_player = Player.objects.get(
-                        guest_id=guest_token,
-                        is_guest=True,
-                        guest_token_expiry__gt=timezone.now()  # Check expiry
-                    )
-                except Player.DoesNotExist:
-                    # Log invalid token for debugging
-                    logger.debug(f"Invalid or expired guest token: {guest_token}")
-                    pass
+        guest_token = request.COOKIES.get('guest_token')
+        if guest_token and not request.user.is_authenticated:
+            claims = read_guest_token(guest_token, check_player=False)
+            if claims is not None:
+                request.guest_claims = claims
+                request.guest_player = SimpleLazyObject(lambda: guest_lookup(claims).get())
+            else:
+                logger.debug("Invalid, expired or revoked guest token")
         return self.get_response(request)
+
+
+class QueryInstrumentationMiddleware:
+    """
+    Opt-in (QUERY_INSTRUMENTATION): query count, SQL time and slowest statement
+    of each request, returned as Server-Timing and logged for a sample of requests.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        stats = QueryStats()
+        with stats.capture():
+            response = self.get_response(request)
+        match = request.resolver_match
+        view = match.view_name if match is not None else None
+        response['Server-Timing'] = stats.server_timing()
+        stats.report(
+            'http', view or request.path,
+            method=request.method,
+            status=response.status_code
+        )
+        return response
+
+
+class RequestMetricsMiddleware:
+    """Request count and latency per resolved view name"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        started = time.perf_counter()
+        response = self.get_response(request)
+        match = request.resolver_match
+        # Unmatched paths share one label so scanners cannot create new series
+        view = match.view_name if match is not None else 'unresolved'
+        HTTP_REQUEST_SECONDS.observe(time.perf_counter() - started, view=view)
+        HTTP_REQUESTS.inc(view=view, method=request.method, status=response.status_code)
+        return response
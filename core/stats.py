@@ -0,0 +1,29 @@
+# stats.py
+import math
+
+
+def percentile(values, p):
+    """Nearest-rank percentile of already sorted values"""
+    if not values:
+        return None
+    rank = max(math.ceil(p / 100 * len(values)), 1)
+    return values[rank - 1]
+
+
+def summarize(values, scale=1000, digits=2):
+    """Count, mean, p50/p95/p99 and max of a sample, seconds reported as milliseconds by default"""
+    values = sorted(values)
+    if not values:
+        return {'count': 0}
+
+    def fmt(value):
+        return round(value * scale, digits)
+
+    return {
+        'count': len(values),
+        'mean': fmt(sum(values) / len(values)),
+        'p50': fmt(percentile(values, 50)),
+        'p95': fmt(percentile(values, 95)),
+        'p99': fmt(percentile(values, 99)),
+        'max': fmt(values[-1]),
+    }
@@ -0,0 +1,43 @@
+# testing.py
+import tempfile
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
+
+# Stands in for the Redis cache of a deployment (CACHE_URL): tokens are only trusted
+# without a query when invalidations are shared between workers
+shared_cache = override_settings(CACHES={
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': tempfile.mkdtemp(prefix='dynequiz-cache-'),
+    },
+})
+
+
+class QueryBudgetMixin:
+    """Assertions that a code path runs a bounded number of queries, whatever the data size"""
+
+    def capture_queries(self, func, *args, **kwargs):
+        with CaptureQueriesContext(connection) as context:
+            result = func(*args, **kwargs)
+        return result, context.captured_queries
+
+    def assertQueryBudget(self, budget, func, grow=None):
+        """
+        Run `func` within `budget` queries. With `grow`, add rows and run it
+        again: the second run must issue exactly as many queries as the first.
+        Returns the result of the last run.
+        """
+        result, queries = self.capture_queries(func)
+        self.assertLessEqual(len(queries), budget, self._format_queries(
+            f"{len(queries)} queries, budget is {budget}", queries
+        ))
+        if grow is not None:
+            grow()
+            result, grown = self.capture_queries(func)
+            self.assertEqual(len(grown), len(queries), self._format_queries(
+                f"Query count grows with data: {len(queries)} -> {len(grown)}", grown
+            ))
+        return result
+
+    def _format_queries(self, message, queries):
+        return '\n'.join([message] + [f"  {query['sql']}" for query in queries])
@@ -0,0 +1,40 @@
+from django.db import DEFAULT_DB_ALIAS
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from organization.models import Organization, OrganizationMembership
+from .tokens import organization_claims
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication that trusts the membership claims of fresh tokens: the
+    user, membership and organization are built from the token without a
+    query. Other user fields are loaded on first access.
+
+    Tokens without claims, with claims older than the user's last membership
+    change, or any token when the cache is not shared between workers, are
+    authenticated against the database as before.
+    """
+
+    def get_user(self, validated_token):
+        claims = organization_claims(validated_token)
+        if claims is None:
+            return super().get_user(validated_token)
+        return principal_from_claims(self.user_model, claims)
+
+
+def principal_from_claims(user_model, claims):
+    """User with only id and is_active loaded, and its membership and organization cached"""
+    user = user_model.from_db(DEFAULT_DB_ALIAS, ['id', 'is_active'], [claims['user_id'], True])
+    membership = None
+    if claims['membership_id'] is not None:
+        membership = OrganizationMembership.from_db(
+            DEFAULT_DB_ALIAS,
+            ['id', 'user_id', 'organization_id', 'role'],
+            [claims['membership_id'], claims['user_id'], claims['org_id'], claims['org_role']]
+        )
+        organization = Organization.from_db(DEFAULT_DB_ALIAS, ['id'], [claims['org_id']])
+        OrganizationMembership.organization.field.set_cached_value(membership, organization)
+        OrganizationMembership.user.field.set_cached_value(membership, user)
+    # A cached None makes user.organizationmembership raise DoesNotExist, like a real lookup
+    user_model.organizationmembership.related.set_cached_value(user, membership)
+    return user
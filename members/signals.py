@@ -0,0 +1,24 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from organization.models import OrganizationMembership
+from .models import User
+from .tokens import mark_claims_stale
+
+
+@receiver([post_save, post_delete], sender=OrganizationMembership)
+def membership_changed(sender, instance, **kwargs):
+    """Tokens carrying the old organization or role must go back to the database"""
+    mark_claims_stale(instance.user_id)
+
+
+@receiver(post_save, sender=User)
+def user_deactivated(sender, instance, **kwargs):
+    # Claims skip the is_active check, so deactivation has to invalidate them
+    if not instance.is_active:
+        mark_claims_stale(instance.id)
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    # Without a membership no cascade marks the claims stale
+    mark_claims_stale(instance.id)
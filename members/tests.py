@@ -1,3 +1,93 @@
-from django.test import TestCase
+from django.core.cache import cache
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import reverse
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.tokens import RefreshToken
+from core.testing import QueryBudgetMixin, shared_cache
+from organization.models import Organization, OrganizationMembership
+from .authentication import ClaimsJWTAuthentication
+from .models import User
+from .tokens import create_jwt_pair_for_user
 
-# Create your tests here.
+
+class LoginQueryBudgetTests(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email='user@example.com', username='user', password='password')
+        OrganizationMembership.objects.create(user=self.user, organization=Organization.objects.create(name='Org'))
+
+    def test_login(self):
+        response = self.assertQueryBudget(
+            3,
+            lambda: self.client.post(
+                reverse('login'), {'email': 'user@example.com', 'password': 'password'},
+                content_type='application/json'
+            )
+        )
+        self.assertEqual(response.status_code, 200)
+
+
+@shared_cache
+class ClaimsAuthenticationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email='user@example.com', username='user', password='password')
+        self.organization = Organization.objects.create(name='Org')
+        self.membership = OrganizationMembership.objects.create(
+            user=self.user, organization=self.organization, role='admin'
+        )
+        # Memberships were just created: forget that, as if the token came later
+        cache.clear()
+
+    def authenticate(self, token):
+        request = RequestFactory().get('/', HTTP_AUTHORIZATION=f"Bearer {token}")
+        return ClaimsJWTAuthentication().authenticate(request)[0]
+
+    def test_fresh_claims_need_no_queries(self):
+        token = create_jwt_pair_for_user(self.user)['access']
+        with self.assertNumQueries(0):
+            user = self.authenticate(token)
+            self.assertEqual(user.pk, self.user.pk)
+            self.assertEqual(user.organizationmembership.role, 'admin')
+            self.assertEqual(user.organizationmembership.organization.pk, self.organization.pk)
+
+    def test_refreshed_access_tokens_keep_the_claims(self):
+        refresh = RefreshToken(create_jwt_pair_for_user(self.user)['refresh'])
+        with self.assertNumQueries(0):
+            self.assertEqual(self.authenticate(str(refresh.access_token)).organizationmembership.role, 'admin')
+
+    def test_user_without_organization(self):
+        self.membership.delete()
+        cache.clear()
+        token = create_jwt_pair_for_user(self.user)['access']
+        with self.assertNumQueries(0):
+            self.assertFalse(hasattr(self.authenticate(token), 'organizationmembership'))
+
+    def test_membership_change_falls_back_to_the_database(self):
+        token = create_jwt_pair_for_user(self.user)['access']
+        self.membership.role = 'member'
+        self.membership.save()
+        user = self.authenticate(token)
+        self.assertEqual(user.organizationmembership.role, 'member')
+
+    def test_deactivated_user_is_rejected(self):
+        token = create_jwt_pair_for_user(self.user)['access']
+        self.user.is_active = False
+        self.user.save()
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate(token)
+
+    def test_deleted_user_is_rejected(self):
+        self.membership.delete()
+        cache.clear()
+        token = create_jwt_pair_for_user(self.user)['access']
+        self.user.delete()
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate(token)
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_per_process_cache_authenticates_against_the_database(self):
+        # Another worker's membership change would not reach this cache
+        token = create_jwt_pair_for_user(self.user)['access']
+        OrganizationMembership.objects.filter(pk=self.membership.pk).update(role='member')
+        with self.assertNumQueries(1):
+            self.assertEqual(self.authenticate(token).pk, self.user.pk)
+        self.assertEqual(self.authenticate(token).organizationmembership.role, 'member')
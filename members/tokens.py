@@ -1,11 +1,32 @@
+import time
+from rest_framework_simplejwt.settings import api_settings
 from rest_framework_simplejwt.tokens import RefreshToken
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from core.cache import cache_is_shared
+from organization.models import OrganizationMembership
 
 User = get_user_model()
 
+# Set on the refresh token, so every access token minted from it carries them too.
+# ORG_CLAIMS_AT is when the membership was read, which can be long before the access
+# token's own iat.
+ORG_CLAIMS_AT = 'org_claims_at'
+STALE_KEY = 'jwt-org-claims-stale:{}'
+
 
 def create_jwt_pair_for_user(user: User):
     refresh = RefreshToken.for_user(user)
+    # Through the relation, so callers serializing the user reuse the cached membership
+    try:
+        membership = user.organizationmembership
+    except OrganizationMembership.DoesNotExist:
+        membership = None
+    refresh[ORG_CLAIMS_AT] = int(time.time())
+    refresh['membership_id'] = membership.id if membership else None
+    refresh['org_id'] = membership.organization_id if membership else None
+    refresh['org_role'] = membership.role if membership else None
 
     tokens = {
         'access': str(refresh.access_token),
@@ -13,3 +34,31 @@ def create_jwt_pair_for_user(user: User):
     }
 
     return tokens
+
+
+def mark_claims_stale(user_id):
+    """Stop trusting the organization claims of tokens issued to a user up to now"""
+    # Rounded up: a token read in the same second may predate the change
+    cache.set(
+        STALE_KEY.format(user_id),
+        int(time.time()) + 1,
+        timeout=int(settings.SIMPLE_JWT['REFRESH_TOKEN_LIFETIME'].total_seconds())
+    )
+
+
+def organization_claims(token):
+    """
+    Membership claims of a token, None if it has none or they predate a membership change.
+    Also None without a shared cache, where another worker's change would not be seen.
+    """
+    if ORG_CLAIMS_AT not in token or not cache_is_shared():
+        return None
+    stale_since = cache.get(STALE_KEY.format(token[api_settings.USER_ID_CLAIM]))
+    if stale_since is not None and token[ORG_CLAIMS_AT] < stale_since:
+        return None
+    return {
+        'user_id': token[api_settings.USER_ID_CLAIM],
+        'membership_id': token['membership_id'],
+        'org_id': token['org_id'],
+        'org_role': token['org_role'],
+    }
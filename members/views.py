@@ -154,7 +154,12 @@ class UserUpdateView(generics.UpdateAPIView):
     http_method_names = ['put']
 
     def get_object(self):
-        return self.request.user
+        user = self.request.user
+        # Users authenticated from token claims only have their id loaded
+        deferred = user.get_deferred_fields()
+        if deferred:
+            user.refresh_from_db(fields=deferred)
+        return user
 
     @swagger_auto_schema(
         operation_summary="Update User Profile",
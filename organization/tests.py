@@ -1,3 +1,58 @@
 from django.test import TestCase
+from django.core.cache import cache
+from django.urls import reverse
+from rest_framework.test import APIClient
+from core.testing import QueryBudgetMixin, shared_cache
+from members.models import User
+from members.tokens import create_jwt_pair_for_user
+from .models import Organization, OrganizationMembership, Invitation
 
-# Create your tests here.
+
+@shared_cache
+class OrganizationQueryBudgetTests(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        self.organization = Organization.objects.create(name='Org')
+        self.admin = self.add_member('admin', role='admin')
+        self.client = APIClient()
+        # Memberships were just created: forget that, as if the token came later
+        cache.clear()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {create_jwt_pair_for_user(self.admin)['access']}")
+
+    def add_member(self, name, role='member'):
+        user = User.objects.create_user(email=f"{name}@example.com", username=name, first_name=name)
+        OrganizationMembership.objects.create(user=user, organization=self.organization, role=role)
+        return user
+
+    def add_members(self, count):
+        start = OrganizationMembership.objects.count()
+        for number in range(start, start + count):
+            self.add_member(f"member{number}")
+
+    def test_member_list(self):
+        self.add_members(2)
+        response = self.assertQueryBudget(
+            1, lambda: self.client.get(reverse('organization-members')), grow=lambda: self.add_members(10)
+        )
+        self.assertEqual(len(response.data), 13)
+
+    def test_recent_members(self):
+        self.add_members(2)
+        response = self.assertQueryBudget(
+            1, lambda: self.client.get(reverse('organization-recent-members')), grow=lambda: self.add_members(10)
+        )
+        self.assertEqual(len(response.data), 10)
+
+    def test_invitation_list(self):
+        def invite(count):
+            for number in range(count):
+                Invitation.objects.create(
+                    email=f"invitee{number}@example.com", organization=self.organization, invited_by=self.admin
+                )
+
+        invite(2)
+        self.assertQueryBudget(1, lambda: self.client.get(reverse('organization-invitations')), grow=lambda: invite(10))
+
+    def test_overview(self):
+        self.assertQueryBudget(
+            3, lambda: self.client.get(reverse('organization-overview')), grow=lambda: self.add_members(10)
+        )
@@ -110,7 +110,7 @@ class OrganizationMemberListView(APIView):
         if not membership or not membership.organization:
             return Response({"detail": "User does not belong to any organization."}, status=400)
         org = membership.organization
-        members = OrganizationMembership.objects.filter(organization=org)
+        members = OrganizationMembership.objects.filter(organization=org).select_related('user')
         data = [
             {
                 "id": m.user.id,
@@ -155,7 +155,7 @@ class OrganizationRecentMembersView(APIView):
         if not membership or not membership.organization:
             return Response({"detail": "User does not belong to any organization."}, status=400)
         org = membership.organization
-        members = OrganizationMembership.objects.filter(organization=org).order_by('-joined_at')[:10]
+        members = OrganizationMembership.objects.filter(organization=org).select_related('user').order_by('-joined_at')[:10]
         data = [
             {
                 "id": m.user.id,
@@ -1,3 +1,43 @@
 from django.test import TestCase
+from django.core.cache import cache
+from django.urls import reverse
+from rest_framework.test import APIClient
+from core.testing import QueryBudgetMixin, shared_cache
+from members.models import User
+from members.tokens import create_jwt_pair_for_user
+from organization.models import Organization, OrganizationMembership
+from .models import Question
 
-# Create your tests here.
+
+@shared_cache
+class QuestionQueryBudgetTests(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        self.organization = Organization.objects.create(name='Org')
+        self.users = []
+        for number in range(3):
+            user = User.objects.create_user(email=f"user{number}@example.com", username=f"user{number}")
+            OrganizationMembership.objects.create(user=user, organization=self.organization)
+            self.users.append(user)
+        self.client = APIClient()
+        # Memberships were just created: forget that, as if the token came later
+        cache.clear()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {create_jwt_pair_for_user(self.users[0])['access']}")
+
+    def add_questions(self, count):
+        Question.objects.bulk_create([
+            Question(
+                text=f"Question {number}", options=['A', 'B'], correct_answer='A',
+                created_by=self.users[number % len(self.users)], organization=self.organization
+            )
+            for number in range(count)
+        ])
+
+    def test_question_list(self):
+        self.add_questions(2)
+        response = self.assertQueryBudget(
+            1,
+            lambda: self.client.get(reverse('question-list-create')),
+            grow=lambda: self.add_questions(20)
+        )
+        self.assertEqual(len(response.data), 22)
+        self.assertIn(response.data[0]['created_by_username'], {user.username for user in self.users})
@@ -40,7 +40,7 @@ class QuestionListCreateView(generics.ListCreateAPIView):
             organization = user.organizationmembership.organization
         except OrganizationMembership.DoesNotExist:
             raise PermissionDenied('You dont belong to any organization') # or raise PermissionDenied()
-        return Question.objects.filter(organization=organization)
+        return Question.objects.filter(organization=organization).select_related('created_by')
 
     def perform_create(self, serializer):
         user = self.request.user
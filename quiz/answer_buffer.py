@@ -0,0 +1,130 @@
+import asyncio
+import json
+import logging
+import os
+import uuid
+from core.instrumentation import database_sync_to_async
+from django.conf import settings
+from .models import Answer
+
+logger = logging.getLogger(__name__)
+
+
+class AnswerBuffer:
+    """
+    Collects the answers of one (game_session, question) in memory.
+
+    Answers are deduplicated per player and written with one bulk_create when
+    the question closes, or earlier once the size or age threshold is reached.
+    Batches that cannot be written are spooled to disk and replayed later.
+    """
+
+    def __init__(self, game_session_id, question_id, max_size=None, max_age=None):
+        self.game_session_id = game_session_id
+        self.question_id = question_id
+        self.max_size = max_size or settings.QUIZ_ANSWER_BUFFER_SIZE
+        self.max_age = max_age or settings.QUIZ_ANSWER_BUFFER_MAX_AGE
+        self.pending = {}
+        self.seen = set()
+        self.closed = False
+        self._timer = None
+        self._flushing = None
+
+    def __len__(self):
+        return len(self.seen)
+
+    def add(self, player_id, selected_option, is_correct, response_time):
+        """Buffer an answer, returns False if the player already answered"""
+        if self.closed or player_id in self.seen:
+            return False
+        self.seen.add(player_id)
+        self.pending[player_id] = {
+            'player_id': player_id,
+            'selected_option': selected_option,
+            'is_correct': is_correct,
+            'response_time': response_time,
+        }
+
+        if len(self.pending) >= self.max_size:
+            self._schedule_flush()
+        elif self._timer is None:
+            loop = asyncio.get_running_loop()
+            self._timer = loop.call_later(self.max_age, self._schedule_flush)
+        return True
+
+    def _schedule_flush(self):
+        if self._flushing is None or self._flushing.done():
+            self._flushing = asyncio.ensure_future(self.flush())
+
+    async def flush(self):
+        """Write everything pending with a single bulk_create"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self.pending:
+            return 0
+        rows, self.pending = list(self.pending.values()), {}
+        return await database_sync_to_async(write_answers)(self.game_session_id, self.question_id, rows)
+
+    async def close(self):
+        """Stop accepting answers and flush the remainder"""
+        self.closed = True
+        if self._flushing is not None:
+            await self._flushing
+        return await self.flush()
+
+
+def write_answers(game_session_id, question_id, rows):
+    """Insert a batch of answers, spooling it to disk if the database write fails"""
+    try:
+        Answer.objects.bulk_create([
+            Answer(game_session_id=game_session_id, question_id=question_id, **row)
+            for row in rows
+        ], ignore_conflicts=True)
+    except Exception:
+        logger.exception(
+            "Answer flush failed for game %s question %s, spooling %d answers",
+            game_session_id, question_id, len(rows)
+        )
+        spool_answers(game_session_id, question_id, rows)
+        return 0
+    return len(rows)
+
+
+def spool_answers(game_session_id, question_id, rows):
+    """Append a failed batch to the spool directory as JSON lines"""
+    spool_dir = settings.QUIZ_ANSWER_SPOOL_DIR
+    os.makedirs(spool_dir, exist_ok=True)
+    path = os.path.join(spool_dir, f"answers-{game_session_id}-{question_id}-{uuid.uuid4().hex}.jsonl")
+    with open(path, 'w') as spool:
+        for row in rows:
+            spool.write(json.dumps(dict(row, game_session_id=game_session_id, question_id=question_id)) + '\n')
+        spool.flush()
+        os.fsync(spool.fileno())
+    return path
+
+
+def replay_spool():
+    """
+    Re-insert spooled batches, removing each file once it has been written.
+    A file that fails is logged and kept, the others are still replayed.
+    """
+    spool_dir = settings.QUIZ_ANSWER_SPOOL_DIR
+    if not os.path.isdir(spool_dir):
+        return 0
+
+    written = 0
+    for name in sorted(os.listdir(spool_dir)):
+        if not name.endswith('.jsonl'):
+            continue
+        path = os.path.join(spool_dir, name)
+        try:
+            with open(path) as spool:
+                rows = [json.loads(line) for line in spool if line.strip()]
+            Answer.objects.bulk_create([Answer(**row) for row in rows], ignore_conflicts=True)
+        except Exception:
+            logger.exception("Replaying spooled answers from %s failed, keeping the file", path)
+            continue
+        os.remove(path)
+        written += len(rows)
+    return written
@@ -0,0 +1,65 @@
+import asyncio
+from django.conf import settings
+
+
+class AnswerStats:
+    """
+    Live answer histogram of the open question, for the host screen.
+
+    Counts are updated in place as answers arrive and pushed to the host
+    group at most once per interval, however many answers come in between.
+    """
+
+    def __init__(self, engine, interval=None):
+        self.engine = engine
+        self.interval = settings.QUIZ_ANSWER_STATS_SECONDS if interval is None else interval
+        self.question_id = None
+        self.counts = []
+        self.correct = 0
+        self.total = 0
+        self._dirty = False
+        self._handle = None
+
+    def reset(self, question):
+        """Start counting for a newly opened question"""
+        self._cancel()
+        self.question_id = question.id
+        self.counts = [0] * len(question.options)
+        self.correct = 0
+        self.total = 0
+        self._dirty = False
+
+    def record(self, option, is_correct):
+        self.counts[option] += 1
+        self.total += 1
+        if is_correct:
+            self.correct += 1
+        self._dirty = True
+        if self._handle is None:
+            loop = asyncio.get_running_loop()
+            self._handle = loop.call_later(self.interval, lambda: asyncio.ensure_future(self.flush()))
+
+    def payload(self):
+        return {
+            'question_id': self.question_id,
+            'counts': list(self.counts),
+            'answer_count': self.total,
+            'correct_rate': self.correct / self.total if self.total else 0,
+            'player_count': len(self.engine.roster),
+        }
+
+    def _cancel(self):
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+
+    async def flush(self):
+        """Push the current counts to the host if anything changed since the last push"""
+        self._cancel()
+        if not self._dirty:
+            return
+        self._dirty = False
+        await self.engine.send(self.engine.host_group_name, {
+            'type': 'answer_stats',
+            'data': self.payload()
+        })
@@ -1,14 +1,47 @@
-import json
+import logging
+from urllib.parse import parse_qs
 from channels.generic.websocket import AsyncWebsocketConsumer
-from channels.db import database_sync_to_async
+from core.instrumentation import database_sync_to_async
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import AnonymousUser
+from django.db.models import Exists, OuterRef
 from rest_framework_simplejwt.tokens import AccessToken
 from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
-from .models import GameSession, Answer, Player
+from .models import GameSession, Answer
+from .engine import get_engine, GameOwnerUnavailable, GameStateError, LOBBY, PERSONALIZED
+from .protocol import negotiate_codec
+from .guest_tokens import read_guest_token, guest_player
+from . import fanout
+from .frames import frame_cache
+from core.cache import TTLCache, cache_is_shared
+from core.metrics import Histogram
+
+logger = logging.getLogger(__name__)
+
+CONNECT_PHASE_SECONDS = Histogram(
+    'dynequiz_ws_connect_phase_seconds',
+    'Time spent in each phase of a websocket connect',
+    ('consumer', 'phase')
+)
+RECEIVE_SECONDS = Histogram(
+    'dynequiz_ws_receive_seconds',
+    'Time to handle one inbound websocket message',
+    ('consumer', 'type')
+)
+
+identity_cache = TTLCache(
+    maxsize=settings.QUIZ_IDENTITY_CACHE_SIZE,
+    ttl=settings.QUIZ_IDENTITY_CACHE_SECONDS
+)
 
 
 class BaseConsumer:
+    # Inbound message types the consumer handles, anything else is timed as 'other'
+    message_types = ()
+    # Which socket of a game this is: lobby, room or spectator
+    kind = None
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.game_pin = None
@@ -18,6 +51,10 @@ class BaseConsumer:
         self.token_subprotocol = None
         self.scope = None
         self.auth_type = None
+        self.engine = None
+        self.codec = None
+        # Not `groups`: channels would also group_discard the socket's own channel from those
+        self.fanout_groups = set()
 
     def initialize_consumer(self, scope):
         """Initialize consumer with scope data"""
@@ -25,134 +62,114 @@ class BaseConsumer:
         self.token_subprotocol = TokenAuthSubprotocol.parse_subprotocol_header(
             scope.get('headers', [])
         )
+        self.codec = negotiate_codec(scope.get('subprotocols'))
         self.game_pin = scope['url_route']['kwargs']['game_pin']
         self.room_group_name = f"quiz_{self.game_pin}"
 
+    def phase(self, name):
+        """Time one phase of connect"""
+        return CONNECT_PHASE_SECONDS.time(consumer=type(self).__name__, phase=name)
+
+    def timed_receive(self, message_type):
+        """Time the handling of one inbound message"""
+        label = message_type if message_type in self.message_types else 'other'
+        return RECEIVE_SECONDS.time(consumer=type(self).__name__, type=label)
+
     def get_scope_user(self):
         """Safe method to get user from scope"""
         return getattr(self.scope, 'user', AnonymousUser())
 
     async def authenticate_connection(self):
-        """Handle authentication based on token subprotocol"""
+        """
+        Handle authentication based on token subprotocol.
+
+        The JWT is checked in CPU only; user, host and player lookups happen in a
+        single database hop and the result is cached per (pin, user). Guests are
+        identified by their signed token (and, without a shared cache, one lookup).
+        """
         token = TokenAuthSubprotocol.extract_token(self.scope)
+        user_id = self._decode_token(token) if token else None
 
-        if token:
-            # Token-based authentication
-            user = await self._authenticate_token(token)
-            if not isinstance(user, AnonymousUser):
-                return await self._handle_authenticated_user(user)
+        # If token is invalid but we're using token subprotocol, reject
+        if user_id is None and token and self.token_subprotocol:
+            return {
+                'success': False,
+                'code': 4003,
+                'reason': 'Invalid authentication token'
+            }
 
-            # If token is invalid but we're using token subprotocol, reject
-            if self.token_subprotocol:
+        if user_id is not None:
+            key = ('user', self.game_pin, user_id)
+        elif self.token_subprotocol:
+            # Only allow guest connections if not using token subprotocol
+            return {
+                'success': False,
+                'code': 4005,
+                'reason': 'Token authentication required'
+            }
+        else:
+            guest_token = self.scope.get('cookies', {}).get('guest_token', '')
+            if cache_is_shared():
+                claims = read_guest_token(guest_token)
+            else:
+                claims = await database_sync_to_async(read_guest_token)(guest_token)
+            if claims is None:
                 return {
                     'success': False,
-                    'code': 4003,
-                    'reason': 'Invalid authentication token'
+                    'code': 4006,
+                    'reason': 'Invalid guest credentials'
                 }
+            return self._apply_identity(
+                {'success': True, 'type': 'guest', 'user': None, 'player': guest_player(claims)}
+            )
 
-        # Fall back to guest authentication if no subprotocol required
-        return await self._handle_guest_connection()
-
-    @database_sync_to_async
-    def _authenticate_token(self, token):
-        """Validate JWT token and return user"""
-        User = get_user_model()
-        try:
-            access_token = AccessToken(token)
-            user_id = access_token.payload.get('user_id')
-            return User.objects.get(id=user_id)
-        except (InvalidToken, TokenError, KeyError, User.DoesNotExist) as e:
-            print(f"Token authentication failed: {str(e)}")
-            return AnonymousUser()
-
-    @database_sync_to_async
-    def _get_user_model(self):
-        from django.contrib.auth import get_user_model
-        return get_user_model()
+        identity = identity_cache.get(key)
+        if identity is None:
+            identity = await self._resolve_identity(*key)
+            if identity['success']:
+                identity_cache.set(key, identity)
+        return self._apply_identity(identity)
 
-    @database_sync_to_async
-    def get_quiz_info(self):
+    @staticmethod
+    def _decode_token(token):
+        """Validate JWT token and return the user id"""
         try:
-            game_session = GameSession.objects.get(pin=self.game_pin)
-            return {
-                'quiz_name': game_session.quiz.name,
-                'quiz_description': game_session.quiz.description,
-                'difficulty': game_session.quiz.difficulty,
-                'total_questions': game_session.quiz.questions.count(),
-                'game_type': game_session.game_type,
-                'is_started': game_session.is_started,
-                'host_username': game_session.host.username,
-                'player_count': game_session.players.count(),
-                'time_limit': game_session.question_time_limit
-
-            }
-        except GameSession.DoesNotExist:
+            return AccessToken(token).payload['user_id']
+        except (InvalidToken, TokenError, KeyError):
             return None
 
-    async def _handle_authenticated_user(self, user):
-        """Process authenticated user (host or player)"""
-        self.scope['user'] = user
-
-        # Check if user is host
-        if await self._is_game_host(user):
-            self.is_host = True
-            self.auth_type = 'host'
-            return {'success': True, 'type': 'host'}
-
-        # Check if user is registered player
-        if await self._is_registered_player(user):
-            self.auth_type = 'player'
-            return {'success': True, 'type': 'player'}
-
+    @database_sync_to_async
+    def _resolve_identity(self, kind, game_pin, user_id):
+        """Load user, host flag and player profile in one unit of work"""
+        User = get_user_model()
+        user = (
+            User.objects
+            .select_related('player_profile')
+            .annotate(is_game_host=Exists(GameSession.objects.filter(pin=game_pin, host=OuterRef('pk'))))
+            .filter(id=user_id)
+            .first()
+        )
+        if user is not None:
+            if user.is_game_host:
+                return {'success': True, 'type': 'host', 'user': user, 'player': None}
+            player = getattr(user, 'player_profile', None)
+            if player is not None:
+                return {'success': True, 'type': 'player', 'user': user, 'player': player}
         return {
             'success': False,
             'code': 4004,
             'reason': 'Not a host or registered player'
         }
 
-    @database_sync_to_async
-    def _is_game_host(self, user):
-        """Check if user is host of this game"""
-        return GameSession.objects.filter(pin=self.game_pin, host=user).exists()
-
-    @database_sync_to_async
-    def _is_registered_player(self, user):
-        """Check if user has player profile"""
-        try:
-            self.player = user.player_profile
-            return True
-        except AttributeError:
-            return False
-
-    async def _handle_guest_connection(self):
-        """Handle guest player connection"""
-        # Only allow guest connections if not using token subprotocol
-        if self.token_subprotocol:
-            return {
-                'success': False,
-                'code': 4005,
-                'reason': 'Token authentication required'
-            }
-
-        guest_token = self.scope['cookies'].get('guest_token')
-        if guest_token and await self._validate_guest_token(guest_token):
-            self.auth_type = 'guest'
-            return {'success': True, 'type': 'guest'}
-
-        return {
-            'success': False,
-            'code': 4006,
-            'reason': 'Invalid guest credentials'
-        }
-
-    @database_sync_to_async
-    def _validate_guest_token(self, guest_token):
-        """Validate guest token and set player"""
-        try:
-            self.player = Player.objects.get(guest_id=guest_token, is_guest=True)
-            return True
-        except Player.DoesNotExist:
-            return False
+    def _apply_identity(self, identity):
+        if not identity['success']:
+            return {key: identity[key] for key in ('success', 'code', 'reason')}
+        if identity['user'] is not None:
+            self.scope['user'] = identity['user']
+        self.player = identity['player']
+        self.is_host = identity['type'] == 'host'
+        self.auth_type = identity['type']
+        return {'success': True, 'type': identity['type']}
 
     @database_sync_to_async
     def get_game_session(self):
@@ -162,6 +179,90 @@ class BaseConsumer:
         except GameSession.DoesNotExist:
             return None
 
+    async def accept_connection(self):
+        """Accept with the negotiated protocol, falling back to token-auth if requested"""
+        subprotocol = self.codec.subprotocol or self.token_subprotocol
+        if subprotocol:
+            await self.accept(subprotocol=subprotocol)
+        else:
+            await self.accept()
+
+    async def load_engine(self):
+        """
+        Get the game's engine and keep it loaded while this socket is open. It
+        is a RemoteEngine when another worker runs the game.
+        """
+        self.engine = await get_engine(self.game_pin)
+        if self.engine is not None:
+            self.engine.attach(self)
+        return self.engine
+
+    def release_engine(self):
+        """Let the engine unload once its last socket is gone"""
+        if self.engine is not None:
+            self.engine.detach(self)
+
+    async def join_group(self, name):
+        """Receive a group's broadcasts through this worker's shared subscription"""
+        self.fanout_groups.add(name)
+        await fanout.join(name, self)
+
+    async def leave_groups(self):
+        for name in self.fanout_groups:
+            await fanout.leave(name, self)
+        self.fanout_groups.clear()
+
+    async def send_message(self, message):
+        """Encode a message with the codec negotiated for this socket"""
+        await self.send_frame(self.codec.encode(message))
+
+    async def send_frame(self, frame):
+        """Send an already encoded message"""
+        if self.codec.binary:
+            await self.send(bytes_data=frame)
+        else:
+            await self.send(text_data=frame)
+
+    def decode_message(self, text_data=None, bytes_data=None):
+        return self.codec.decode(text_data, bytes_data)
+
+    def get_last_seq(self):
+        """Sequence number a reconnecting client last saw (?last_seq=N), if any"""
+        query = parse_qs(self.scope.get('query_string', b'').decode())
+        try:
+            return int(query['last_seq'][0])
+        except (KeyError, ValueError):
+            return None
+
+    async def send_greeting(self, group, messages):
+        """Send the first messages from the engine: the events a reconnect missed, or the current state"""
+        for message in messages:
+            personal = await self.personalize(message)
+            if personal is message:
+                await self.send_frame(frame_cache.encode(group, message, self.codec))
+            else:
+                await self.send_message(personal)
+
+    async def personalize(self, message):
+        """Hook for adding per-socket data to a broadcast message"""
+        return message
+
+    async def game_event(self, event):
+        await self.send_message(await self.personalize(event['message']))
+
+    async def handle_end_game(self, data):
+        """Only host can end the game, from the lobby or while it runs"""
+        if not self.is_host:
+            await self.send_error("Only host can end the game")
+            return
+        await self.engine.end()
+
+    async def send_error(self, message):
+        await self.send_message({
+            'type': 'error',
+            'message': message
+        })
+
     @database_sync_to_async
     def get_players_list(self):
         """Get list of players in the lobby"""
@@ -209,79 +310,83 @@ class TokenAuthSubprotocol:
 
 
 class GameSessionConsumer(BaseConsumer, AsyncWebsocketConsumer):
+    message_types = ('start_game', 'end_game')
+    kind = 'lobby'
+
     async def connect(self):
 
         self.initialize_consumer(self.scope)
 
         try:
             # Authenticate connection based on subprotocol
-            auth_result = await self.authenticate_connection()
+            with self.phase('auth'):
+                auth_result = await self.authenticate_connection()
             if not auth_result['success']:
                 await self.close(code=auth_result.get('code', 4001))
                 return
 
             # Accept connection with appropriate subprotocol if supported
-            if self.token_subprotocol:
-                await self.accept(subprotocol='token-auth')
-            else:
-                await self.accept()
-
-            quiz_info = await self.get_quiz_info()
-            if quiz_info:
-                await self.send(text_data=json.dumps({
-                    'type': 'quiz_info',
-                    'data': quiz_info
-                }))
-            else:
-                await self.send(text_data=json.dumps({
+            with self.phase('accept'):
+                await self.accept_connection()
+
+            with self.phase('quiz_info'):
+                await self.load_engine()
+            if self.engine is None:
+                await self.send_message({
                     'type': 'error',
                     'message': 'Game session not found'
-                }))
+                })
                 await self.close(code=4007)
                 return
             # Join room group
-            await self.channel_layer.group_add(
-                self.room_group_name,
-                self.channel_name
-            )
-
-            # Notify room if player joined
-            if self.player and not self.is_host:
-                await self.notify_player_joined()
-
-        except Exception as e:
-            print(f"Connection error: {str(e)}")
+            with self.phase('group_add'):
+                await self.join_group(self.room_group_name)
+
+            # Reconnects only get what they missed, late joiners get the whole roster
+            with self.phase('initial_state'):
+                if self.player and not self.is_host:
+                    greeting = await self.engine.join_lobby(
+                        self.player.id, self.player.username, self.auth_type, self.get_last_seq()
+                    )
+                else:
+                    greeting = await self.engine.join_lobby(last_seq=self.get_last_seq())
+                await self.send_greeting(self.room_group_name, greeting)
+
+        except GameOwnerUnavailable:
+            # Service restart: the client reconnects to wherever the game runs now
+            await self.close(code=1012)
+        except Exception:
+            logger.exception("Lobby connection to game %s failed", self.game_pin)
             await self.close(code=4002)
 
 
-    async def notify_player_joined(self):
-        """Notify room when new player joins"""
-        await self.channel_layer.group_send(
-            self.room_group_name,
-            {
-                'type': 'player_joined',
-                'player_id': self.player.id,
-                'username': self.player.username,
-                'auth_type': self.auth_type
-            }
-        )
-
-    # Rest of your existing methods remain largely the same
-    # (disconnect, receive, handle_* methods, etc.)
-    # Just ensure they use self.is_host and self.player appropriately
+    async def disconnect(self, close_code):
+        await self.leave_groups()
+        if self.engine and self.player and not self.is_host:
+            try:
+                await self.engine.leave_lobby(self.player.id)
+            except GameOwnerUnavailable:
+                # Whoever runs the game now never saw this socket
+                pass
+        self.release_engine()
 
     async def receive(self, text_data=None, bytes_data=None):
         try:
-            data = json.loads(text_data)
-            message_type = data.get('type')
+            data = self.decode_message(text_data, bytes_data)
+        except ValueError:
+            await self.send_error('Invalid message format')
+            return
 
-            if message_type == 'start_game':
-                await self.handle_start_game(data)
+        message_type = data.get('type')
+        with self.timed_receive(message_type):
+            try:
+                if message_type == 'start_game':
+                    await self.handle_start_game(data)
+                elif message_type == 'end_game':
+                    await self.handle_end_game(data)
 
-        except json.JSONDecodeError:
-            await self.send_error('Invalid JSON format')
-        except Exception as e:
-            await self.send_error(str(e))
+            except Exception as e:
+                await self.send_error(str(e))
 
     async def handle_start_game(self, data):
         """Only host can start the game"""
@@ -289,31 +394,143 @@ class GameSessionConsumer(BaseConsumer, AsyncWebsocketConsumer):
             await self.send_error("Only host can start game")
             return
 
-        game = await self.get_game_session()
-        await database_sync_to_async(game.start_quiz)()
-        await self.channel_layer.group_send(
-            self.room_group_name,
-            {
-                'type': 'game_started',
-                'redirect_url': f'/game/{self.game_pin}/play'
-            }
-        )
-
-    async def send_error(self, message):
-        await self.send(text_data=json.dumps({
-            'type': 'error',
-            'message': message
-        }))
+        try:
+            await self.engine.start()
+        except GameStateError as e:
+            await self.send_error(str(e))
 
 
 class GameRoomConsumer(BaseConsumer, AsyncWebsocketConsumer):
+    message_types = ('submit_answer', 'next', 'end_game')
+    kind = 'room'
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.game_room_name = None
 
     async def connect(self):
-        self.game_pin = self.scope['url_route']['kwargs']['game_pin']
+        self.initialize_consumer(self.scope)
         self.game_room_name = f"game_{self.game_pin}"
 
-        # verify that the game has started
-        # game = await self.ge
+        try:
+            with self.phase('auth'):
+                auth_result = await self.authenticate_connection()
+            if not auth_result['success']:
+                await self.close(code=auth_result.get('code', 4001))
+                return
+
+            # verify that the game has started
+            with self.phase('quiz_info'):
+                await self.load_engine()
+            if self.engine is None:
+                await self.close(code=4007)
+                return
+            if await self.engine.current_state() == LOBBY:
+                self.release_engine()
+                await self.close(code=4008)
+                return
+
+            with self.phase('accept'):
+                await self.accept_connection()
+
+            with self.phase('group_add'):
+                await self.join_group(self.game_room_name)
+                if self.is_host:
+                    # Live answer counts only go to host sockets
+                    await self.join_group(self.engine.host_group_name)
+            with self.phase('initial_state'):
+                player_id = self.player.id if self.player and not self.is_host else None
+                greeting = await self.engine.join_room(player_id, self.is_host, self.get_last_seq())
+                await self.send_greeting(self.game_room_name, greeting)
+
+        except GameOwnerUnavailable:
+            # Service restart: the client reconnects to wherever the game runs now
+            await self.close(code=1012)
+        except Exception:
+            logger.exception("Game room connection to game %s failed", self.game_pin)
+            await self.close(code=4002)
+
+    async def disconnect(self, close_code):
+        await self.leave_groups()
+        self.release_engine()
+
+    async def receive(self, text_data=None, bytes_data=None):
+        try:
+            data = self.decode_message(text_data, bytes_data)
+        except ValueError:
+            await self.send_error('Invalid message format')
+            return
+
+        message_type = data.get('type')
+        with self.timed_receive(message_type):
+            try:
+                if message_type == 'submit_answer':
+                    await self.handle_submit_answer(data)
+                elif message_type == 'next':
+                    await self.handle_next(data)
+                elif message_type == 'end_game':
+                    await self.handle_end_game(data)
+
+            except Exception as e:
+                await self.send_error(str(e))
+
+    async def handle_submit_answer(self, data):
+        """Answers are recorded in memory and persisted when the round closes"""
+        if self.is_host or not self.player:
+            await self.send_error("Only players can answer")
+            return
+        result = await self.engine.answer(self.player.id, data.get('option'))
+        await self.send_message({
+            'type': 'answer_received',
+            'data': result
+        })
+
+    async def handle_next(self, data):
+        """Only host can move the game forward"""
+        if not self.is_host:
+            await self.send_error("Only host can control the game")
+            return
+        await self.engine.advance()
+
+    async def personalize(self, message):
+        # Broadcasts only carry the top of the leaderboard, each socket adds its own standing
+        if message['type'] in PERSONALIZED and self.player and not self.is_host:
+            standing = await self.engine.standing(self.player.id, message.get('seq'))
+            message = dict(message, data=dict(message['data'], me=standing))
+        return message
+
+
+class SpectatorConsumer(BaseConsumer, AsyncWebsocketConsumer):
+    """Read-only big-screen view: no authentication, no player registration"""
+    kind = 'spectator'
+
+    async def connect(self):
+        self.initialize_consumer(self.scope)
+
+        try:
+            with self.phase('quiz_info'):
+                await self.load_engine()
+            if self.engine is None:
+                await self.close(code=4007)
+                return
+
+            with self.phase('accept'):
+                await self.accept_connection()
+            with self.phase('group_add'):
+                await self.join_group(self.engine.spectator_group_name)
+            with self.phase('initial_state'):
+                await self.send_message(await self.engine.join_spectators())
+
+        except GameOwnerUnavailable:
+            # Service restart: the client reconnects to wherever the game runs now
+            await self.close(code=1012)
+        except Exception:
+            logger.exception("Spectator connection to game %s failed", self.game_pin)
+            await self.close(code=4002)
+
+    async def disconnect(self, close_code):
+        await self.leave_groups()
+        self.release_engine()
+
+    async def receive(self, text_data=None, bytes_data=None):
+        await self.send_error("Spectators cannot send messages")
@@ -0,0 +1,952 @@
+import asyncio
+import logging
+import uuid
+from core.channel_layers import acquire_lease, release_lease
+from core.instrumentation import database_sync_to_async
+from channels.exceptions import ChannelFull
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+from core.metrics import REGISTRY, Gauge, Histogram
+from .answer_buffer import AnswerBuffer
+from .answer_stats import AnswerStats
+from .game_logic import SCORED_GAME_TYPES, score_round_async
+from .leaderboard import Leaderboard
+from .lobby import Lobby
+from .replay import EventLog
+from .frames import frame_cache
+from .scheduler import scheduler
+from .snapshot import build_snapshot, get_snapshot, set_snapshot, drop_snapshot
+from .spectate import SpectatorFeed
+from .models import GameSession, Player
+
+LOBBY = 'lobby'
+QUESTION = 'question'
+REVEAL = 'reveal'
+LEADERBOARD = 'leaderboard'
+ENDED = 'ended'
+
+LEADERBOARD_SIZE = 10
+
+# Room broadcasts each socket adds its player's own standing to
+PERSONALIZED = ('leaderboard', 'game_ended')
+
+# What sockets on other workers may run on a game's engine, through a RemoteEngine
+REMOTE_COMMANDS = (
+    'current_state', 'join_lobby', 'leave_lobby', 'join_room', 'join_spectators',
+    'start', 'advance', 'end', 'answer', 'standing', 'report',
+)
+
+logger = logging.getLogger(__name__)
+
+GROUP_SEND_SECONDS = Histogram(
+    'dynequiz_group_send_seconds',
+    'Time to hand one broadcast to the channel layer',
+    ('group',)
+)
+
+TRANSITIONS = {
+    LOBBY: {QUESTION, ENDED},
+    QUESTION: {REVEAL, ENDED},
+    REVEAL: {LEADERBOARD, ENDED},
+    LEADERBOARD: {QUESTION, ENDED},
+    ENDED: set(),
+}
+
+
+class GameStateError(Exception):
+    """Raised when an action is not allowed in the current game state"""
+
+
+class GameOwnerUnavailable(Exception):
+    """Raised when the worker running a game's engine stopped answering"""
+
+
+class GameEngine:
+    """
+    Authoritative in-memory state for one game session.
+
+    Answers and scores live here while a round is running; the ORM is only
+    touched when the game is loaded and at round boundaries.
+    """
+
+    def __init__(self, pin):
+        self.pin = pin
+        self.room_group_name = f"game_{pin}"
+        self.lobby_group_name = f"quiz_{pin}"
+        self.host_group_name = f"host_{pin}"
+        self.spectator_group_name = f"spectate_{pin}"
+        self.state = LOBBY
+        self.game_session_id = None
+        self.game_type = 'classic'
+        self.quiz = None
+        self.time_limit = 30
+        self.question_index = -1
+        self.question_started_at = None
+        self.question_opened = None
+        self.deadline = None
+        self.roster = {}
+        self.leaderboard = Leaderboard()
+        self.answers = {}
+        self.answer_buffer = None
+        self.answer_stats = AnswerStats(self)
+        self.lobby = Lobby(self)
+        self.spectators = SpectatorFeed(self)
+        self.events = EventLog(settings.QUIZ_REPLAY_BUFFER_SIZE)
+        self.lock = asyncio.Lock()
+        self.sockets = set()
+        # Sockets other workers host for the game, by the channel of their RemoteEngine
+        self.remotes = {}
+        self._idle = None
+        self.lease_name = f"engine_{pin}"
+        self.channel = None
+        self._layer = None
+        self._tasks = []
+
+    # ---- loading and persistence (round boundaries only) ----
+
+    async def load(self):
+        """Load session, questions and roster in a single database hop"""
+        data = await database_sync_to_async(_load_game)(self.pin)
+        if data is None:
+            return False
+        self.game_session_id = data['id']
+        self.game_type = data['game_type']
+        self.quiz = data['quiz']
+        self.time_limit = data['time_limit']
+        self.roster = data['roster']
+        for player_id, score in data['scores'].items():
+            self.leaderboard.add(player_id, score)
+        if data['is_ended']:
+            self.state = ENDED
+        elif data['is_started']:
+            # Resumed after a restart: the interrupted round is treated as closed
+            self.state = LEADERBOARD
+            if data['current_question_id'] in self.quiz.by_id:
+                self.question_index = self.quiz.question_order.index(data['current_question_id'])
+        return True
+
+    @database_sync_to_async
+    def _persist_start(self):
+        """
+        Store the start of the game with the questions it is played with,
+        returns that snapshot and the roster ids that no longer exist
+        """
+        with transaction.atomic():
+            game = GameSession.objects.select_related('quiz', 'host').get(id=self.game_session_id)
+            # Read the questions again: the lobby's snapshot may predate edits to the quiz
+            quiz = build_snapshot(game)
+            if not quiz.questions:
+                raise GameStateError("Quiz has no questions")
+            # Guests are identified by signed tokens, so a deleted player can still be on the roster
+            existing = set(Player.objects.filter(id__in=self.roster.keys()).values_list('id', flat=True))
+            if existing:
+                game.players.add(*existing)
+                Player.objects.filter(id__in=existing).update(current_game=game, score=0)
+            game.question_order = quiz.question_order
+            game.question_snapshot = [question.row() for question in quiz.questions]
+            game.save(update_fields=['question_order', 'question_snapshot'])
+            game.start_quiz()
+        return build_snapshot(game), self.roster.keys() - existing
+
+    @database_sync_to_async
+    def _persist_question(self, question_id, started_at):
+        GameSession.objects.filter(id=self.game_session_id).update(
+            current_question_id=question_id,
+            current_question_start_time=started_at
+        )
+
+    @database_sync_to_async
+    def _persist_scores(self, scores):
+        players = [Player(id=player_id, score=score) for player_id, score in scores.items()]
+        Player.objects.bulk_update(players, ['score'])
+
+    @database_sync_to_async
+    def _persist_end(self):
+        game = GameSession.objects.get(id=self.game_session_id)
+        game.end_time = timezone.now()
+        game.is_active = False
+        game.save(update_fields=['end_time', 'is_active'])
+        game.stop_quiz()
+
+    # ---- sockets ----
+
+    def attach(self, consumer):
+        """Keep the engine loaded while a socket uses it"""
+        self.sockets.add(consumer)
+        self._sockets_changed()
+
+    def detach(self, consumer):
+        """Forget a socket, the engine is unloaded once none is left for QUIZ_ENGINE_IDLE_SECONDS"""
+        self.sockets.discard(consumer)
+        self._sockets_changed()
+
+    def _sockets_changed(self):
+        if self.sockets or self.remotes:
+            if self._idle is not None:
+                self._idle.cancel()
+                self._idle = None
+        elif self._idle is None and _engines.get(self.pin) is self:
+            loop = asyncio.get_running_loop()
+            self._idle = loop.call_later(settings.QUIZ_ENGINE_IDLE_SECONDS, lambda: asyncio.ensure_future(self.unload()))
+
+    async def unload(self):
+        """
+        Drop an idle engine from this process. A running game is picked up
+        from the database by the next socket, like after a restart, so an open
+        round is scored first.
+        """
+        async with self.lock:
+            self._idle = None
+            if self.sockets or self.remotes or _engines.get(self.pin) is not self:
+                return
+            if self.state == QUESTION:
+                await self._close_question()
+            scheduler.cancel(self.pin)
+            drop_engine(self.pin)
+            if self.answer_buffer is not None and not self.answer_buffer.closed:
+                await self.answer_buffer.close()
+
+    # ---- ownership: one engine per game over all workers ----
+
+    async def claim(self, channel_layer):
+        """Try to take the game's lease, returns the command channel of the engine holding it"""
+        self._layer = channel_layer
+        self.channel = await channel_layer.new_channel()
+        return await acquire_lease(channel_layer, self.lease_name, settings.QUIZ_ENGINE_LEASE_SECONDS, self.channel)
+
+    def serve(self):
+        """Keep the lease and run the commands of sockets on other workers while loaded"""
+        self._tasks = [asyncio.ensure_future(self._renew_lease()), asyncio.ensure_future(self._serve())]
+
+    def release(self):
+        """Stop serving the game and hand its lease back, so another worker can load it"""
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # No loop to hand it back from: the lease expires on its own
+            loop = None
+        current = asyncio.current_task() if loop is not None else None
+        for task in self._tasks:
+            if task is not current:
+                task.cancel()
+        self._tasks = []
+        if loop is not None and self.channel is not None:
+            asyncio.ensure_future(release_lease(self._layer, self.lease_name, self.channel))
+
+    async def _renew_lease(self):
+        ttl = settings.QUIZ_ENGINE_LEASE_SECONDS
+        while True:
+            await asyncio.sleep(ttl / 3)
+            try:
+                holder = await acquire_lease(self._layer, self.lease_name, ttl, self.channel)
+            except Exception:
+                logger.exception("Renewing the lease of game %s failed", self.pin)
+                continue
+            if holder != self.channel:
+                logger.error("Game %s is run by another worker now, unloading it here", self.pin)
+                await self.abandon()
+                return
+
+    async def abandon(self):
+        """Drop an engine whose lease was lost, its sockets reconnect to the new owner"""
+        scheduler.cancel(self.pin)
+        if _engines.get(self.pin) is self:
+            drop_engine(self.pin)
+        for consumer in list(self.sockets):
+            # Service restart: the client reconnects
+            await consumer.close(code=1012)
+        if self.answer_buffer is not None and not self.answer_buffer.closed:
+            await self.answer_buffer.close()
+
+    async def _serve(self):
+        while True:
+            try:
+                request = await self._layer.receive(self.channel)
+            except Exception:
+                logger.exception("Receiving commands for game %s failed", self.pin)
+                await asyncio.sleep(1)
+                continue
+            asyncio.ensure_future(self._run_command(request))
+
+    async def _run_command(self, request):
+        """Run a command sent by a RemoteEngine and send it the result"""
+        reply = {'type': 'engine.reply', 'id': request['id']}
+        try:
+            if request['command'] not in REMOTE_COMMANDS:
+                raise GameStateError(f"Unknown command {request['command']}")
+            reply['result'] = await getattr(self, request['command'])(**request['kwargs'])
+        except (GameStateError, ValueError) as e:
+            reply['error'] = [type(e).__name__, str(e)]
+        except Exception:
+            logger.exception("Command %s for game %s failed", request['command'], self.pin)
+            reply['error'] = ['GameStateError', "Command failed"]
+        try:
+            await self._layer.send(request['reply_to'], reply)
+        except Exception:
+            logger.exception("Replying to a command for game %s failed", self.pin)
+
+    # ---- socket commands, run here or sent by sockets on other workers ----
+
+    async def current_state(self):
+        return self.state
+
+    async def join_lobby(self, player_id=None, username=None, auth_type=None, last_seq=None):
+        """Register a lobby socket, returns its first messages: what it missed or the whole lobby"""
+        if player_id is not None:
+            self.lobby.connect(player_id, username, auth_type)
+        missed = self.events.since(last_seq, self.lobby_group_name) if last_seq is not None else None
+        if missed is not None:
+            return missed
+        return [
+            {'type': 'quiz_info', 'data': self.quiz_info()},
+            {'type': 'lobby_snapshot', 'data': self.lobby.snapshot()},
+        ]
+
+    async def leave_lobby(self, player_id):
+        self.lobby.disconnect(player_id)
+
+    async def join_room(self, player_id=None, is_host=False, last_seq=None):
+        """First messages of a game room socket: what it missed or the whole game state"""
+        missed = self.events.since(last_seq, self.room_group_name) if last_seq is not None else None
+        if missed is not None:
+            return missed
+        state = self.snapshot()
+        if player_id is not None:
+            state['me'] = self.player_standing(player_id)
+        if is_host and self.state == QUESTION:
+            state['answer_stats'] = self.answer_stats.payload()
+        return [{'type': 'game_state', 'data': state}]
+
+    async def join_spectators(self):
+        return self.spectators.message()
+
+    async def answer(self, player_id, option):
+        return self.submit_answer(player_id, option)
+
+    async def standing(self, player_id, seq=None):
+        """Standing of a player to add to a personalized broadcast"""
+        return self.player_standing(player_id)
+
+    async def report(self, worker, sockets, players, spectators):
+        """Sockets another worker hosts for this game, sent by its RemoteEngine"""
+        if sockets:
+            self.remotes[worker] = {'players': set(players), 'spectators': spectators}
+        else:
+            self.remotes.pop(worker, None)
+        self._sockets_changed()
+
+    # ---- state machine ----
+
+    def _transition(self, new_state):
+        if new_state not in TRANSITIONS[self.state]:
+            raise GameStateError(f"Cannot move from {self.state} to {new_state}")
+        self.state = new_state
+
+    def add_player(self, player_id, username):
+        """
+        Add a player to the in-memory roster, returns False if already present
+        or too late: the roster is stored when the game starts
+        """
+        if self.state != LOBBY or player_id in self.roster:
+            return False
+        self.roster[player_id] = username
+        self.leaderboard.add(player_id)
+        return True
+
+    def remove_player(self, player_id):
+        """Remove a player from the roster, only possible while in the lobby"""
+        if self.state != LOBBY:
+            return False
+        self.roster.pop(player_id, None)
+        self.leaderboard.remove(player_id)
+        return True
+
+    async def start(self):
+        """Leave the lobby and open the first question"""
+        async with self.lock:
+            if self.state != LOBBY:
+                raise GameStateError("Game has already started")
+            if not self.quiz.questions:
+                raise GameStateError("Quiz has no questions")
+            if self.game_type not in SCORED_GAME_TYPES:
+                # Refused up front rather than failing when the first round is scored
+                raise GameStateError(f"{self.game_type.capitalize()} games are not supported yet")
+            self.quiz, missing = await self._persist_start()
+            set_snapshot(self.pin, self.quiz)
+            for player_id in missing:
+                self.roster.pop(player_id, None)
+                self.leaderboard.remove(player_id)
+                self.lobby.joined.pop(player_id, None)
+            await self.lobby.flush()
+            await self.broadcast({
+                'type': 'game_started',
+                'redirect_url': f'/game/{self.pin}/play'
+            }, self.lobby_group_name)
+            await self._open_question(0)
+
+    async def advance(self, from_state=None, from_index=None):
+        """
+        Move to the next state: close round, show leaderboard or open next question.
+        With `from_state`/`from_index` nothing happens if the game already moved on.
+        """
+        async with self.lock:
+            if from_state is not None and (self.state, self.question_index) != (from_state, from_index):
+                return
+            if self.state == QUESTION:
+                await self._close_question()
+            elif self.state == REVEAL:
+                self._transition(LEADERBOARD)
+                self._arm_timer(settings.QUIZ_LEADERBOARD_SECONDS)
+                await self.broadcast({'type': 'leaderboard', 'data': self.leaderboard_payload()})
+            elif self.state == LEADERBOARD:
+                if self.question_index + 1 < self.quiz.total_questions:
+                    await self._open_question(self.question_index + 1)
+                else:
+                    await self._end()
+            else:
+                raise GameStateError(f"Cannot advance a game in {self.state} state")
+
+    async def end(self):
+        """Stop the game from any state"""
+        async with self.lock:
+            if self.state != ENDED:
+                await self._end()
+
+    async def _open_question(self, index):
+        self._transition(QUESTION)
+        loop = asyncio.get_running_loop()
+        self.question_index = index
+        self.answers = {}
+        self.answer_buffer = AnswerBuffer(self.game_session_id, self.current_question_id)
+        self.answer_stats.reset(self.current_question)
+        self.question_started_at = timezone.now()
+        self.question_opened = loop.time()
+        self.deadline = self.question_opened + self.time_limit
+        scheduler.schedule(self.pin, self.deadline, self._timer_callback())
+        await self._persist_question(self.current_question_id, self.question_started_at)
+        await self.broadcast({'type': 'question_started', 'data': self.question_payload()})
+
+    async def _close_question(self):
+        self._transition(REVEAL)
+        self.deadline = None
+        self._arm_timer(settings.QUIZ_REVEAL_SECONDS)
+        player_ids = list(self.answers)
+        deltas = await score_round_async(
+            self.game_type,
+            [self.answers[player_id]['is_correct'] for player_id in player_ids],
+            [self.answers[player_id]['response_time'] for player_id in player_ids],
+            max_time=self.time_limit
+        )
+        changed = self.leaderboard.apply(dict(zip(player_ids, deltas)))
+        await self.answer_stats.flush()
+        await self.answer_buffer.close()
+        await self._persist_scores(changed)
+        await self.broadcast({
+            'type': 'question_ended',
+            'data': {
+                'question_id': self.current_question_id,
+                'correct_answer': self.current_question.correct_answer,
+                'correct_option': self.current_question.correct_index,
+                'answer_count': len(self.answers),
+            }
+        })
+
+    async def _end(self):
+        ended_in_lobby = self.state == LOBBY
+        self._transition(ENDED)
+        self.deadline = None
+        scheduler.cancel(self.pin)
+        if self.answer_buffer is not None and not self.answer_buffer.closed:
+            await self.answer_buffer.close()
+        await self._persist_end()
+        # A game cancelled before it started still has its players in the lobby
+        await self.broadcast(
+            {'type': 'game_ended', 'data': self.leaderboard_payload()},
+            self.lobby_group_name if ended_in_lobby else self.room_group_name
+        )
+        drop_engine(self.pin)
+
+    def _timer_callback(self):
+        """Advance when the deadline fires, unless the host already moved on"""
+        state, index = self.state, self.question_index
+
+        async def on_deadline():
+            await self.advance(state, index)
+        return on_deadline
+
+    def _arm_timer(self, seconds):
+        if seconds:
+            scheduler.schedule_in(self.pin, seconds, self._timer_callback())
+        else:
+            scheduler.cancel(self.pin)
+
+    # ---- in-memory hot path ----
+
+    def submit_answer(self, player_id, option):
+        """Record the option index a player picked, without touching the database"""
+        if self.state != QUESTION:
+            raise GameStateError("No question is open")
+        if player_id not in self.roster:
+            raise GameStateError("Player is not part of this game")
+        question = self.current_question
+        if type(option) is not int or not 0 <= option < len(question.options):
+            raise ValueError("Answer must be the index of one of the options")
+
+        response_time = asyncio.get_running_loop().time() - self.question_opened
+        if response_time > self.time_limit:
+            raise GameStateError("Time is up")
+
+        is_correct = question.is_correct(option)
+        if not self.answer_buffer.add(player_id, option, is_correct, response_time):
+            raise GameStateError("Answer already submitted")
+
+        self.answers[player_id] = {
+            'is_correct': is_correct,
+            'response_time': response_time,
+        }
+        self.answer_stats.record(option, is_correct)
+        self.spectators.touch()
+        return {'question_id': question.id, 'accepted': True}
+
+    @property
+    def current_question_id(self):
+        question = self.current_question
+        return question.id if question is not None else None
+
+    @property
+    def current_question(self):
+        return self.quiz.question(self.question_index)
+
+    def time_remaining(self):
+        if self.state != QUESTION or self.deadline is None:
+            return 0
+        return max(self.deadline - asyncio.get_running_loop().time(), 0)
+
+    def question_payload(self):
+        """Current question without the answer key"""
+        question = self.current_question
+        return {
+            'question_id': question.id,
+            'index': self.question_index,
+            'total_questions': self.quiz.total_questions,
+            **question.public(),
+            'time_limit': self.time_limit,
+            'time_remaining': self.time_remaining(),
+            'ends_at': self.question_started_at.timestamp() + self.time_limit,
+        }
+
+    def _standing(self, player_id, score):
+        return {
+            'player_id': player_id,
+            'username': self.roster.get(player_id),
+            'score': score,
+            'rank': self.leaderboard.rank(player_id),
+        }
+
+    def leaderboard_payload(self, limit=LEADERBOARD_SIZE):
+        """Top of the leaderboard, broadcast to everyone instead of the full ranking"""
+        return {
+            'leaderboard': [self._standing(player_id, score) for player_id, score in self.leaderboard.top(limit)],
+            'player_count': len(self.leaderboard),
+        }
+
+    def player_standing(self, player_id, radius=2):
+        """Rank, score and direct neighbours of a single player"""
+        if player_id not in self.leaderboard:
+            return None
+        standing = self._standing(player_id, self.leaderboard.score(player_id))
+        standing['neighbours'] = [
+            self._standing(pid, score)
+            for pid, score in self.leaderboard.around(player_id, radius)
+            if pid != player_id
+        ]
+        return standing
+
+    def quiz_info(self):
+        """Quiz details shown in the lobby, served from memory"""
+        return dict(
+            self.quiz.info(),
+            game_type=self.game_type,
+            is_started=self.state != LOBBY,
+            player_count=len(self.roster),
+            time_limit=self.time_limit
+        )
+
+    def snapshot(self):
+        """Full public state, sent to sockets that (re)connect mid-game"""
+        data = {
+            'state': self.state,
+            'game_type': self.game_type,
+            'player_count': len(self.roster),
+            'total_questions': self.quiz.total_questions,
+            'seq': self.events.seq,
+        }
+        if self.state == QUESTION:
+            data['question'] = self.question_payload()
+        elif self.state in (LEADERBOARD, ENDED):
+            data.update(self.leaderboard_payload())
+        return data
+
+    def spectator_payload(self):
+        """Aggregated state for read-only screens: question, countdown and top of the leaderboard"""
+        data = {
+            'state': self.state,
+            'quiz_name': self.quiz.name,
+            'player_count': len(self.roster),
+            'total_questions': self.quiz.total_questions,
+        }
+        if self.state in (QUESTION, REVEAL):
+            data['question'] = self.question_payload()
+            data['answer_count'] = len(self.answers)
+        if self.state == REVEAL:
+            data['correct_option'] = self.current_question.correct_index
+        elif self.state in (LEADERBOARD, ENDED):
+            data.update(self.leaderboard_payload())
+        return data
+
+    async def broadcast(self, message, group=None):
+        """Send a client message to a group (the game room by default), numbered for replay"""
+        group = group or self.room_group_name
+        message = self.events.record(group, message)
+        if group == self.room_group_name and message['type'] in PERSONALIZED:
+            await self._send_standings(message['seq'])
+        await self.send(group, message)
+        self.spectators.touch()
+
+    async def _send_standings(self, seq):
+        """Hand other workers the standings of their players ahead of a personalized broadcast"""
+        for worker, remote in list(self.remotes.items()):
+            try:
+                await self._layer.send(worker, {
+                    'type': 'engine.standings',
+                    'seq': seq,
+                    'standings': [[player_id, self.player_standing(player_id)] for player_id in remote['players']],
+                })
+            except Exception:
+                logger.exception("Sending standings of game %s failed", self.pin)
+
+    async def send(self, group, message):
+        """Send a client message to a group without numbering it, it is not replayed"""
+        channel_layer = get_channel_layer()
+        # Labelled by group kind (quiz, game, host, spectate), not by pin
+        with GROUP_SEND_SECONDS.time(group=group.split('_', 1)[0]):
+            await channel_layer.group_send(
+                group,
+                {
+                    'type': 'game_event',
+                    'message': message
+                }
+            )
+
+
+def _load_game(pin):
+    try:
+        game = GameSession.objects.select_related('quiz', 'host').get(pin=pin)
+    except GameSession.DoesNotExist:
+        return None
+
+    players = game.players.values('id', 'username', 'score')
+    return {
+        'id': game.id,
+        'game_type': game.game_type,
+        'time_limit': game.question_time_limit,
+        'is_started': game.is_started,
+        'is_ended': game.is_ended,
+        'current_question_id': game.current_question_id,
+        'quiz': get_snapshot(pin, game),
+        'roster': {player['id']: player['username'] for player in players},
+        'scores': {player['id']: player['score'] if game.is_started else 0 for player in players},
+    }
+
+
+class RemoteEngine:
+    """
+    Handle on a game whose engine runs on another worker.
+
+    Sockets connected here call the same commands as on a GameEngine; each
+    one is sent to the engine's channel and answered on this handle's own
+    channel. Broadcasts need no forwarding, they reach the sockets through
+    this worker's group subscriptions. The engine is told which sockets are
+    here, so it stays loaded for them and sends the standings of their
+    players ahead of each personalized broadcast.
+    """
+
+    def __init__(self, pin, owner, channel_layer):
+        self.pin = pin
+        self.room_group_name = f"game_{pin}"
+        self.lobby_group_name = f"quiz_{pin}"
+        self.host_group_name = f"host_{pin}"
+        self.spectator_group_name = f"spectate_{pin}"
+        self.owner = owner
+        self.channel = None
+        self.sockets = set()
+        self.closed = False
+        self._layer = channel_layer
+        self._calls = {}
+        self._standings = {}
+        self._standings_seq = 0
+        self._reported = (0, frozenset(), 0)
+        self._reporting = None
+        self._receiver = None
+
+    async def open(self):
+        self.channel = await self._layer.new_channel()
+        self._receiver = asyncio.ensure_future(self._receive())
+
+    def close(self):
+        """Stop using the handle, its sockets reconnect and get a fresh one"""
+        if self.closed:
+            return
+        self.closed = True
+        if _remotes.get(self.pin) is self:
+            del _remotes[self.pin]
+        if self._receiver is not None:
+            self._receiver.cancel()
+        for consumer in list(self.sockets):
+            # Service restart: the client reconnects
+            asyncio.ensure_future(consumer.close(code=1012))
+
+    async def _receive(self):
+        while True:
+            try:
+                message = await self._layer.receive(self.channel)
+            except Exception:
+                logger.exception("Receiving replies for game %s failed", self.pin)
+                await asyncio.sleep(1)
+                continue
+            if message['type'] == 'engine.standings':
+                future = self._standings_future(message['seq'])
+                if not future.done():
+                    future.set_result(dict(message['standings']))
+                continue
+            future = self._calls.get(message['id'])
+            if future is not None and not future.done():
+                future.set_result(message)
+
+    async def call(self, command, **kwargs):
+        """Run a command on the game's engine, on the worker that owns it"""
+        if self.closed:
+            raise GameOwnerUnavailable(f"Game {self.pin} moved to another worker")
+        request_id = uuid.uuid4().hex
+        future = self._calls[request_id] = asyncio.get_running_loop().create_future()
+        try:
+            await self._layer.send(self.owner, {
+                'type': 'engine.call',
+                'id': request_id,
+                'reply_to': self.channel,
+                'command': command,
+                'kwargs': kwargs,
+            })
+            reply = await asyncio.wait_for(future, settings.QUIZ_ENGINE_CALL_SECONDS)
+        except ChannelFull:
+            raise GameStateError("Game is busy, try again")
+        except asyncio.TimeoutError:
+            logger.error("The engine of game %s stopped answering", self.pin)
+            self.close()
+            raise GameOwnerUnavailable(f"Game {self.pin} stopped answering")
+        finally:
+            self._calls.pop(request_id, None)
+        if 'error' in reply:
+            kind, message = reply['error']
+            raise (ValueError if kind == 'ValueError' else GameStateError)(message)
+        return reply['result']
+
+    # ---- sockets ----
+
+    def attach(self, consumer):
+        self.sockets.add(consumer)
+        self._report()
+
+    def detach(self, consumer):
+        self.sockets.discard(consumer)
+        self._report()
+
+    def _report(self):
+        """Tell the engine which sockets are here, one report at a time"""
+        if self._reporting is None or self._reporting.done():
+            self._reporting = asyncio.ensure_future(self._send_reports())
+
+    def _hosted(self):
+        players = frozenset(
+            consumer.player.id for consumer in self.sockets
+            if consumer.kind == 'room' and consumer.player and not consumer.is_host
+        )
+        spectators = sum(1 for consumer in self.sockets if consumer.kind == 'spectator')
+        return len(self.sockets), players, spectators
+
+    async def _send_reports(self):
+        while not self.closed:
+            hosted = self._hosted()
+            if hosted == self._reported:
+                break
+            sockets, players, spectators = hosted
+            try:
+                await self.call('report', worker=self.channel, sockets=sockets, players=list(players),
+                                spectators=spectators)
+            except (GameOwnerUnavailable, GameStateError):
+                return
+            self._reported = hosted
+        if not self.sockets:
+            self.close()
+
+    def _standings_future(self, seq):
+        future = self._standings.get(seq)
+        if future is None:
+            future = self._standings[seq] = asyncio.get_running_loop().create_future()
+            self._standings_seq = max(self._standings_seq, seq)
+            # Only the latest broadcasts are still being delivered
+            for old in sorted(self._standings)[:-4]:
+                old_future = self._standings.pop(old)
+                if not old_future.done():
+                    old_future.set_result({})
+        return future
+
+    # ---- socket commands ----
+
+    async def current_state(self):
+        return await self.call('current_state')
+
+    async def join_lobby(self, player_id=None, username=None, auth_type=None, last_seq=None):
+        return await self.call(
+            'join_lobby', player_id=player_id, username=username, auth_type=auth_type, last_seq=last_seq
+        )
+
+    async def leave_lobby(self, player_id):
+        await self.call('leave_lobby', player_id=player_id)
+
+    async def join_room(self, player_id=None, is_host=False, last_seq=None):
+        return await self.call('join_room', player_id=player_id, is_host=is_host, last_seq=last_seq)
+
+    async def join_spectators(self):
+        return await self.call('join_spectators')
+
+    async def start(self):
+        await self.call('start')
+
+    async def advance(self):
+        await self.call('advance')
+
+    async def end(self):
+        await self.call('end')
+
+    async def answer(self, player_id, option):
+        return await self.call('answer', player_id=player_id, option=option)
+
+    async def standing(self, player_id, seq=None):
+        """
+        Standing of a player to add to a personalized broadcast: the one the
+        engine sent ahead of it, or the current one for replayed broadcasts
+        """
+        if seq is not None and player_id in self._reported[1] and (
+                seq in self._standings or seq > self._standings_seq):
+            try:
+                standings = await asyncio.wait_for(
+                    asyncio.shield(self._standings_future(seq)), settings.QUIZ_ENGINE_CALL_SECONDS
+                )
+            except asyncio.TimeoutError:
+                standings = {}
+            if player_id in standings:
+                return standings[player_id]
+        return await self.call('standing', player_id=player_id)
+
+
+_engines = {}
+_remotes = {}
+_loading = {}
+
+
+async def get_engine(pin):
+    """
+    Return the engine for a game pin: the GameEngine loaded from the database
+    once per process, or a RemoteEngine when another worker runs the game
+    """
+    engine = _engines.get(pin) or _remotes.get(pin)
+    if engine is not None:
+        return engine
+
+    # Concurrent connects for the same pin share one load
+    future = _loading.get(pin)
+    if future is None:
+        future = asyncio.ensure_future(_create_engine(pin))
+        _loading[pin] = future
+        future.add_done_callback(lambda _: _loading.pop(pin, None))
+    return await asyncio.shield(future)
+
+
+async def _create_engine(pin):
+    channel_layer = get_channel_layer()
+    engine = GameEngine(pin)
+    # One engine per game across all workers: the worker holding the lease runs it
+    owner = await engine.claim(channel_layer)
+    if owner != engine.channel:
+        remote = RemoteEngine(pin, owner, channel_layer)
+        await remote.open()
+        _remotes[pin] = remote
+        return remote
+    try:
+        loaded = await engine.load()
+    except Exception:
+        await release_lease(channel_layer, engine.lease_name, engine.channel)
+        raise
+    if not loaded:
+        await release_lease(channel_layer, engine.lease_name, engine.channel)
+        return None
+    _engines[pin] = engine
+    engine.serve()
+    # Unloaded again unless a socket attaches
+    engine.detach(None)
+    return engine
+
+
+def drop_engine(pin):
+    engine = _engines.pop(pin, None)
+    if engine is not None:
+        for group in (engine.lobby_group_name, engine.room_group_name, engine.host_group_name):
+            frame_cache.drop(group)
+        engine.release()
+    if engine is None or engine.state in (LOBBY, ENDED):
+        # A running game keeps its snapshot, it is never rebuilt from edited questions
+        drop_snapshot(pin)
+
+
+def loaded_games():
+    """Engines loaded in this process per game state"""
+    states = dict.fromkeys(TRANSITIONS, 0)
+    for engine in list(_engines.values()):
+        states[engine.state] = states.get(engine.state, 0) + 1
+    return {(state,): count for state, count in states.items()}
+
+
+Gauge(
+    'dynequiz_games_loaded',
+    'Games with an engine loaded in this process',
+    ('state',),
+    callback=loaded_games
+)
+
+ACTIVE_GAME_SESSIONS = Gauge(
+    'dynequiz_active_game_sessions',
+    'Game sessions that are active and not ended, over all workers',
+    ('state',)
+)
+
+
+@database_sync_to_async
+def count_active_game_sessions():
+    counts = dict(
+        GameSession.objects
+        .filter(is_active=True, is_ended=False)
+        .values_list('is_started')
+        .annotate(count=Count('id'))
+        .order_by()
+    )
+    return {'lobby': counts.get(False, 0), 'started': counts.get(True, 0)}
+
+
+@REGISTRY.collector
+async def collect_active_game_sessions():
+    for state, count in (await count_active_game_sessions()).items():
+        ACTIVE_GAME_SESSIONS.set(count, state=state)
@@ -0,0 +1,168 @@
+import asyncio
+import logging
+from channels.layers import get_channel_layer
+from django.conf import settings
+from core.channel_layers import queue_depth
+from core.metrics import REGISTRY, Gauge
+from .frames import frame_cache
+
+logger = logging.getLogger(__name__)
+
+
+class LocalGroup:
+    """
+    The sockets of one channel-layer group that live in this process.
+
+    Only one leader channel per process joins the channel-layer group, so a
+    group_send costs one message per worker instead of one per socket. The
+    leader encodes each broadcast once per codec and hands the same frame to
+    every local socket, yielding to the event loop after every shard so a
+    large game never blocks the worker for the whole fan-out.
+    """
+    retry_delay = 1
+    max_retry_delay = 30
+
+    def __init__(self, name, shard_size=None):
+        self.name = name
+        self.shard_size = shard_size or settings.QUIZ_FANOUT_SHARD_SIZE
+        self.members = {}
+        self.channel = None
+        self._task = None
+        self._started = asyncio.ensure_future(self._start())
+
+    def __len__(self):
+        return len(self.members)
+
+    async def _start(self):
+        channel_layer = get_channel_layer()
+        self.channel = await channel_layer.new_channel()
+        await channel_layer.group_add(self.name, self.channel)
+        self._task = asyncio.ensure_future(self._run(channel_layer))
+
+    async def stop(self):
+        await self._started
+        if self._task is not None:
+            self._task.cancel()
+        await get_channel_layer().group_discard(self.name, self.channel)
+
+    async def _run(self, channel_layer):
+        delay = self.retry_delay
+        while True:
+            try:
+                event = await channel_layer.receive(self.channel)
+            except Exception:
+                # The layer may have lost the subscription (e.g. a Redis restart): join again
+                logger.exception("Receiving for group %s failed, resubscribing in %ss", self.name, delay)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.max_retry_delay)
+                try:
+                    await channel_layer.group_add(self.name, self.channel)
+                except Exception:
+                    logger.exception("Resubscribing to group %s failed", self.name)
+                continue
+            delay = self.retry_delay
+            try:
+                if event.get('type') == 'game_event':
+                    await self.deliver(event['message'])
+                else:
+                    for consumer in list(self.members):
+                        await consumer.dispatch(event)
+            except Exception:
+                logger.exception("Fan-out of %s to group %s failed", event.get('type'), self.name)
+
+    async def deliver(self, message):
+        """Send one broadcast to every local socket, encoding it once per codec"""
+        frames = {}
+        for position, consumer in enumerate(list(self.members)):
+            if position and position % self.shard_size == 0:
+                await asyncio.sleep(0)
+            if consumer not in self.members:
+                continue
+            try:
+                personal = await consumer.personalize(message)
+                if personal is not message:
+                    await consumer.send_message(personal)
+                    continue
+                frame = frames.get(consumer.codec)
+                if frame is None:
+                    frame = frames[consumer.codec] = frame_cache.encode(self.name, message, consumer.codec)
+                await consumer.send_frame(frame)
+            except Exception:
+                logger.exception("Could not deliver %s to a socket of %s", message.get('type'), self.name)
+
+
+_groups = {}
+
+
+async def join(name, consumer):
+    """Add a consumer to a group, subscribing this process to it on first use"""
+    group = _groups.get(name)
+    if group is None:
+        group = _groups[name] = LocalGroup(name)
+    group.members[consumer] = None
+    try:
+        await asyncio.shield(group._started)
+    except Exception:
+        if _groups.get(name) is group:
+            del _groups[name]
+        raise
+
+
+async def leave(name, consumer):
+    """Remove a consumer, unsubscribing the process once the group is empty"""
+    group = _groups.get(name)
+    if group is None:
+        return
+    group.members.pop(consumer, None)
+    if not group.members:
+        del _groups[name]
+        await group.stop()
+
+
+def local_size(name):
+    """Number of sockets of a group connected to this process"""
+    group = _groups.get(name)
+    return len(group) if group is not None else 0
+
+
+def group_sizes():
+    """Groups and sockets of this process per group kind (quiz, game, host, spectate)"""
+    sizes = {}
+    for name, group in list(_groups.items()):
+        kind = name.split('_', 1)[0]
+        groups, sockets, largest = sizes.get(kind, (0, 0, 0))
+        sizes[kind] = (groups + 1, sockets + len(group), max(largest, len(group)))
+    return sizes
+
+
+# Labelled by group kind rather than by pin, so finished games do not leave series behind
+Gauge(
+    'dynequiz_groups',
+    'Groups with sockets connected to this process',
+    ('kind',),
+    callback=lambda: {(kind,): size[0] for kind, size in group_sizes().items()}
+)
+Gauge(
+    'dynequiz_group_sockets',
+    'Sockets connected to this process, summed over the groups of a kind',
+    ('kind',),
+    callback=lambda: {(kind,): size[1] for kind, size in group_sizes().items()}
+)
+Gauge(
+    'dynequiz_group_sockets_max',
+    'Sockets connected to this process in the largest group of a kind',
+    ('kind',),
+    callback=lambda: {(kind,): size[2] for kind, size in group_sizes().items()}
+)
+
+CHANNEL_LAYER_QUEUE = Gauge(
+    'dynequiz_channel_layer_queue_depth',
+    'Channel layer messages waiting to be received by this process',
+    ('queue',)
+)
+
+
+@REGISTRY.collector
+async def collect_queue_depth():
+    for queue, depth in (await queue_depth(get_channel_layer())).items():
+        CHANNEL_LAYER_QUEUE.set(depth, queue=queue)
@@ -0,0 +1,39 @@
+from collections import OrderedDict
+from django.conf import settings
+
+
+class FrameCache:
+    """
+    Encoded frames of recent numbered broadcasts, per group and codec.
+
+    A broadcast is encoded the first time any socket of this process needs
+    it in a given codec; the fan-out and reconnect replays reuse that frame
+    as-is. Only the last `size` events of a group can be replayed, so older
+    frames are evicted.
+    """
+
+    def __init__(self, size=None):
+        self.size = size or settings.QUIZ_REPLAY_BUFFER_SIZE
+        self._groups = {}
+
+    def encode(self, group, message, codec):
+        """Frame for a message of `group`, encoded once per (seq, codec)"""
+        seq = message.get('seq')
+        if seq is None:
+            return codec.encode(message)
+        frames = self._groups.get(group)
+        if frames is None:
+            frames = self._groups[group] = OrderedDict()
+        key = (seq, codec.subprotocol)
+        frame = frames.get(key)
+        if frame is None:
+            frame = frames[key] = codec.encode(message)
+            while len(frames) > self.size * 2:
+                frames.popitem(last=False)
+        return frame
+
+    def drop(self, group):
+        self._groups.pop(group, None)
+
+
+frame_cache = FrameCache()
@@ -1,6 +1,14 @@
 # your_app/game_logic.py
+import asyncio
+from functools import partial
 from django.utils import timezone
 
+# Rounds with at least this many answers are scored off the event loop
+ASYNC_SCORING_THRESHOLD = 2000
+
+# Game types the engine can play; team games need team assignment first
+SCORED_GAME_TYPES = ('classic', 'accuracy')
+
 
 def calculate_score(time_remaining, max_time=30, base_points=100):
     """
@@ -19,3 +27,47 @@ def calculate_score(time_remaining, max_time=30, base_points=100):
     score_range = base_points - min_score
 
     return int(min_score + (score_range * time_ratio))
+
+
+def score_round(game_type, correct, response_times, max_time=30, base_points=100, team_ids=None, team_sizes=None):
+    """
+    Score a whole round in one pass.
+
+    `correct`, `response_times` and `team_ids` are parallel sequences with one
+    entry per answer; the returned score deltas are in the same order.
+    - classic: calculate_score for every correct answer
+    - accuracy: base_points for every correct answer, speed is ignored
+    - team: classic points summed per team and divided by the team's size in
+      `team_sizes`, so members who did not answer count as zero; every member
+      who answered gets the team average
+    """
+    if game_type == 'accuracy':
+        return [base_points if is_correct else 0 for is_correct in correct]
+    if game_type not in ('classic', 'team'):
+        raise ValueError(f"Unknown game type: {game_type}")
+    if game_type == 'team' and (team_ids is None or team_sizes is None):
+        raise ValueError("Team rounds need the team ids and team sizes")
+
+    min_score = base_points * 0.5
+    score_range = base_points - min_score
+    deltas = [
+        int(min_score + score_range * min((max_time - response_time) / max_time, 1.0))
+        if is_correct and response_time < max_time else 0
+        for is_correct, response_time in zip(correct, response_times)
+    ]
+
+    if game_type == 'team':
+        totals = {}
+        for team_id, delta in zip(team_ids, deltas):
+            totals[team_id] = totals.get(team_id, 0) + delta
+        deltas = [totals[team_id] // team_sizes[team_id] for team_id in team_ids]
+    return deltas
+
+
+async def score_round_async(game_type, correct, response_times, max_time=30, base_points=100,
+                            team_ids=None, team_sizes=None):
+    """score_round that moves large rounds to the default executor"""
+    scorer = partial(score_round, game_type, correct, response_times, max_time, base_points, team_ids, team_sizes)
+    if len(correct) < ASYNC_SCORING_THRESHOLD:
+        return scorer()
+    return await asyncio.get_running_loop().run_in_executor(None, scorer)
@@ -0,0 +1,59 @@
+import time
+from django.conf import settings
+from django.core import signing
+from django.core.cache import cache
+from core.cache import cache_is_shared
+from .models import Player
+
+SALT = 'quiz.guest_token'
+REVOKED_KEY = 'guest-token-revoked:{}'
+
+
+def issue_guest_token(player):
+    """Signed credential carrying the guest's identity and expiry, returns (token, expires_at)"""
+    expires_at = int(time.time() + settings.GUEST_TOKEN_LIFETIME_SECONDS)
+    token = signing.dumps({
+        'player_id': player.id,
+        'guest_id': player.guest_id,
+        'username': player.username,
+        'exp': expires_at,
+    }, salt=SALT)
+    return token, expires_at
+
+
+def read_guest_token(token, check_player=True):
+    """
+    Claims of a valid, unexpired and unrevoked guest token, None otherwise.
+
+    Revocations are read from the cache when it is shared between workers;
+    otherwise the guest is looked up instead, so call it from a database
+    thread in async code. With check_player=False that lookup is skipped and
+    the caller must load the guest with guest_lookup() before trusting it.
+    """
+    try:
+        claims = signing.loads(token, salt=SALT)
+    except signing.BadSignature:
+        return None
+    if claims.get('exp', 0) <= time.time():
+        return None
+    if cache_is_shared():
+        if cache.get(REVOKED_KEY.format(claims['guest_id'])):
+            return None
+    elif check_player and not guest_lookup(claims).exists():
+        return None
+    return claims
+
+
+def guest_lookup(claims):
+    """Queryset of the guest the claims were issued to, empty once its tokens are revoked"""
+    return Player.objects.filter(id=claims['player_id'], guest_id=claims['guest_id'], is_guest=True)
+
+
+def revoke_guest_tokens(guest_id):
+    """Reject every token issued to a guest until the longest of them has expired"""
+    cache.set(REVOKED_KEY.format(guest_id), True, timeout=settings.GUEST_TOKEN_LIFETIME_SECONDS)
+
+
+def guest_player(claims):
+    """Player built from token claims without a query, enough for id and username"""
+    return Player(id=claims['player_id'], username=claims['username'], is_guest=True, guest_id=claims['guest_id'])
@@ -0,0 +1,90 @@
+from bisect import bisect_left, insort
+
+
+class Leaderboard:
+    """
+    Scores of one game kept sorted by score (highest first), then join order.
+
+    Entries are stored as (-score, seq, player_id) in a sorted list so rank
+    lookups are a binary search and score changes only move one entry.
+    Tied players share a rank.
+    """
+
+    def __init__(self):
+        self._keys = []
+        self._entries = {}
+        self._seq = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, player_id):
+        return player_id in self._entries
+
+    def add(self, player_id, score=0):
+        """Add a player, returns False if already present"""
+        if player_id in self._entries:
+            return False
+        self._seq += 1
+        key = (-score, self._seq, player_id)
+        self._entries[player_id] = key
+        insort(self._keys, key)
+        return True
+
+    def remove(self, player_id):
+        key = self._entries.pop(player_id, None)
+        if key is not None:
+            del self._keys[bisect_left(self._keys, key)]
+
+    def score(self, player_id):
+        return -self._entries[player_id][0]
+
+    def set_score(self, player_id, score):
+        old = self._entries.get(player_id)
+        if old is None:
+            return self.add(player_id, score)
+        if -old[0] == score:
+            return
+        del self._keys[bisect_left(self._keys, old)]
+        key = (-score, old[1], player_id)
+        self._entries[player_id] = key
+        insort(self._keys, key)
+
+    def apply(self, deltas):
+        """Apply a round of score deltas, returns the new scores of the changed players"""
+        changed = {}
+        for player_id, delta in deltas.items():
+            if delta and player_id in self._entries:
+                changed[player_id] = self.score(player_id) + delta
+
+        if len(changed) * 8 < len(self._keys):
+            for player_id, score in changed.items():
+                self.set_score(player_id, score)
+        else:
+            # Most of the roster moved: re-keying in place and one sort is cheaper
+            for player_id, score in changed.items():
+                old = self._entries[player_id]
+                self._entries[player_id] = (-score, old[1], player_id)
+            self._keys = sorted(self._entries.values())
+        return changed
+
+    def rank(self, player_id):
+        """1-based rank of a player"""
+        key = self._entries[player_id]
+        return bisect_left(self._keys, (key[0],)) + 1
+
+    def top(self, k=10):
+        """The first k players as (player_id, score) pairs"""
+        return [(player_id, -neg_score) for neg_score, _, player_id in self._keys[:k]]
+
+    def around(self, player_id, radius=2):
+        """Players directly above and below a player, including the player"""
+        index = bisect_left(self._keys, self._entries[player_id])
+        start = max(index - radius, 0)
+        return [
+            (pid, -neg_score)
+            for neg_score, _, pid in self._keys[start:index + radius + 1]
+        ]
+
+    def scores(self):
+        return {player_id: -key[0] for player_id, key in self._entries.items()}
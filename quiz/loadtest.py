@@ -0,0 +1,299 @@
+import asyncio
+import json
+import math
+import os
+import random
+import resource
+import time
+import uuid
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth import get_user_model
+from members.tokens import create_jwt_pair_for_user
+from organization.models import Organization, OrganizationMembership
+from question.models import Question
+from core.stats import summarize
+from .guest_tokens import issue_guest_token
+from .models import Quiz, GameSession, Player
+
+OPTIONS = ['A', 'B', 'C', 'D']
+
+
+def rss():
+    """Resident memory of this process in bytes"""
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def merged_duration(intervals):
+    """Total time covered by possibly overlapping (start, end) intervals"""
+    total = 0
+    current_start = current_end = None
+    for start, end in sorted(intervals):
+        if current_end is None or start > current_end:
+            if current_end is not None:
+                total += current_end - current_start
+            current_start, current_end = start, end
+        else:
+            current_end = max(current_end, end)
+    if current_end is not None:
+        total += current_end - current_start
+    return total
+
+
+def peak_rate(timestamps, window=1.0):
+    """Highest number of events seen in any `window` seconds"""
+    timestamps = sorted(timestamps)
+    peak = first = 0
+    for last, stamp in enumerate(timestamps):
+        while stamp - timestamps[first] > window:
+            first += 1
+        peak = max(peak, last - first + 1)
+    return peak / window
+
+
+class SimulatedClient:
+    """One websocket of the load test, with a reader timestamping every message it receives"""
+
+    def __init__(self, application, path, headers=None):
+        self.communicator = WebsocketCommunicator(application, path, headers=headers or [])
+        self.inbox = asyncio.Queue()
+        self._reader = None
+
+    async def connect(self, timeout):
+        connected, code = await self.communicator.connect(timeout)
+        if not connected:
+            raise ConnectionError(f"Connection refused with code {code}")
+        self._reader = asyncio.ensure_future(self._read())
+
+    async def _read(self):
+        while True:
+            output = await self.communicator.receive_output(timeout=None)
+            if output['type'] == 'websocket.close':
+                return
+            if output.get('text') is not None:
+                self.inbox.put_nowait((time.perf_counter(), json.loads(output['text'])))
+
+    async def expect(self, message_type, timeout):
+        """Wait for the next message of a type, skipping others; returns (received_at, message)"""
+        return await asyncio.wait_for(self._next(message_type), timeout)
+
+    async def _next(self, message_type):
+        while True:
+            received_at, message = await self.inbox.get()
+            if message.get('type') == message_type:
+                return received_at, message
+
+    async def send(self, message):
+        await self.communicator.send_json_to(message)
+
+    async def close(self):
+        if self._reader is not None:
+            self._reader.cancel()
+        await self.communicator.disconnect()
+
+
+class LoadTest:
+    """
+    Drives simulated hosts and players through complete games over the ASGI app.
+
+    Every game goes through a join storm in the lobby, the start, and one
+    answer round per question with log-normally distributed think times.
+    The host advances the game as soon as all players have answered.
+    """
+
+    def __init__(self, application, games=1, players=100, questions=5, time_limit=10, think=1.5,
+                 accuracy=0.6, concurrency=200, timeout=30, seed=None):
+        self.application = application
+        self.games = games
+        self.players = players
+        self.questions = questions
+        self.time_limit = time_limit
+        self.think = think
+        self.accuracy = accuracy
+        self.timeout = timeout
+        self.random = random.Random(seed)
+        self.connect_slots = asyncio.Semaphore(concurrency)
+        self.organization = None
+        self.sessions = []
+        self.results = {
+            'connect': [],
+            'play_connect': [],
+            'broadcast': {},
+            'answer_ack': [],
+            'answer_times': [],
+            'answer_windows': [],
+            'errors': 0,
+        }
+
+    # ---- fixtures ----
+
+    def setup(self):
+        """Create an organization, one host and quiz per game, and the guest players"""
+        User = get_user_model()
+        run = uuid.uuid4().hex[:8]
+        self.organization = Organization.objects.create(name=f"Load test {run}")
+        for number in range(self.games):
+            host = User.objects.create_user(
+                email=f"loadtest-{run}-{number}@example.com",
+                username=f"loadtest-{run}-{number}"
+            )
+            OrganizationMembership.objects.create(user=host, organization=self.organization, role='admin')
+            questions = Question.objects.bulk_create([
+                Question(
+                    text=f"Question {index + 1}",
+                    options=OPTIONS,
+                    correct_answer=self.random.choice(OPTIONS),
+                    created_by=host,
+                    organization=self.organization
+                )
+                for index in range(self.questions)
+            ])
+            quiz = Quiz.objects.create(
+                name=f"Load test {run} #{number}", created_by=host,
+                organization=self.organization, description="Load test"
+            )
+            quiz.questions.add(*questions)
+            game = GameSession.objects.create(quiz=quiz, host=host, question_time_limit=self.time_limit)
+            players = Player.objects.bulk_create([
+                Player(username=f"player{index}", is_guest=True, guest_id=uuid.uuid4().hex)
+                for index in range(self.players)
+            ])
+            self.sessions.append({
+                'pin': game.pin,
+                'host': host,
+                'token': create_jwt_pair_for_user(host)['access'],
+                'answer_key': [
+                    OPTIONS.index(question.correct_answer)
+                    for question in sorted(questions, key=lambda question: question.id)
+                ],
+                'players': [player.guest_id for player in players],
+                'tokens': [issue_guest_token(player)[0] for player in players],
+            })
+
+    def teardown(self):
+        """Remove everything created by setup"""
+        guest_ids = [guest_id for session in self.sessions for guest_id in session['players']]
+        Player.objects.filter(guest_id__in=guest_ids).delete()
+        get_user_model().objects.filter(id__in=[session['host'].id for session in self.sessions]).delete()
+        if self.organization is not None:
+            self.organization.delete()
+
+    # ---- scenario ----
+
+    async def run(self):
+        """Run every game concurrently and return the report"""
+        started = time.perf_counter()
+        before = rss()
+        lobbies = await asyncio.gather(*(self.join_storm(session) for session in self.sessions))
+        sockets = sum(len(players) + 1 for _, players in lobbies)
+        memory = (rss() - before) / sockets if sockets else 0
+        await asyncio.gather(*(
+            self.play(session, host, players) for session, (host, players) in zip(self.sessions, lobbies)
+        ))
+        return self.report(time.perf_counter() - started, memory)
+
+    async def connect(self, path, headers=None, first_message=None, latencies=None):
+        client = SimulatedClient(self.application, path, headers)
+        async with self.connect_slots:
+            started = time.perf_counter()
+            await client.connect(self.timeout)
+            if first_message:
+                await client.expect(first_message, self.timeout)
+            if latencies is not None:
+                latencies.append(time.perf_counter() - started)
+        return client
+
+    def guest(self, token):
+        return [(b'cookie', f'guest_token={token}'.encode())]
+
+    async def join_storm(self, session):
+        pin = session['pin']
+        host = await self.connect(f"/ws/quiz/{pin}/lobby/?token={session['token']}", first_message='lobby_snapshot')
+        players = await asyncio.gather(*(
+            self.connect(
+                f"/ws/quiz/{pin}/lobby/", self.guest(token),
+                first_message='lobby_snapshot', latencies=self.results['connect']
+            )
+            for token in session['tokens']
+        ))
+        return host, players
+
+    async def broadcast(self, host, clients, message, expected):
+        """Send a host command and time how long each socket takes to see the resulting broadcast"""
+        latencies = self.results['broadcast'].setdefault(expected, [])
+        sent = time.perf_counter()
+        await host.send(message)
+        received = await asyncio.gather(*(client.expect(expected, self.timeout) for client in clients))
+        latencies.extend(received_at - sent for received_at, _ in received)
+
+    async def play(self, session, host, lobby_players):
+        pin = session['pin']
+        await self.broadcast(host, lobby_players, {'type': 'start_game'}, 'game_started')
+
+        players = await asyncio.gather(*(
+            self.connect(
+                f"/ws/game/{pin}/play/", self.guest(token),
+                first_message='game_state', latencies=self.results['play_connect']
+            )
+            for token in session['tokens']
+        ))
+        room = await self.connect(f"/ws/game/{pin}/play/?token={session['token']}", first_message='game_state')
+        await asyncio.gather(host.close(), *(client.close() for client in lobby_players))
+
+        for index, correct in enumerate(session['answer_key']):
+            opened = time.perf_counter()
+            await asyncio.gather(*(self.answer(client, correct) for client in players))
+            self.results['answer_windows'].append((opened, time.perf_counter()))
+
+            await self.broadcast(room, players, {'type': 'next'}, 'question_ended')
+            await self.broadcast(room, players, {'type': 'next'}, 'leaderboard')
+            last = index + 1 == len(session['answer_key'])
+            await self.broadcast(room, players, {'type': 'next'}, 'game_ended' if last else 'question_started')
+
+        await asyncio.gather(room.close(), *(client.close() for client in players))
+
+    def think_time(self):
+        """Log-normal think time around the configured median, always inside the time limit"""
+        delay = self.random.lognormvariate(math.log(self.think), 0.6) if self.think else 0
+        return min(delay, self.time_limit * 0.8)
+
+    async def answer(self, client, correct):
+        await asyncio.sleep(self.think_time())
+        if self.random.random() < self.accuracy:
+            option = correct
+        else:
+            option = self.random.choice([index for index in range(len(OPTIONS)) if index != correct])
+        sent = time.perf_counter()
+        await client.send({'type': 'submit_answer', 'option': option})
+        try:
+            received_at, _ = await client.expect('answer_received', self.timeout)
+        except asyncio.TimeoutError:
+            self.results['errors'] += 1
+            return
+        self.results['answer_ack'].append(received_at - sent)
+        self.results['answer_times'].append(received_at)
+
+    def report(self, duration, memory):
+        results = self.results
+        answers = len(results['answer_times'])
+        answering = merged_duration(results['answer_windows'])
+        return {
+            'games': self.games,
+            'players_per_game': self.players,
+            'questions': self.questions,
+            'duration_s': round(duration, 2),
+            'connect_latency_ms': summarize(results['connect']),
+            'play_connect_latency_ms': summarize(results['play_connect']),
+            'broadcast_latency_ms': {
+                message_type: summarize(latencies) for message_type, latencies in results['broadcast'].items()
+            },
+            'answer_ack_latency_ms': summarize(results['answer_ack']),
+            'answers': answers,
+            'answers_per_sec': round(answers / answering, 1) if answering else 0,
+            'answers_per_sec_peak': peak_rate(results['answer_times']),
+            'memory_per_socket_kb': round(memory / 1024, 1),
+            'errors': results['errors'],
+        }
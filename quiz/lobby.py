@@ -0,0 +1,95 @@
+import asyncio
+from django.conf import settings
+
+
+class Lobby:
+    """
+    Lobby roster of one game with coalesced broadcasts.
+
+    Joins and leaves are collected for a short window and sent to the
+    lobby group as a single lobby_update delta, so a join storm costs one
+    frame per socket per window instead of one per join. A player whose
+    last socket drops is only removed after a grace period, so flaky
+    reconnects produce no update at all.
+    """
+
+    def __init__(self, engine, window=None, grace=None):
+        self.engine = engine
+        self.window = settings.QUIZ_LOBBY_UPDATE_SECONDS if window is None else window
+        self.grace = settings.QUIZ_RECONNECT_GRACE_SECONDS if grace is None else grace
+        self.connections = {}
+        self.joined = {}
+        self.left = set()
+        self._leaving = {}
+        self._handle = None
+
+    def connect(self, player_id, username, auth_type):
+        """Register a lobby socket for a player"""
+        self.connections[player_id] = self.connections.get(player_id, 0) + 1
+        leaving = self._leaving.pop(player_id, None)
+        if leaving is not None:
+            leaving.cancel()
+        if not self.engine.add_player(player_id, username):
+            return
+        if player_id in self.left:
+            self.left.discard(player_id)
+        else:
+            self.joined[player_id] = {'player_id': player_id, 'username': username, 'auth_type': auth_type}
+        self._schedule()
+
+    def disconnect(self, player_id):
+        """Drop a lobby socket, the player leaves once their last socket is gone"""
+        count = self.connections.get(player_id, 0) - 1
+        if count > 0:
+            self.connections[player_id] = count
+            return
+        self.connections.pop(player_id, None)
+        if self.grace:
+            loop = asyncio.get_running_loop()
+            self._leaving[player_id] = loop.call_later(self.grace, self._leave, player_id)
+        else:
+            self._leave(player_id)
+
+    def _leave(self, player_id):
+        self._leaving.pop(player_id, None)
+        if player_id in self.connections:
+            return
+        if player_id not in self.engine.roster or not self.engine.remove_player(player_id):
+            return
+        if self.joined.pop(player_id, None) is None:
+            self.left.add(player_id)
+        self._schedule()
+
+    def snapshot(self):
+        """Full roster, sent to a socket when it connects"""
+        return {
+            'players': [
+                {'player_id': player_id, 'username': username}
+                for player_id, username in self.engine.roster.items()
+            ],
+            'player_count': len(self.engine.roster),
+            'seq': self.engine.events.seq,
+        }
+
+    def _schedule(self):
+        if self._handle is None:
+            loop = asyncio.get_running_loop()
+            self._handle = loop.call_later(self.window, lambda: asyncio.ensure_future(self.flush()))
+
+    async def flush(self):
+        """Send everything collected since the last update as one delta"""
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+        if not self.joined and not self.left:
+            return
+        joined, self.joined = list(self.joined.values()), {}
+        left, self.left = list(self.left), set()
+        await self.engine.broadcast({
+            'type': 'lobby_update',
+            'data': {
+                'joined': joined,
+                'left': left,
+                'player_count': len(self.engine.roster),
+            }
+        }, self.engine.lobby_group_name)
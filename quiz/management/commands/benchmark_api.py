@@ -0,0 +1,54 @@
+import json
+from django.core.management.base import BaseCommand
+from core.benchmark import Benchmark
+
+
+class Command(BaseCommand):
+    help = "Seed a large dataset and report latency percentiles and throughput of the main REST endpoints"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orgs', type=int, default=50)
+        parser.add_argument('--members', type=int, default=20, help="Members per organization")
+        parser.add_argument('--questions', type=int, default=100000)
+        parser.add_argument('--quizzes', type=int, default=10000)
+        parser.add_argument('--questions-per-quiz', type=int, default=10)
+        parser.add_argument('--games', type=int, default=50, help="Game sessions to look up")
+        parser.add_argument('--requests', type=int, default=200, help="Measured requests per endpoint")
+        parser.add_argument('--login-requests', type=int, default=20, help="Measured logins (password hashing is slow)")
+        parser.add_argument('--warmup', type=int, default=5)
+        parser.add_argument('--concurrency', type=int, default=10, help="Concurrent requests on the ASGI path")
+        parser.add_argument('--endpoint', action='append', dest='endpoints', help="Only run these endpoints")
+        parser.add_argument('--output', help="Write the JSON report to a file instead of stdout")
+        parser.add_argument('--seed', type=int, default=None)
+        parser.add_argument('--keep', action='store_true', help="Keep the seeded data")
+
+    def handle(self, *args, **options):
+        benchmark = Benchmark(
+            orgs=options['orgs'],
+            members=options['members'],
+            questions=options['questions'],
+            quizzes=options['quizzes'],
+            questions_per_quiz=options['questions_per_quiz'],
+            games=options['games'],
+            seed=options['seed']
+        )
+        benchmark.setup()
+        try:
+            report = benchmark.run(
+                requests=options['requests'],
+                login_requests=options['login_requests'],
+                warmup=options['warmup'],
+                concurrency=options['concurrency'],
+                only=options['endpoints']
+            )
+        finally:
+            if not options['keep']:
+                benchmark.teardown()
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as report_file:
+                report_file.write(output)
+            self.stdout.write(self.style.SUCCESS(f"Report written to {options['output']}"))
+        else:
+            self.stdout.write(output)
@@ -0,0 +1,43 @@
+import asyncio
+import json
+from django.core.management.base import BaseCommand
+from quiz.loadtest import LoadTest
+
+
+class Command(BaseCommand):
+    help = "Play complete games with simulated hosts and players over websockets and report latencies"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--games', type=int, default=1, help="Games played concurrently")
+        parser.add_argument('--players', type=int, default=100, help="Players per game")
+        parser.add_argument('--questions', type=int, default=5)
+        parser.add_argument('--time-limit', type=int, default=10, help="Seconds per question")
+        parser.add_argument('--think', type=float, default=1.5, help="Median seconds before a player answers")
+        parser.add_argument('--accuracy', type=float, default=0.6, help="Share of correct answers")
+        parser.add_argument('--concurrency', type=int, default=200, help="Connections opened at the same time")
+        parser.add_argument('--timeout', type=float, default=30, help="Seconds to wait for any expected message")
+        parser.add_argument('--seed', type=int, default=None)
+        parser.add_argument('--keep', action='store_true', help="Keep the generated games and players")
+
+    def handle(self, *args, **options):
+        from DyneQuiz.asgi import application
+
+        load_test = LoadTest(
+            application,
+            games=options['games'],
+            players=options['players'],
+            questions=options['questions'],
+            time_limit=options['time_limit'],
+            think=options['think'],
+            accuracy=options['accuracy'],
+            concurrency=options['concurrency'],
+            timeout=options['timeout'],
+            seed=options['seed']
+        )
+        load_test.setup()
+        try:
+            report = asyncio.run(load_test.run())
+        finally:
+            if not options['keep']:
+                load_test.teardown()
+        self.stdout.write(json.dumps(report, indent=2))
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from quiz.answer_buffer import replay_spool
+
+
+class Command(BaseCommand):
+    help = "Write answers that were spooled to disk after a failed flush"
+
+    def handle(self, *args, **options):
+        written = replay_spool()
+        self.stdout.write(self.style.SUCCESS(f"Replayed {written} spooled answers"))
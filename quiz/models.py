@@ -80,6 +80,8 @@ class GameSession(models.Model):
     is_started = models.BooleanField(default=False)
     is_ended = models.BooleanField(default=False)
     question_order = models.JSONField(default=list)
+    # Questions and answer key as they were when the game started
+    question_snapshot = models.JSONField(null=True, blank=True, editable=False)
     game_type = models.CharField(
         max_length=10,
         choices=[('classic', 'Classic'), ('team', 'Team'), ('accuracy', 'Accuracy')],
@@ -93,11 +95,11 @@ class GameSession(models.Model):
 
     def start_quiz(self):
         self.is_started = True
-        self.save()
+        self.save(update_fields=['is_started'])
 
     def stop_quiz(self):
         self.is_ended = True
-        self.save()
+        self.save(update_fields=['is_ended'])
 
     def generate_unique_pin(self):
         length = 6
@@ -111,12 +113,20 @@ class Answer(models.Model):
     player = models.ForeignKey(Player, on_delete=models.CASCADE)
     game_session = models.ForeignKey(GameSession, on_delete=models.CASCADE)
     question = models.ForeignKey(Question, on_delete=models.CASCADE)
-    selected_answer = models.CharField(max_length=255)
+    selected_option = models.PositiveSmallIntegerField()
     is_correct = models.BooleanField()
     response_time = models.FloatField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         unique_together = ['player', 'question', 'game_session']
+        indexes = [
+            # Per-round aggregation (counts per option, correct rate) is index-only
+            models.Index(
+                fields=['game_session', 'question'],
+                include=['selected_option', 'is_correct'],
+                name='answer_round_idx'
+            )
+        ]
 
 # Create your models here.
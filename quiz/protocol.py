@@ -0,0 +1,83 @@
+import json
+import msgpack
+
+MSGPACK_SUBPROTOCOL = 'dyne.msgpack'
+
+# Integer tags used instead of type names on the binary protocol.
+# Append only: clients depend on these numbers.
+MESSAGE_TYPES = [
+    'error',
+    'quiz_info',
+    'lobby_snapshot',
+    'lobby_update',
+    'game_started',
+    'game_state',
+    'question_started',
+    'question_ended',
+    'leaderboard',
+    'game_ended',
+    'answer_received',
+    'start_game',
+    'submit_answer',
+    'next',
+    'answer_stats',
+    'spectator_state',
+    'end_game',
+]
+TYPE_TAGS = {name: tag for tag, name in enumerate(MESSAGE_TYPES, start=1)}
+TAG_TYPES = {tag: name for name, tag in TYPE_TAGS.items()}
+
+
+class JSONCodec:
+    """Default protocol: one JSON object per text frame"""
+    subprotocol = None
+    binary = False
+
+    def encode(self, message):
+        return json.dumps(message)
+
+    def decode(self, text_data=None, bytes_data=None):
+        data = json.loads(text_data if text_data is not None else bytes_data)
+        if not isinstance(data, dict):
+            raise ValueError("Message must be an object")
+        return data
+
+
+class MsgpackCodec:
+    """
+    Binary protocol negotiated with the dyne.msgpack subprotocol.
+
+    Each frame is a msgpack array [tag, payload] where tag is the integer
+    from TYPE_TAGS (or the type name for untagged types) and payload holds
+    the remaining fields of the message.
+    """
+    subprotocol = MSGPACK_SUBPROTOCOL
+    binary = True
+
+    def encode(self, message):
+        payload = dict(message)
+        message_type = payload.pop('type', None)
+        return msgpack.packb([TYPE_TAGS.get(message_type, message_type), payload])
+
+    def decode(self, text_data=None, bytes_data=None):
+        if bytes_data is None:
+            raise ValueError("Binary frame expected")
+        frame = msgpack.unpackb(bytes_data)
+        if not isinstance(frame, list) or len(frame) != 2 or not isinstance(frame[1], dict):
+            raise ValueError("Frame must be [type, payload]")
+        tag, data = frame
+        if isinstance(tag, bool) or not isinstance(tag, (int, str)):
+            raise ValueError("Frame type must be a tag or a type name")
+        data['type'] = TAG_TYPES.get(tag, tag)
+        return data
+
+
+JSON = JSONCodec()
+MSGPACK = MsgpackCodec()
+
+
+def negotiate_codec(subprotocols):
+    """Pick the codec for the subprotocols offered by the client"""
+    if MSGPACK_SUBPROTOCOL in (subprotocols or []):
+        return MSGPACK
+    return JSON
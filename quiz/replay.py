@@ -0,0 +1,35 @@
+from collections import deque
+
+
+class EventLog:
+    """
+    Per-game sequence numbers and a bounded buffer of recent outbound events.
+
+    Every broadcast gets the next sequence number. A socket reconnecting with
+    the last sequence number it saw is sent only the events it missed, as
+    long as they are still in the buffer.
+    """
+
+    def __init__(self, size):
+        self.seq = 0
+        self.events = deque(maxlen=size)
+
+    def record(self, group, message):
+        """Stamp a message with the next sequence number and keep it for replay"""
+        self.seq += 1
+        message = dict(message, seq=self.seq)
+        self.events.append((self.seq, group, message))
+        return message
+
+    def since(self, last_seq, group):
+        """
+        Events of `group` after `last_seq`, or None when the client is too far
+        behind (or ahead, e.g. after a restart) and needs a full snapshot.
+        """
+        if last_seq > self.seq:
+            return None
+        if last_seq == self.seq:
+            return []
+        if not self.events or self.events[0][0] > last_seq + 1:
+            return None
+        return [message for seq, event_group, message in self.events if seq > last_seq and event_group == group]
@@ -1,7 +1,8 @@
 from django.urls import re_path
-from .consumers import GameSessionConsumer, GameRoomConsumer
+from .consumers import GameSessionConsumer, GameRoomConsumer, SpectatorConsumer
 
 websocket_urlpatterns = [
     re_path(r'ws/quiz/(?P<game_pin>\w+)/lobby/$', GameSessionConsumer.as_asgi()),
     re_path(r'^ws/game/(?P<game_pin>\w+)/play/$', GameRoomConsumer.as_asgi()),
+    re_path(r'^ws/game/(?P<game_pin>\w+)/spectate/$', SpectatorConsumer.as_asgi()),
 ]
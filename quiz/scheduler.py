@@ -0,0 +1,89 @@
+import asyncio
+import heapq
+import itertools
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class RoundScheduler:
+    """
+    Owns the deadlines of every active game in this worker.
+
+    Deadlines are absolute loop.time() values kept in a heap; a single
+    loop.call_at handle is armed for the earliest one, so there is no
+    sleeping task per game and late wake-ups do not accumulate drift.
+    Each key (the game pin) has at most one pending deadline.
+    """
+
+    def __init__(self):
+        self._heap = []
+        self._entries = {}
+        self._counter = itertools.count()
+        self._handle = None
+        self._armed_at = None
+        self._loop = None
+        self._tasks = set()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def schedule(self, key, when, callback):
+        """Run `callback()` (a coroutine function) at loop time `when`, replacing any deadline for `key`"""
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            # Deadlines never outlive the loop they were scheduled on
+            self._heap, self._entries = [], {}
+            self._handle = self._armed_at = None
+            self._loop = loop
+        seq = next(self._counter)
+        self._entries[key] = (when, seq, callback)
+        heapq.heappush(self._heap, (when, seq, key))
+        if self._armed_at is None or when < self._armed_at:
+            self._arm(when)
+
+    def schedule_in(self, key, delay, callback):
+        loop = asyncio.get_running_loop()
+        self.schedule(key, loop.time() + delay, callback)
+
+    def cancel(self, key):
+        # The heap entry is discarded lazily when it reaches the top
+        self._entries.pop(key, None)
+
+    def _arm(self, when):
+        if self._handle is not None:
+            self._handle.cancel()
+        self._armed_at = when
+        self._handle = self._loop.call_at(when, self._fire)
+
+    def _fire(self):
+        self._handle = None
+        self._armed_at = None
+        now = self._loop.time()
+
+        while self._heap and self._heap[0][0] <= now:
+            when, seq, key = heapq.heappop(self._heap)
+            entry = self._entries.get(key)
+            if entry is None or entry[1] != seq:
+                continue
+            del self._entries[key]
+            task = asyncio.ensure_future(entry[2]())
+            self._tasks.add(task)
+            task.add_done_callback(self._task_done)
+
+        # Drop cancelled entries so the next arm targets a live deadline
+        while self._heap:
+            when, seq, key = self._heap[0]
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] == seq:
+                self._arm(when)
+                break
+            heapq.heappop(self._heap)
+
+    def _task_done(self, task):
+        self._tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error("Scheduled game callback failed", exc_info=task.exception())
+
+
+scheduler = RoundScheduler()
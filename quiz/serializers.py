@@ -1,5 +1,7 @@
+from django.db.models import Count, F, Prefetch
 from rest_framework import serializers
 from .models import Quiz, Player, GameSession, Answer
+from question.models import Question
 from question.serializers import QuestionSerializer
 
 
@@ -15,10 +17,39 @@ class QuizSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'created_by', 'created_by_username', 'question_count', 'organization', 'created_at',
                             'updated_at']
 
+    @staticmethod
+    def setup_eager_loading(queryset):
+        """Load creators and questions up front so serializing many quizzes costs a fixed number of queries"""
+        return queryset.select_related('created_by').prefetch_related(
+            Prefetch('questions', queryset=Question.objects.select_related('created_by'))
+        )
+
     def get_question_count(self, obj):
+        # Served from the prefetched questions when the view used setup_eager_loading
+        if 'questions' in getattr(obj, '_prefetched_objects_cache', {}):
+            return len(obj.questions.all())
         return obj.questions.count()
 
 
+class QuizSummarySerializer(serializers.ModelSerializer):
+    """List representation: no questions, counts and creator come from setup_summary's annotations"""
+    created_by_username = serializers.CharField(read_only=True)
+    question_count = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = Quiz
+        fields = ['id', 'name', 'difficulty', 'tags', 'question_count', 'created_by_username']
+        read_only_fields = fields
+
+    @staticmethod
+    def setup_summary(queryset):
+        """Select only the summary columns, with question count and creator joined in the same query"""
+        return queryset.only('id', 'name', 'difficulty', 'tags').annotate(
+            question_count=Count('questions'),
+            created_by_username=F('created_by__username')
+        )
+
+
 class AuthenticatedPlayerSerializer(serializers.ModelSerializer):
     email = serializers.EmailField(source='user.email', read_only=True)
     date_joined = serializers.DateTimeField(source='user.date_joined', read_only=True)
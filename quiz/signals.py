@@ -0,0 +1,11 @@
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+from .guest_tokens import revoke_guest_tokens
+from .models import Player
+
+
+@receiver(post_delete, sender=Player)
+def revoke_deleted_guest(sender, instance, **kwargs):
+    """Tokens of a deleted guest must stop working before they expire"""
+    if instance.is_guest and instance.guest_id:
+        revoke_guest_tokens(instance.guest_id)
@@ -0,0 +1,180 @@
+import logging
+import threading
+from dataclasses import dataclass, field
+from types import MappingProxyType
+from django.conf import settings
+from core.cache import TTLCache
+from .models import GameSession
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class QuestionSnapshot:
+    """Read-only copy of one question, including its answer key"""
+    id: int
+    text: str
+    options: tuple
+    correct_answer: str
+    correct_index: int = None
+    image: str = None
+
+    def is_correct(self, option):
+        """Check a submitted option index against the compiled answer key"""
+        return self.correct_index is not None and option == self.correct_index
+
+    def row(self):
+        """Question as stored with a started game, compiled again by compile_question"""
+        return {
+            'id': self.id,
+            'text': self.text,
+            'options': list(self.options),
+            'correct_answer': self.correct_answer,
+            'image': self.image,
+        }
+
+    def public(self):
+        """Question as shown to players, without the answer key"""
+        return {
+            'text': self.text,
+            'options': list(self.options),
+            'image': self.image,
+        }
+
+
+@dataclass(frozen=True)
+class QuizSnapshot:
+    """
+    Quiz details and question set of one game, frozen for the game's lifetime.
+
+    Questions are kept in the game's question_order, so edits made to the
+    quiz while a game is running never reach that game.
+    """
+    game_session_id: int
+    pin: str
+    quiz_id: int
+    name: str
+    description: str
+    difficulty: str
+    host_id: int
+    host_username: str
+    questions: tuple
+    # Built from the questions stored when the game started rather than the quiz
+    frozen: bool = False
+    by_id: MappingProxyType = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        object.__setattr__(self, 'by_id', MappingProxyType({question.id: question for question in self.questions}))
+
+    @property
+    def question_order(self):
+        return [question.id for question in self.questions]
+
+    @property
+    def total_questions(self):
+        return len(self.questions)
+
+    def question(self, index):
+        """Question at a position in the game, None when out of range"""
+        if 0 <= index < len(self.questions):
+            return self.questions[index]
+        return None
+
+    def info(self):
+        """Quiz details shown before joining and in the lobby"""
+        return {
+            'quiz_name': self.name,
+            'quiz_description': self.description,
+            'difficulty': self.difficulty,
+            'host_username': self.host_username,
+            'total_questions': self.total_questions,
+        }
+
+
+def build_snapshot(game):
+    """
+    Read the quiz and its questions for a game session, ordered by question_order.
+    A started game uses the questions stored with it, not the quiz's current ones.
+    """
+    frozen = game.question_snapshot is not None
+    if frozen:
+        rows = {row['id']: row for row in game.question_snapshot}
+    else:
+        rows = {
+            row['id']: row
+            for row in game.quiz.questions.values('id', 'text', 'options', 'correct_answer', 'image')
+        }
+    order = [question_id for question_id in game.question_order if question_id in rows] or sorted(rows)
+    questions = tuple(compile_question(rows[question_id]) for question_id in order)
+    return QuizSnapshot(
+        game_session_id=game.id,
+        pin=game.pin,
+        quiz_id=game.quiz.id,
+        name=game.quiz.name,
+        description=game.quiz.description,
+        difficulty=game.quiz.difficulty,
+        host_id=game.host.id,
+        host_username=game.host.username,
+        questions=questions,
+        frozen=frozen,
+    )
+
+
+def compile_question(row):
+    """Turn a question row into a snapshot with the correct answer as an option index"""
+    options = tuple(row['options'] or ())
+    try:
+        correct_index = options.index(row['correct_answer'])
+    except ValueError:
+        logger.warning("Question %s has no option matching its correct answer", row['id'])
+        correct_index = None
+    return QuestionSnapshot(
+        id=row['id'],
+        text=row['text'],
+        options=options,
+        correct_answer=row['correct_answer'],
+        correct_index=correct_index,
+        image=row['image'],
+    )
+
+
+_snapshots = TTLCache(maxsize=settings.QUIZ_SNAPSHOT_CACHE_SIZE, ttl=settings.QUIZ_SNAPSHOT_CACHE_SECONDS)
+_lock = threading.Lock()
+
+
+def get_snapshot(pin, game=None):
+    """
+    Snapshot for a game pin, built from the database the first time the game
+    is used in this process and shared by every consumer and view after that.
+    The registry is bounded: a loaded engine holds on to its own snapshot,
+    anything else is rebuilt once evicted.
+
+    Synchronous: call it from a database thread. Pass `game` to reuse a
+    GameSession that was already fetched (ideally with quiz and host joined);
+    a snapshot taken before that game started is then replaced by its frozen one.
+    Raises GameSession.DoesNotExist for unknown pins.
+    """
+    with _lock:
+        snapshot = _snapshots.get(pin)
+    if snapshot is not None and (snapshot.frozen or game is None or game.question_snapshot is None):
+        return snapshot
+    if game is None:
+        game = GameSession.objects.select_related('quiz', 'host').get(pin=pin)
+    snapshot = build_snapshot(game)
+    with _lock:
+        existing = _snapshots.get(pin)
+        if existing is not None and existing.frozen >= snapshot.frozen:
+            return existing
+        _snapshots.set(pin, snapshot)
+    return snapshot
+
+
+def set_snapshot(pin, snapshot):
+    """Share the snapshot a game was started with, replacing any earlier one"""
+    with _lock:
+        _snapshots.set(pin, snapshot)
+
+
+def drop_snapshot(pin):
+    with _lock:
+        _snapshots.pop(pin)
@@ -0,0 +1,47 @@
+import asyncio
+from django.conf import settings
+from . import fanout
+
+
+class SpectatorFeed:
+    """
+    Read-only game state for projectors and stream overlays.
+
+    Spectators get a full aggregated state (question, countdown, top of the
+    leaderboard) rather than every game event. Changes are coalesced: the
+    first change after a quiet period is pushed right away, later ones at
+    most once per interval, and nothing is built while no spectator is
+    connected to this worker.
+    """
+
+    def __init__(self, engine, interval=None):
+        self.engine = engine
+        self.group_name = engine.spectator_group_name
+        self.interval = settings.QUIZ_SPECTATOR_UPDATE_SECONDS if interval is None else interval
+        self._last = None
+        self._handle = None
+
+    def touch(self):
+        """Note that the game changed, spectators see it within one interval"""
+        if self._handle is not None or not self.watched():
+            return
+        loop = asyncio.get_running_loop()
+        delay = 0 if self._last is None else max(self._last + self.interval - loop.time(), 0)
+        self._handle = loop.call_later(delay, self._push)
+
+    def watched(self):
+        """Whether a spectator is connected here or to a worker hosting sockets for the game"""
+        if fanout.local_size(self.group_name):
+            return True
+        return any(remote['spectators'] for remote in self.engine.remotes.values())
+
+    def _push(self):
+        self._handle = None
+        self._last = asyncio.get_running_loop().time()
+        asyncio.ensure_future(self.engine.send(self.group_name, self.message()))
+
+    def message(self):
+        return {
+            'type': 'spectator_state',
+            'data': self.engine.spectator_payload()
+        }
@@ -1,3 +1,1610 @@
-from django.test import TestCase
+import asyncio
+import contextvars
+import json
+import os
+import tempfile
+import time
+from collections.abc import MutableMapping
+from contextlib import contextmanager
+from io import StringIO
+from types import SimpleNamespace
+from unittest import mock
+import msgpack
+from asgiref.sync import async_to_sync
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from channels.testing import HttpCommunicator, WebsocketCommunicator
+from django.contrib.auth.models import AnonymousUser
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.core.cache import cache
+from django.core.management import call_command
+from django.conf import settings
+from django.db import DatabaseError, connection
+from django.urls import reverse
+from rest_framework.test import APIClient
+from core.cache import TTLCache
+from core.channel_layers import LocalBrokerChannelLayer
+from core.instrumentation import database_sync_to_async as instrumented_sync_to_async
+from core.middleware import GuestPlayerMiddleware
+from core.testing import QueryBudgetMixin, shared_cache
+from DyneQuiz.asgi import application
+from members.models import User
+from members.tokens import create_jwt_pair_for_user
+from organization.models import Organization, OrganizationMembership
+from question.models import Question
+from .answer_buffer import AnswerBuffer, spool_answers, write_answers
+from .answer_stats import AnswerStats
+from .consumers import identity_cache
+from . import fanout, snapshot
+from .engine import GameEngine, GameStateError, RemoteEngine, drop_engine, get_engine
+from .engine import _engines as engine_registry
+from .frames import FrameCache, frame_cache
+from .game_logic import ASYNC_SCORING_THRESHOLD, calculate_score, score_round, score_round_async
+from .guest_tokens import issue_guest_token, read_guest_token, revoke_guest_tokens
+from .leaderboard import Leaderboard
+from .models import Answer, Quiz, GameSession, Player
+from .protocol import JSON, MSGPACK, MSGPACK_SUBPROTOCOL, TYPE_TAGS, negotiate_codec
+from .scheduler import RoundScheduler
+from .spectate import SpectatorFeed
+from .serializers import QuizSerializer
+from .snapshot import drop_snapshot
 
-# Create your tests here.
+
+def create_member(name, organization=None, role='admin'):
+    user = User.objects.create_user(email=f"{name}@example.com", username=name, password='password')
+    organization = organization or Organization.objects.create(name=f"{name} org")
+    OrganizationMembership.objects.create(user=user, organization=organization, role=role)
+    return user
+
+
+def add_questions(quiz, count):
+    quiz.questions.add(*[
+        Question.objects.create(
+            text=f"Question {number}", options=['A', 'B', 'C'], correct_answer='A',
+            created_by=quiz.created_by, organization=quiz.organization
+        )
+        for number in range(count)
+    ])
+
+
+def create_quiz(user, questions=3):
+    quiz = Quiz.objects.create(
+        name='Quiz', description='Quiz', created_by=user,
+        organization=user.organizationmembership.organization
+    )
+    add_questions(quiz, questions)
+    return quiz
+
+
+def create_guests(count):
+    return [Player.objects.create(username=f"guest{number}", is_guest=True) for number in range(count)]
+
+
+def guest_cookie(guest):
+    return (b'cookie', f"guest_token={issue_guest_token(guest)[0]}".encode())
+
+
+@shared_cache
+class QuizQueryBudgetTests(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        self.user = create_member('host')
+        self.client = APIClient()
+        # Memberships were just created: forget that, as if the token came later
+        cache.clear()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {create_jwt_pair_for_user(self.user)['access']}")
+
+    def test_quiz_list(self):
+        create_quiz(self.user)
+        response = self.assertQueryBudget(
+            1,
+            lambda: self.client.get(reverse('list_quiz')),
+            grow=lambda: [create_quiz(self.user, questions=5) for _ in range(5)]
+        )
+        self.assertEqual(len(response.data['data']), 6)
+        self.assertEqual(response.data['data'][0]['question_count'], 5)
+        self.assertEqual(response.data['data'][-1]['question_count'], 3)
+        self.assertEqual(response.data['data'][0]['created_by_username'], 'host')
+        self.assertNotIn('questions', response.data['data'][0])
+
+    def test_quiz_list_pages(self):
+        quizzes = [create_quiz(self.user, questions=1) for _ in range(3)]
+        first = self.client.get(reverse('list_quiz'), {'page_size': 2})
+        self.assertEqual([quiz['id'] for quiz in first.data['data']], [quizzes[2].id, quizzes[1].id])
+        self.assertIsNone(first.data['previous'])
+        second = self.assertQueryBudget(1, lambda: self.client.get(first.data['next']))
+        self.assertEqual([quiz['id'] for quiz in second.data['data']], [quizzes[0].id])
+        self.assertIsNone(second.data['next'])
+
+    def test_quiz_detail(self):
+        quiz = create_quiz(self.user)
+        response = self.assertQueryBudget(
+            2,
+            lambda: self.client.get(reverse('quiz-detail', args=[quiz.id])),
+            grow=lambda: add_questions(quiz, 10)
+        )
+        self.assertEqual(response.data['question_count'], 13)
+
+    def test_question_count_without_prefetch(self):
+        quiz = Quiz.objects.get(pk=create_quiz(self.user, questions=5).pk)
+        with self.assertNumQueries(1):
+            self.assertEqual(QuizSerializer().get_question_count(quiz), 5)
+
+
+class GameSessionQueryBudgetTests(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        self.host = create_member('host')
+        self.quiz = create_quiz(self.host)
+        self.game = GameSession.objects.create(quiz=self.quiz, host=self.host)
+        self.url = reverse('game-session-detail', args=[self.game.pin])
+
+    def tearDown(self):
+        drop_snapshot(self.game.pin)
+
+    def test_game_session_detail(self):
+        # The first request builds the game's snapshot, later ones are served from it
+        self.assertQueryBudget(4, lambda: self.client.get(self.url))
+        response = self.assertQueryBudget(
+            1,
+            lambda: self.client.get(self.url),
+            grow=lambda: self.game.players.add(*create_guests(10))
+        )
+        self.assertEqual(response.data['quiz']['question_count'], 3)
+        self.assertEqual(response.data['player_count'], 10)
+
+    def test_snapshot_registry_is_bounded(self):
+        games = [GameSession.objects.create(quiz=self.quiz, host=self.host) for _ in range(3)]
+        with mock.patch.object(snapshot, '_snapshots', TTLCache(maxsize=2, ttl=60)) as snapshots:
+            for game in games:
+                self.client.get(reverse('game-session-detail', args=[game.pin]))
+            self.assertEqual(len(snapshots), 2)
+            self.assertIsNone(snapshots.get(games[0].pin))
+            self.assertEqual(self.client.get(reverse('game-session-detail', args=[games[0].pin])).status_code, 200)
+
+
+class HostGameSessionTests(TestCase):
+    def setUp(self):
+        self.host = create_member('host')
+        self.quiz = create_quiz(self.host)
+        self.client = APIClient()
+        self.client.force_authenticate(self.host)
+
+    def create(self, **data):
+        return self.client.post(reverse('create-game-session', args=[self.quiz.id]), data, format='json')
+
+    def test_game_type_is_stored(self):
+        response = self.create(game_type='accuracy')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(GameSession.objects.get(pin=response.data['data']['pin']).game_type, 'accuracy')
+
+    def test_team_games_are_refused(self):
+        response = self.create(game_type='team')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(GameSession.objects.exists())
+
+
+@shared_cache
+class WebsocketConnectQueryBudgetTests(QueryBudgetMixin, TransactionTestCase):
+    """
+    Query budgets of the websocket connect paths. Each measured step opens and
+    closes its sockets inside one event loop; database work of the consumers
+    runs on this thread, so it is captured.
+    """
+
+    def setUp(self):
+        identity_cache.clear()
+        self.host = create_member('host')
+        self.quiz = create_quiz(self.host)
+        self.game = GameSession.objects.create(quiz=self.quiz, host=self.host)
+        self.token = create_jwt_pair_for_user(self.host)['access']
+        self.guests = create_guests(3)
+
+    def tearDown(self):
+        drop_engine(self.game.pin)
+        identity_cache.clear()
+
+    def lobby_path(self):
+        return f"/ws/quiz/{self.game.pin}/lobby/"
+
+    async def open(self, path, guest=None, greeting='lobby_snapshot'):
+        headers = [guest_cookie(guest)] if guest else []
+        communicator = WebsocketCommunicator(application, path, headers=headers)
+        connected, code = await communicator.connect()
+        self.assertTrue(connected, code)
+        while (await communicator.receive_json_from())['type'] != greeting:
+            pass
+        return communicator
+
+    def connect(self, path, guest=None, greeting='lobby_snapshot'):
+        async def connect_and_close():
+            communicator = await self.open(path, guest, greeting)
+            await communicator.disconnect()
+        async_to_sync(connect_and_close)()
+
+    def reload(self):
+        drop_engine(self.game.pin)
+        identity_cache.clear()
+
+    def test_first_connect_loads_game(self):
+        self.assertQueryBudget(
+            3,
+            lambda: self.connect(self.lobby_path(), self.guests[0]),
+            grow=lambda: (add_questions(self.quiz, 20), self.reload())
+        )
+
+    def test_connect_to_loaded_game(self):
+        self.connect(self.lobby_path(), self.guests[0])
+        # Guests are identified by their signed token alone
+        self.assertQueryBudget(0, lambda: self.connect(self.lobby_path(), self.guests[1]))
+
+    def test_host_connect(self):
+        self.connect(self.lobby_path(), self.guests[0])
+        self.assertQueryBudget(1, lambda: self.connect(f"{self.lobby_path()}?token={self.token}"))
+
+    def test_game_room_connect(self):
+        async def start():
+            players = [await self.open(self.lobby_path(), guest) for guest in self.guests]
+            host = await self.open(f"{self.lobby_path()}?token={self.token}")
+            await host.send_json_to({'type': 'start_game'})
+            while (await host.receive_json_from())['type'] != 'game_started':
+                pass
+            for communicator in players + [host]:
+                await communicator.disconnect()
+        async_to_sync(start)()
+
+        room = f"/ws/game/{self.game.pin}/play/"
+        self.assertQueryBudget(0, lambda: self.connect(room, self.guests[0], greeting='game_state'))
+        self.reload()
+        self.assertQueryBudget(3, lambda: self.connect(room, self.guests[1], greeting='game_state'))
+
+
+@override_settings(
+    QUERY_INSTRUMENTATION=True,
+    QUERY_INSTRUMENTATION_SAMPLE_RATE=0,
+    QUERY_INSTRUMENTATION_SLOW_MS=60000,
+    MIDDLEWARE=['core.middleware.QueryInstrumentationMiddleware', *settings.MIDDLEWARE]
+)
+class QueryInstrumentationTests(TransactionTestCase):
+    def setUp(self):
+        host = create_member('host')
+        self.game = GameSession.objects.create(quiz=create_quiz(host), host=host)
+        self.url = reverse('game-session-detail', args=[self.game.pin])
+
+    def tearDown(self):
+        drop_snapshot(self.game.pin)
+
+    def records(self, logs):
+        return [json.loads(record.getMessage()) for record in logs.records]
+
+    def test_server_timing_header(self):
+        with self.assertNoLogs('core.instrumentation'), CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url)
+        self.assertRegex(
+            response['Server-Timing'],
+            rf'^db;desc="{len(queries)} queries";dur=\d+\.\d{{2}}, db-slowest;dur=\d+\.\d{{2}}$'
+        )
+
+    def test_sampled_requests_are_logged(self):
+        with override_settings(QUERY_INSTRUMENTATION_SAMPLE_RATE=1), self.assertLogs('core.instrumentation') as logs:
+            self.client.get(self.url)
+        record, = self.records(logs)
+        self.assertEqual(
+            (record['source'], record['name'], record['method'], record['status'], record['slow']),
+            ('http', 'game-session-detail', 'GET', 200, False)
+        )
+        self.assertGreater(record['queries'], 0)
+        self.assertTrue(record['slowest_sql'].startswith('SELECT'))
+
+    def test_slow_requests_are_always_logged(self):
+        with override_settings(QUERY_INSTRUMENTATION_SLOW_MS=0), self.assertLogs('core.instrumentation') as logs:
+            self.client.get(self.url)
+        record, = self.records(logs)
+        self.assertEqual((record['name'], record['slow']), ('game-session-detail', True))
+
+    @override_settings(QUERY_INSTRUMENTATION_SAMPLE_RATE=1)
+    def test_consumer_calls_are_logged(self):
+        count_players = instrumented_sync_to_async(lambda: Player.objects.count(), name='count_players')
+        with self.assertLogs('core.instrumentation') as logs:
+            self.assertEqual(async_to_sync(count_players)(), 0)
+        record, = self.records(logs)
+        self.assertEqual(
+            (record['source'], record['name'], record['queries'], record['slow']),
+            ('ws', 'count_players', 1, False)
+        )
+        self.assertIn('quiz_player', record['slowest_sql'])
+
+
+@override_settings(METRICS_PATH='/metrics', METRICS_COLLECT_SECONDS=0)
+class MetricsEndpointTests(TransactionTestCase):
+    def setUp(self):
+        identity_cache.clear()
+        self.host = create_member('host')
+        self.game = GameSession.objects.create(quiz=create_quiz(self.host), host=self.host)
+        self.guest = create_guests(1)[0]
+
+    def tearDown(self):
+        drop_engine(self.game.pin)
+        identity_cache.clear()
+
+    def test_connect_phases_are_exported(self):
+        async def connect_and_scrape():
+            communicator = WebsocketCommunicator(
+                application, f"/ws/quiz/{self.game.pin}/lobby/",
+                headers=[guest_cookie(self.guest)]
+            )
+            connected, code = await communicator.connect()
+            self.assertTrue(connected, code)
+            await communicator.disconnect()
+            scrape = HttpCommunicator(application, 'GET', '/metrics')
+            return await scrape.get_response()
+
+        response = async_to_sync(connect_and_scrape)()
+        self.assertEqual(response['status'], 200)
+        body = response['body'].decode()
+        for phase in ('auth', 'quiz_info', 'group_add'):
+            self.assertIn(
+                f'dynequiz_ws_connect_phase_seconds_count{{consumer="GameSessionConsumer",phase="{phase}"}}', body
+            )
+        self.assertIn('# TYPE dynequiz_event_loop_lag_seconds histogram', body)
+
+    def test_process_gauges_are_exported(self):
+        async def scrape_while_connected():
+            communicator = WebsocketCommunicator(
+                application, f"/ws/quiz/{self.game.pin}/lobby/",
+                headers=[guest_cookie(self.guest)]
+            )
+            connected, code = await communicator.connect()
+            self.assertTrue(connected, code)
+            # The lobby accepts before joining its group: wait until the connect is done
+            while (await communicator.receive_json_from())['type'] != 'lobby_snapshot':
+                pass
+            scrape = HttpCommunicator(application, 'GET', '/metrics')
+            response = await scrape.get_response()
+            await communicator.disconnect()
+            return response
+
+        APIClient().get(reverse('game-session-detail', args=[self.game.pin]))
+        body = async_to_sync(scrape_while_connected)()['body'].decode()
+        for sample in (
+            'dynequiz_active_game_sessions{state="lobby"} 1',
+            'dynequiz_games_loaded{state="lobby"} 1',
+            'dynequiz_group_sockets{kind="quiz"} 1',
+            'dynequiz_channel_layer_queue_depth{queue="local"}',
+            'dynequiz_db_executor_busy_threads 0',
+            'dynequiz_db_connections_open',
+            'dynequiz_http_requests_total{view="game-session-detail",method="GET",status="200"}',
+        ):
+            self.assertIn(sample, body)
+
+
+class MetricsAccessTests(TransactionTestCase):
+    def scrape(self, headers=(), client=None):
+        async def get():
+            # Falls through to Django when disabled, which checks the host
+            communicator = HttpCommunicator(
+                application, 'GET', '/metrics', headers=[(b'host', b'testserver'), *headers]
+            )
+            if client:
+                communicator.scope['client'] = (client, 40000)
+            return await communicator.get_response()
+        return async_to_sync(get)()['status']
+
+    def test_disabled_by_default(self):
+        with self.assertLogs('django.request', 'WARNING'):
+            self.assertEqual(self.scrape(), 404)
+
+    @override_settings(METRICS_PATH='/metrics', METRICS_TOKEN='secret')
+    def test_requires_token(self):
+        self.assertEqual(self.scrape(), 401)
+        self.assertEqual(self.scrape([(b'authorization', b'Bearer wrong')]), 401)
+        self.assertEqual(self.scrape([(b'authorization', b'Bearer secret')]), 200)
+
+    @override_settings(METRICS_PATH='/metrics', METRICS_ALLOWED_IPS=['10.0.0.5'])
+    def test_requires_allowed_address(self):
+        self.assertEqual(self.scrape(), 403)
+        self.assertEqual(self.scrape(client='10.0.0.6'), 403)
+        self.assertEqual(self.scrape(client='10.0.0.5'), 200)
+
+
+@shared_cache
+class GuestTokenTests(TestCase):
+    def setUp(self):
+        self.guest = create_guests(1)[0]
+
+    def test_create_guest_sets_signed_cookie(self):
+        response = APIClient().post(reverse('create-guest-player'), {'username': 'newcomer'}, format='json')
+        self.assertEqual(response.status_code, 201)
+        claims = read_guest_token(response.cookies['guest_token'].value)
+        self.assertEqual(claims['player_id'], response.data['player_id'])
+        self.assertEqual(claims['username'], 'newcomer')
+
+    def test_rejects_tampered_expired_and_revoked_tokens(self):
+        token, _ = issue_guest_token(self.guest)
+        self.assertEqual(read_guest_token(token)['player_id'], self.guest.id)
+        self.assertIsNone(read_guest_token(token[:-1]))
+        self.assertIsNone(read_guest_token(self.guest.guest_id))
+        with override_settings(GUEST_TOKEN_LIFETIME_SECONDS=-1):
+            self.assertIsNone(read_guest_token(issue_guest_token(self.guest)[0]))
+        revoke_guest_tokens(self.guest.guest_id)
+        self.assertIsNone(read_guest_token(token))
+
+    def test_deleting_a_guest_revokes_its_tokens(self):
+        token, _ = issue_guest_token(self.guest)
+        self.guest.delete()
+        self.assertIsNone(read_guest_token(token))
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_per_process_cache_checks_the_database(self):
+        token, _ = issue_guest_token(self.guest)
+        with self.assertNumQueries(1):
+            self.assertEqual(read_guest_token(token)['player_id'], self.guest.id)
+        # Deleted through another worker: the revocation never reaches this process
+        self.guest.delete()
+        cache.clear()
+        self.assertIsNone(read_guest_token(token))
+
+    def test_middleware_loads_the_player_only_when_read(self):
+        request = RequestFactory().get('/')
+        request.user = AnonymousUser()
+        request.COOKIES['guest_token'] = issue_guest_token(self.guest)[0]
+        middleware = GuestPlayerMiddleware(lambda request: request)
+        with self.assertNumQueries(0):
+            middleware(request)
+        self.assertEqual(request.guest_claims['player_id'], self.guest.id)
+        with self.assertNumQueries(1):
+            self.assertEqual(request.guest_player.username, self.guest.username)
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_middleware_checks_revocation_when_the_player_is_read(self):
+        request = RequestFactory().get('/')
+        request.user = AnonymousUser()
+        request.COOKIES['guest_token'] = issue_guest_token(self.guest)[0]
+        self.guest.delete()
+        with self.assertNumQueries(0):
+            GuestPlayerMiddleware(lambda request: request)(request)
+        with self.assertRaises(Player.DoesNotExist):
+            request.guest_player.username
+
+
+class CodecTests(SimpleTestCase):
+    message = {'type': 'submit_answer', 'answer': 2, 'question_id': 7}
+
+    def test_round_trip(self):
+        self.assertEqual(JSON.decode(text_data=JSON.encode(self.message)), self.message)
+        self.assertEqual(MSGPACK.decode(bytes_data=MSGPACK.encode(self.message)), self.message)
+
+    def test_msgpack_uses_integer_tags(self):
+        self.assertEqual(msgpack.unpackb(MSGPACK.encode(self.message))[0], TYPE_TAGS['submit_answer'])
+        untagged = {'type': 'custom', 'value': 1}
+        self.assertEqual(MSGPACK.decode(bytes_data=MSGPACK.encode(untagged)), untagged)
+
+    def test_negotiation(self):
+        self.assertIs(negotiate_codec(None), JSON)
+        self.assertIs(negotiate_codec(['token-auth']), JSON)
+        self.assertIs(negotiate_codec(['token-auth', MSGPACK_SUBPROTOCOL]), MSGPACK)
+
+    def test_bad_frames_raise_value_error(self):
+        for text in ['[1, 2]', 'not json', '"type"']:
+            with self.subTest(text=text), self.assertRaises(ValueError):
+                JSON.decode(text_data=text)
+
+        frames = [
+            msgpack.packb([[1], {}]),
+            msgpack.packb([{'a': 1}, {}]),
+            msgpack.packb([1.5, {}]),
+            msgpack.packb([True, {}]),
+            msgpack.packb([1, {}, 2]),
+            msgpack.packb([1, [2]]),
+            msgpack.packb({'type': 1}),
+            msgpack.packb([1, {1: 'x'}]),
+            b'\xc1',
+            msgpack.packb([1, {}]) + b'\x00',
+        ]
+        for frame in frames:
+            with self.subTest(frame=frame), self.assertRaises(ValueError):
+                MSGPACK.decode(bytes_data=frame)
+        with self.assertRaises(ValueError):
+            MSGPACK.decode(text_data='{}')
+
+
+class BadFrameTests(TransactionTestCase):
+    def setUp(self):
+        identity_cache.clear()
+        self.host = create_member('host')
+        self.game = GameSession.objects.create(quiz=create_quiz(self.host), host=self.host)
+        self.guest = create_guests(1)[0]
+
+    def tearDown(self):
+        drop_engine(self.game.pin)
+        identity_cache.clear()
+
+    def test_bad_frame_keeps_the_socket_open(self):
+        async def run():
+            communicator = WebsocketCommunicator(
+                application, f"/ws/quiz/{self.game.pin}/lobby/",
+                headers=[guest_cookie(self.guest)], subprotocols=[MSGPACK_SUBPROTOCOL]
+            )
+            connected, _ = await communicator.connect()
+            self.assertTrue(connected)
+            while MSGPACK.decode(bytes_data=await communicator.receive_from())['type'] != 'lobby_snapshot':
+                pass
+            for frame in [msgpack.packb([[1], {}]), b'\xc1']:
+                await communicator.send_to(bytes_data=frame)
+                reply = MSGPACK.decode(bytes_data=await communicator.receive_from())
+                self.assertEqual(reply['type'], 'error')
+            await communicator.disconnect()
+        async_to_sync(run)()
+
+
+class ScoringTests(SimpleTestCase):
+    def test_classic_matches_calculate_score(self):
+        response_times = [0, 0.001, 0.5, 7.25, 14.999, 15, 29.9, 30, 30.5, 45]
+        for max_time in (10, 20, 30):
+            with self.subTest(max_time=max_time):
+                self.assertEqual(
+                    score_round('classic', [True] * len(response_times), response_times, max_time=max_time),
+                    [calculate_score(max_time - response_time, max_time) for response_time in response_times]
+                )
+        self.assertEqual(score_round('classic', [True, False], [1, 1]), [98, 0])
+
+    def test_accuracy_ignores_speed(self):
+        self.assertEqual(score_round('accuracy', [True, False, True], [0, 1, 29], base_points=50), [50, 0, 50])
+
+    def test_team_average_counts_members_who_did_not_answer(self):
+        # Team 1 has three members and two answers, team 2 answered in full
+        deltas = score_round(
+            'team', [True, True, True, False], [0, 30, 0, 1],
+            team_ids=[1, 1, 2, 2], team_sizes={1: 3, 2: 2}
+        )
+        self.assertEqual(deltas, [33, 33, 50, 50])
+
+    def test_team_needs_teams_and_unknown_types_are_rejected(self):
+        for game_type, teams in (('team', {}), ('team', {'team_ids': [1]}), ('speed', {})):
+            with self.subTest(game_type=game_type, teams=teams), self.assertRaises(ValueError):
+                score_round(game_type, [True], [1], **teams)
+
+    def test_large_rounds_score_the_same_off_the_loop(self):
+        count = ASYNC_SCORING_THRESHOLD + 1
+        correct = [number % 3 != 0 for number in range(count)]
+        response_times = [number % 31 for number in range(count)]
+        self.assertEqual(
+            async_to_sync(score_round_async)('classic', correct, response_times),
+            score_round('classic', correct, response_times)
+        )
+
+
+class LeaderboardTests(SimpleTestCase):
+    def setUp(self):
+        self.board = Leaderboard()
+        for player_id, score in [(1, 50), (2, 80), (3, 50), (4, 10), (5, 80)]:
+            self.board.add(player_id, score)
+
+    def test_ties_share_a_rank(self):
+        self.assertEqual([self.board.rank(player_id) for player_id in (2, 5, 1, 3, 4)], [1, 1, 3, 3, 5])
+        self.assertFalse(self.board.add(1, 100))
+        self.assertEqual(self.board.score(1), 50)
+
+    def test_top_keeps_join_order_within_ties(self):
+        self.assertEqual(self.board.top(3), [(2, 80), (5, 80), (1, 50)])
+        self.assertEqual(len(self.board.top(10)), 5)
+
+    def test_around_stops_at_the_edges(self):
+        self.assertEqual(self.board.around(2), [(2, 80), (5, 80), (1, 50)])
+        self.assertEqual(self.board.around(4), [(1, 50), (3, 50), (4, 10)])
+        self.assertEqual(self.board.around(1, radius=1), [(5, 80), (1, 50), (3, 50)])
+
+    def test_remove(self):
+        self.board.remove(2)
+        self.board.remove(99)
+        self.assertNotIn(2, self.board)
+        self.assertEqual(self.board.top(2), [(5, 80), (1, 50)])
+        self.assertEqual(self.board.rank(5), 1)
+
+    def test_apply_few_changes_moves_single_entries(self):
+        board = Leaderboard()
+        for player_id in range(20):
+            board.add(player_id, player_id)
+        self.assertEqual(board.apply({0: 100, 5: 0, 99: 10}), {0: 100})
+        self.assertEqual(board.top(2), [(0, 100), (19, 19)])
+        self.assertEqual(board.rank(5), 16)
+        self.assertEqual(board._keys, sorted(board._keys))
+
+    def test_apply_many_changes_resorts(self):
+        changed = self.board.apply({1: 40, 3: 10, 4: 100, 2: 0})
+        self.assertEqual(changed, {1: 90, 3: 60, 4: 110})
+        self.assertEqual(self.board.top(5), [(4, 110), (1, 90), (2, 80), (5, 80), (3, 60)])
+        self.assertEqual([self.board.rank(player_id) for player_id in (4, 1, 2, 5, 3)], [1, 2, 3, 3, 5])
+        self.assertEqual(self.board.scores(), {1: 90, 2: 80, 3: 60, 4: 110, 5: 80})
+
+
+class RoundSchedulerTests(SimpleTestCase):
+    def setUp(self):
+        self.scheduler = RoundScheduler()
+        self.fired = []
+
+    def callback(self, name):
+        async def fire():
+            self.fired.append((name, asyncio.get_running_loop().time()))
+        return fire
+
+    def run_for(self, seconds, schedule):
+        async def run():
+            schedule(asyncio.get_running_loop().time())
+            await asyncio.sleep(seconds)
+        async_to_sync(run)()
+        return [name for name, _ in self.fired]
+
+    def test_deadlines_fire_in_order(self):
+        def schedule(now):
+            self.scheduler.schedule('a', now + 0.03, self.callback('a'))
+            self.scheduler.schedule('b', now + 0.01, self.callback('b'))
+            self.scheduler.schedule_in('c', 0.02, self.callback('c'))
+        self.assertEqual(self.run_for(0.1, schedule), ['b', 'c', 'a'])
+        self.assertEqual(len(self.scheduler), 0)
+
+    def test_scheduling_a_key_again_replaces_its_deadline(self):
+        def schedule(now):
+            self.started = now
+            self.scheduler.schedule('a', now + 0.01, self.callback('early'))
+            self.scheduler.schedule('a', now + 0.05, self.callback('late'))
+            self.scheduler.schedule('b', now + 0.02, self.callback('b'))
+            self.assertEqual(len(self.scheduler), 2)
+        self.assertEqual(self.run_for(0.1, schedule), ['b', 'late'])
+        self.assertGreaterEqual(self.fired[1][1], self.started + 0.05)
+
+    def test_cancel(self):
+        def schedule(now):
+            self.scheduler.schedule('a', now + 0.01, self.callback('a'))
+            self.scheduler.schedule('b', now + 0.02, self.callback('b'))
+            self.scheduler.cancel('a')
+            self.scheduler.cancel('missing')
+            self.assertEqual(len(self.scheduler), 1)
+        self.assertEqual(self.run_for(0.05, schedule), ['b'])
+
+    def test_deadlines_do_not_outlive_their_loop(self):
+        self.run_for(0, lambda now: self.scheduler.schedule('a', now + 0.02, self.callback('a')))
+        self.assertEqual(len(self.scheduler), 1)
+        fired = self.run_for(0.05, lambda now: self.scheduler.schedule_in('b', 0.01, self.callback('b')))
+        self.assertEqual(fired, ['b'])
+        self.assertEqual(len(self.scheduler), 0)
+
+    def test_failing_callback_is_logged(self):
+        async def fail():
+            raise RuntimeError('boom')
+
+        with self.assertLogs('quiz.scheduler', 'ERROR'):
+            self.run_for(0.03, lambda now: self.scheduler.schedule_in('a', 0, fail))
+
+
+class AnswerBufferTests(TransactionTestCase):
+    def setUp(self):
+        self.host = create_member('host')
+        self.game = GameSession.objects.create(quiz=create_quiz(self.host), host=self.host)
+        self.question = self.game.quiz.questions.first()
+        self.guests = create_guests(3)
+
+    def buffer(self, **kwargs):
+        return AnswerBuffer(self.game.id, self.question.id, **kwargs)
+
+    def stored(self):
+        return sorted(Answer.objects.values_list('player_id', flat=True))
+
+    def test_one_answer_per_player(self):
+        async def run():
+            buffer = self.buffer(max_size=10, max_age=60)
+            self.assertTrue(buffer.add(self.guests[0].id, 0, True, 1.5))
+            self.assertFalse(buffer.add(self.guests[0].id, 1, False, 2.0))
+            self.assertEqual(len(buffer), 1)
+            self.assertEqual(await buffer.close(), 1)
+            self.assertFalse(buffer.add(self.guests[1].id, 0, True, 3.0))
+        async_to_sync(run)()
+        self.assertEqual(list(Answer.objects.values_list('selected_option', 'is_correct')), [(0, True)])
+
+    def test_flushes_when_full(self):
+        async def run():
+            buffer = self.buffer(max_size=2, max_age=60)
+            buffer.add(self.guests[0].id, 0, True, 1)
+            await asyncio.sleep(0.05)
+            self.assertEqual(await database_sync_to_async(self.stored)(), [])
+            buffer.add(self.guests[1].id, 0, True, 1)
+            await buffer._flushing
+            self.assertEqual(len(await database_sync_to_async(self.stored)()), 2)
+            self.assertEqual(await buffer.close(), 0)
+        async_to_sync(run)()
+
+    def test_flushes_when_old(self):
+        async def run():
+            buffer = self.buffer(max_size=10, max_age=0.05)
+            buffer.add(self.guests[0].id, 0, True, 1)
+            await asyncio.sleep(0.1)
+            await buffer._flushing
+            self.assertEqual(await database_sync_to_async(self.stored)(), [self.guests[0].id])
+            await buffer.close()
+        async_to_sync(run)()
+
+    def test_close_waits_for_a_flush_in_flight(self):
+        def slow_write(*args):
+            time.sleep(0.1)
+            return write_answers(*args)
+
+        async def run():
+            buffer = self.buffer(max_size=2, max_age=60)
+            buffer.add(self.guests[0].id, 0, True, 1)
+            buffer.add(self.guests[1].id, 0, True, 1)
+            await asyncio.sleep(0.01)
+            buffer.add(self.guests[2].id, 0, True, 1)
+            self.assertEqual(await buffer.close(), 1)
+            self.assertTrue(buffer._flushing.done())
+
+        with mock.patch('quiz.answer_buffer.write_answers', slow_write):
+            async_to_sync(run)()
+        self.assertEqual(self.stored(), sorted(guest.id for guest in self.guests))
+
+    def test_failed_writes_are_spooled_and_replayed(self):
+        rows = [
+            {'player_id': guest.id, 'selected_option': 1, 'is_correct': False, 'response_time': 2.5}
+            for guest in self.guests[:2]
+        ]
+        with tempfile.TemporaryDirectory() as spool_dir, override_settings(QUIZ_ANSWER_SPOOL_DIR=spool_dir):
+            with mock.patch.object(Answer.objects, 'bulk_create', side_effect=DatabaseError('down')), \
+                    self.assertLogs('quiz.answer_buffer', 'ERROR'):
+                self.assertEqual(write_answers(self.game.id, self.question.id, rows), 0)
+            self.assertEqual(len(os.listdir(spool_dir)), 1)
+            self.assertEqual(self.stored(), [])
+
+            call_command('replay_answer_spool', stdout=StringIO())
+            self.assertEqual(os.listdir(spool_dir), [])
+        self.assertEqual(self.stored(), sorted(guest.id for guest in self.guests[:2]))
+        self.assertEqual(Answer.objects.filter(game_session=self.game, question=self.question).count(), 2)
+
+    def test_replay_skips_files_that_fail(self):
+        rows = [{'player_id': self.guests[0].id, 'selected_option': 1, 'is_correct': False, 'response_time': 2.5}]
+        with tempfile.TemporaryDirectory() as spool_dir, override_settings(QUIZ_ANSWER_SPOOL_DIR=spool_dir):
+            # Sorted first: the player was deleted since
+            with open(os.path.join(spool_dir, 'answers-0.jsonl'), 'w') as spool:
+                spool.write(json.dumps(dict(rows[0], player_id=0, game_session_id=self.game.id,
+                                            question_id=self.question.id)) + '\n')
+            spool_answers(self.game.id, self.question.id, rows)
+            with self.assertLogs('quiz.answer_buffer', 'ERROR'):
+                call_command('replay_answer_spool', stdout=StringIO())
+            self.assertEqual(os.listdir(spool_dir), ['answers-0.jsonl'])
+        self.assertEqual(self.stored(), [self.guests[0].id])
+
+
+class AnswerStatsTests(SimpleTestCase):
+    class Engine:
+        host_group_name = 'host_ABC123'
+
+        def __init__(self):
+            self.roster = dict.fromkeys(range(4))
+            self.sent = []
+
+        async def send(self, group, message):
+            self.sent.append((group, message))
+
+    def test_answers_are_pushed_once_per_interval(self):
+        async def run():
+            engine = self.Engine()
+            stats = AnswerStats(engine, interval=0.05)
+            stats.reset(SimpleNamespace(id=7, options=['a', 'b', 'c']))
+            for option, is_correct in ((0, True), (1, False), (0, True)):
+                stats.record(option, is_correct)
+            self.assertEqual(engine.sent, [])
+            await asyncio.sleep(0.1)
+            # Nothing new since the push
+            await stats.flush()
+            stats.record(2, False)
+            await asyncio.sleep(0.1)
+            return engine.sent
+
+        first, second = async_to_sync(run)()
+        self.assertEqual(first, ('host_ABC123', {'type': 'answer_stats', 'data': {
+            'question_id': 7, 'counts': [2, 1, 0], 'answer_count': 3, 'correct_rate': 2 / 3, 'player_count': 4
+        }}))
+        self.assertEqual((second[1]['data']['counts'], second[1]['data']['correct_rate']), ([2, 1, 1], 0.5))
+
+    def test_reset_drops_a_pending_push(self):
+        async def run():
+            engine = self.Engine()
+            stats = AnswerStats(engine, interval=0.05)
+            stats.reset(SimpleNamespace(id=7, options=['a', 'b']))
+            stats.record(0, True)
+            stats.reset(SimpleNamespace(id=8, options=['a', 'b']))
+            await asyncio.sleep(0.1)
+            return engine.sent, stats.payload()
+
+        sent, payload = async_to_sync(run)()
+        self.assertEqual(sent, [])
+        self.assertEqual((payload['question_id'], payload['counts'], payload['correct_rate']), (8, [0, 0], 0))
+
+
+class SpectatorFeedTests(SimpleTestCase):
+    class Engine:
+        spectator_group_name = 'spectate_ABC123'
+
+        def __init__(self):
+            self.remotes = {}
+            self.builds = 0
+            self.sent = []
+
+        def spectator_payload(self):
+            self.builds += 1
+            return {'build': self.builds}
+
+        async def send(self, group, message):
+            self.sent.append((group, message))
+
+    def watched_here(self, sockets=1):
+        return mock.patch.object(fanout, 'local_size', lambda name: sockets)
+
+    def test_first_change_is_pushed_at_once_then_throttled(self):
+        async def run():
+            engine = self.Engine()
+            feed = SpectatorFeed(engine, interval=0.2)
+            with self.watched_here():
+                feed.touch()
+                await asyncio.sleep(0.02)
+                pushed_at_once = list(engine.sent)
+                for _ in range(3):
+                    feed.touch()
+                await asyncio.sleep(0.05)
+                within_interval = list(engine.sent)
+                await asyncio.sleep(0.2)
+            return pushed_at_once, within_interval, engine.sent
+
+        pushed_at_once, within_interval, sent = async_to_sync(run)()
+        self.assertEqual(pushed_at_once, [('spectate_ABC123', {'type': 'spectator_state', 'data': {'build': 1}})])
+        self.assertEqual(within_interval, pushed_at_once)
+        # The three changes were coalesced into a single push
+        self.assertEqual([message['data'] for _, message in sent], [{'build': 1}, {'build': 2}])
+
+    def test_nothing_is_built_without_spectators(self):
+        async def run():
+            engine = self.Engine()
+            feed = SpectatorFeed(engine, interval=0)
+            with self.watched_here(0):
+                feed.touch()
+                await asyncio.sleep(0.02)
+                unwatched = engine.builds, list(engine.sent)
+                # A spectator on a worker that hosts sockets of the game
+                engine.remotes['other'] = {'spectators': 1}
+                feed.touch()
+                await asyncio.sleep(0.02)
+            return unwatched, engine.builds
+
+        unwatched, builds = async_to_sync(run)()
+        self.assertEqual(unwatched, (0, []))
+        self.assertEqual(builds, 1)
+
+
+class FrameCacheTests(SimpleTestCase):
+    def test_encoded_once_per_seq_and_codec(self):
+        cache = FrameCache(size=4)
+        message = {'type': 'lobby_update', 'seq': 1}
+        with mock.patch.object(JSON, 'encode', wraps=JSON.encode) as encode_json, \
+                mock.patch.object(MSGPACK, 'encode', wraps=MSGPACK.encode) as encode_msgpack:
+            frames = [cache.encode('quiz_ABC123', message, codec) for codec in (JSON, MSGPACK, JSON, MSGPACK)]
+            # Unnumbered messages are never cached
+            cache.encode('quiz_ABC123', {'type': 'error'}, JSON)
+            cache.encode('quiz_ABC123', {'type': 'error'}, JSON)
+        self.assertEqual((encode_json.call_count, encode_msgpack.call_count), (3, 1))
+        self.assertIs(frames[0], frames[2])
+        self.assertIs(frames[1], frames[3])
+
+    def test_oldest_frames_are_evicted(self):
+        cache = FrameCache(size=2)
+        for seq in range(1, 7):
+            cache.encode('quiz_ABC123', {'type': 'lobby_update', 'seq': seq}, JSON)
+        self.assertEqual([key[0] for key in cache._groups['quiz_ABC123']], [3, 4, 5, 6])
+
+    def test_dropped_with_the_engine(self):
+        engine = GameEngine('ABC123')
+        for group in (engine.lobby_group_name, engine.room_group_name, 'quiz_OTHER'):
+            frame_cache.encode(group, {'type': 'lobby_update', 'seq': 1}, JSON)
+        engine_registry['ABC123'] = engine
+        drop_engine('ABC123')
+        self.assertNotIn(engine.lobby_group_name, frame_cache._groups)
+        self.assertNotIn(engine.room_group_name, frame_cache._groups)
+        self.assertIn('quiz_OTHER', frame_cache._groups)
+        frame_cache.drop('quiz_OTHER')
+
+
+class FanoutTests(SimpleTestCase):
+    class Member:
+        def __init__(self):
+            self.events = []
+
+        async def dispatch(self, event):
+            self.events.append(event)
+
+    def test_receive_errors_resubscribe(self):
+        async def run():
+            channel_layer = get_channel_layer()
+            receive = channel_layer.receive
+            failures = [ConnectionError('redis went away')]
+
+            async def flaky_receive(channel):
+                if failures:
+                    raise failures.pop()
+                return await receive(channel)
+
+            member = self.Member()
+            with mock.patch.object(channel_layer, 'receive', flaky_receive), \
+                    mock.patch.object(fanout.LocalGroup, 'retry_delay', 0), \
+                    self.assertLogs('quiz.fanout', 'ERROR'):
+                await fanout.join('test_fanout', member)
+                await channel_layer.group_send('test_fanout', {'type': 'ping'})
+                for _ in range(100):
+                    if member.events:
+                        break
+                    await asyncio.sleep(0.01)
+                await fanout.leave('test_fanout', member)
+            self.assertEqual(member.events, [{'type': 'ping'}])
+        async_to_sync(run)()
+
+
+class GameSocketTestCase(TransactionTestCase):
+    """A game with a host and guests, played over websockets against the in-process engine"""
+
+    def setUp(self):
+        identity_cache.clear()
+        self.host = create_member('host')
+        self.game = GameSession.objects.create(quiz=create_quiz(self.host), host=self.host)
+        self.token = create_jwt_pair_for_user(self.host)['access']
+        self.guests = create_guests(3)
+
+    def tearDown(self):
+        drop_engine(self.game.pin)
+        drop_snapshot(self.game.pin)
+        identity_cache.clear()
+
+    @property
+    def lobby(self):
+        return f"/ws/quiz/{self.game.pin}/lobby/"
+
+    @property
+    def room(self):
+        return f"/ws/game/{self.game.pin}/play/"
+
+    def communicator(self, path, headers):
+        return WebsocketCommunicator(application, path, headers=headers)
+
+    async def open(self, path, guest=None, greeting='lobby_snapshot'):
+        headers = [guest_cookie(guest)] if guest else []
+        communicator = self.communicator(path, headers)
+        connected, code = await communicator.connect()
+        self.assertTrue(connected, code)
+        if greeting:
+            await self.receive(communicator, greeting)
+        return communicator
+
+    async def receive(self, communicator, message_type):
+        while True:
+            message = await communicator.receive_json_from()
+            if message['type'] == message_type:
+                return message
+
+    async def open_lobby(self, guests):
+        players = [await self.open(self.lobby, guest) for guest in guests]
+        host = await self.open(f"{self.lobby}?token={self.token}")
+        return players, host
+
+    async def close_all(self, communicators):
+        for communicator in communicators:
+            await communicator.disconnect()
+
+
+@override_settings(QUIZ_REVEAL_SECONDS=0, QUIZ_LEADERBOARD_SECONDS=0, QUIZ_ENGINE_IDLE_SECONDS=60)
+class GameEngineTests(GameSocketTestCase):
+    async def start_game(self, guests=None):
+        """Start the game from the lobby, returns the game room sockets of the players and the host"""
+        guests = self.guests if guests is None else guests
+        lobby_players, lobby_host = await self.open_lobby(guests)
+        await lobby_host.send_json_to({'type': 'start_game'})
+        await self.receive(lobby_host, 'game_started')
+        players = [await self.open(self.room, guest, greeting='game_state') for guest in guests]
+        host = await self.open(f"{self.room}?token={self.token}", greeting='game_state')
+        await self.close_all(lobby_players + [lobby_host])
+        return players, host
+
+    async def answer(self, player, option):
+        await player.send_json_to({'type': 'submit_answer', 'option': option})
+        while True:
+            message = await player.receive_json_from()
+            if message['type'] in ('answer_received', 'error'):
+                return message
+
+    async def next(self, host, expected):
+        await host.send_json_to({'type': 'next'})
+        return await self.receive(host, expected)
+
+    @override_settings(QUIZ_ANSWER_STATS_SECONDS=0.05)
+    def test_answer_stats_only_reach_the_host(self):
+        async def run():
+            players, host = await self.start_game()
+            for player, option in zip(players, (0, 0, 1)):
+                await self.answer(player, option)
+            stats = await self.receive(host, 'answer_stats')
+            while stats['data']['answer_count'] < 3:
+                stats = await self.receive(host, 'answer_stats')
+            await asyncio.sleep(0.1)
+            received = []
+            for player in players:
+                while not await player.receive_nothing():
+                    received.append((await player.receive_json_from())['type'])
+            await self.close_all(players + [host])
+            return stats['data'], received
+
+        stats, received = async_to_sync(run)()
+        self.assertEqual((stats['counts'][:2], stats['answer_count'], stats['player_count']), ([2, 1], 3, 3))
+        self.assertAlmostEqual(stats['correct_rate'], 2 / 3)
+        self.assertNotIn('answer_stats', received)
+
+    def test_lobby_socket_after_start_does_not_join(self):
+        async def run():
+            players, host = await self.start_game(self.guests[:2])
+            late = await self.open(self.lobby, self.guests[2])
+            late_player = await self.open(self.room, self.guests[2], greeting='game_state')
+            await late_player.send_json_to({'type': 'submit_answer', 'option': 0})
+            error = await self.receive(late_player, 'error')
+            engine = await get_engine(self.game.pin)
+            await self.close_all(players + [host, late, late_player])
+            return error['message'], engine
+
+        message, engine = async_to_sync(run)()
+        self.assertEqual(message, "Player is not part of this game")
+        self.assertNotIn(self.guests[2].id, engine.roster)
+        self.assertNotIn(self.guests[2].id, engine.leaderboard)
+
+    def test_full_game_is_persisted(self):
+        async def run():
+            players, host = await self.start_game()
+            engine = await get_engine(self.game.pin)
+            for index in range(3):
+                self.assertEqual((engine.state, engine.question_index), ('question', index))
+                if index == 0:
+                    self.assertEqual((await self.answer(players[0], 0))['type'], 'answer_received')
+                    self.assertEqual((await self.answer(players[1], 1))['type'], 'answer_received')
+                else:
+                    await self.answer(players[1], 0)
+                ended = await self.next(host, 'question_ended')
+                self.assertEqual(ended['data']['correct_option'], 0)
+                self.assertEqual(engine.state, 'reveal')
+                await self.next(host, 'leaderboard')
+                self.assertEqual(engine.state, 'leaderboard')
+                if index < 2:
+                    self.assertEqual((await self.next(host, 'question_started'))['data']['index'], index + 1)
+            game_ended = await self.next(host, 'game_ended')
+            self.assertEqual(engine.state, 'ended')
+            await self.close_all(players + [host])
+            return game_ended['data']['leaderboard']
+
+        leaderboard = async_to_sync(run)()
+        self.assertNotIn(self.game.pin, engine_registry)
+        scores = dict(Player.objects.filter(id__in=[guest.id for guest in self.guests]).values_list('id', 'score'))
+        self.assertEqual({standing['player_id']: standing['score'] for standing in leaderboard}, scores)
+        self.assertEqual(leaderboard[0]['player_id'], self.guests[1].id)
+        self.assertGreater(scores[self.guests[0].id], 0)
+        self.assertEqual(scores[self.guests[2].id], 0)
+
+        answers = Answer.objects.filter(game_session=self.game)
+        self.assertEqual(answers.count(), 4)
+        self.assertEqual(
+            sorted(answers.values_list('player_id', 'is_correct')),
+            sorted([(self.guests[0].id, True), (self.guests[1].id, False)] + [(self.guests[1].id, True)] * 2)
+        )
+        self.game.refresh_from_db()
+        self.assertTrue(self.game.is_ended)
+        self.assertFalse(self.game.is_active)
+
+    def test_state_machine(self):
+        engine = GameEngine('000000')
+        for state, allowed in [('lobby', 'question'), ('question', 'reveal'), ('reveal', 'leaderboard')]:
+            engine.state = state
+            with self.assertRaises(GameStateError):
+                engine._transition('lobby')
+            engine._transition(allowed)
+        engine._transition('ended')
+        with self.assertRaises(GameStateError):
+            engine._transition('question')
+
+    def test_stale_deadline_does_not_advance(self):
+        GameSession.objects.filter(pk=self.game.pk).update(question_time_limit=1)
+
+        async def run():
+            players, host = await self.start_game(self.guests[:1])
+            engine = await get_engine(self.game.pin)
+            question_deadline = engine._timer_callback()
+            # The deadline closes the question without the host
+            await self.receive(host, 'question_ended')
+            self.assertEqual(engine.state, 'reveal')
+            await question_deadline()
+            self.assertEqual(engine.state, 'reveal')
+
+            await self.next(host, 'leaderboard')
+            await self.next(host, 'question_started')
+            question_deadline = engine._timer_callback()
+            await self.next(host, 'question_ended')
+            await question_deadline()
+            self.assertEqual((engine.state, engine.question_index), ('reveal', 1))
+            await self.close_all(players + [host])
+        async_to_sync(run)()
+
+    def test_submit_answer_rejections(self):
+        late_guest = create_guests(4)[3]
+
+        async def run():
+            players, host = await self.start_game(self.guests[:2])
+            outsider = await self.open(self.room, late_guest, greeting='game_state')
+            engine = await get_engine(self.game.pin)
+            errors = []
+            for communicator, option in [
+                (host, 0), (outsider, 0), (players[0], 3), (players[0], True), (players[0], '0'),
+            ]:
+                errors.append((await self.answer(communicator, option))['message'])
+            self.assertEqual((await self.answer(players[0], 2))['type'], 'answer_received')
+            errors.append((await self.answer(players[0], 0))['message'])
+
+            engine.question_opened -= engine.time_limit + 1
+            errors.append((await self.answer(players[1], 0))['message'])
+            await self.next(host, 'question_ended')
+            errors.append((await self.answer(players[1], 0))['message'])
+            await self.close_all(players + [host, outsider])
+            return errors
+
+        self.assertEqual(async_to_sync(run)(), [
+            'Only players can answer',
+            'Player is not part of this game',
+            'Answer must be the index of one of the options',
+            'Answer must be the index of one of the options',
+            'Answer must be the index of one of the options',
+            'Answer already submitted',
+            'Time is up',
+            'No question is open',
+        ])
+
+    def test_resumes_from_the_database(self):
+        async def run():
+            players, host = await self.start_game()
+            await self.answer(players[0], 0)
+            await self.next(host, 'question_ended')
+            await self.close_all(players + [host])
+            await database_sync_to_async(drop_engine)(self.game.pin)
+
+            engine = await get_engine(self.game.pin)
+            self.assertEqual((engine.state, engine.question_index), ('leaderboard', 0))
+            self.assertEqual(set(engine.roster), {guest.id for guest in self.guests})
+            score = engine.leaderboard.score(self.guests[0].id)
+            host = await self.open(f"{self.room}?token={self.token}", greeting='game_state')
+            started = await self.next(host, 'question_started')
+            await host.disconnect()
+            return score, started['data']['index']
+
+        score, index = async_to_sync(run)()
+        self.assertGreater(score, 0)
+        self.assertEqual(score, Player.objects.get(id=self.guests[0].id).score)
+        self.assertEqual(index, 1)
+
+    def test_host_ends_the_game_from_the_lobby(self):
+        async def run():
+            players, host = await self.open_lobby(self.guests[:2])
+            await players[0].send_json_to({'type': 'end_game'})
+            error = await self.receive(players[0], 'error')
+            await host.send_json_to({'type': 'end_game'})
+            ended = [await self.receive(communicator, 'game_ended') for communicator in players + [host]]
+            await self.close_all(players + [host])
+            return error, ended
+
+        error, ended = async_to_sync(run)()
+        self.assertEqual(error['message'], 'Only host can end the game')
+        self.assertEqual(len(ended), 3)
+        self.game.refresh_from_db()
+        self.assertTrue(self.game.is_ended)
+        self.assertFalse(self.game.is_started)
+
+    @override_settings(QUIZ_SPECTATOR_UPDATE_SECONDS=0.05)
+    def test_spectators_follow_the_game_read_only(self):
+        async def run():
+            spectator = await self.open(f"/ws/game/{self.game.pin}/spectate/", greeting='spectator_state')
+            players, host = await self.start_game(self.guests[:1])
+            state = await self.receive(spectator, 'spectator_state')
+            while state['data']['state'] != 'question':
+                state = await self.receive(spectator, 'spectator_state')
+            await spectator.send_json_to({'type': 'submit_answer', 'option': 0})
+            error = await self.receive(spectator, 'error')
+            await self.close_all(players + [host, spectator])
+            return state, error
+
+        state, error = async_to_sync(run)()
+        self.assertEqual(state['data']['question']['options'], ['A', 'B', 'C'])
+        self.assertNotIn('correct_option', state['data'])
+        self.assertEqual(error['message'], "Spectators cannot send messages")
+        self.assertEqual(Answer.objects.filter(game_session=self.game).count(), 0)
+
+    def test_host_ends_a_running_game(self):
+        async def run():
+            players, host = await self.start_game(self.guests[:1])
+            await self.answer(players[0], 0)
+            await host.send_json_to({'type': 'end_game'})
+            ended = await self.receive(players[0], 'game_ended')
+            await self.close_all(players + [host])
+            return ended
+
+        ended = async_to_sync(run)()
+        self.assertEqual(ended['data']['leaderboard'][0]['player_id'], self.guests[0].id)
+        self.assertEqual(Answer.objects.filter(game_session=self.game).count(), 1)
+        self.game.refresh_from_db()
+        self.assertTrue(self.game.is_ended)
+
+
+    def test_start_skips_deleted_players(self):
+        async def run():
+            players, host = await self.open_lobby(self.guests)
+            await database_sync_to_async(self.guests[2].delete)()
+            await host.send_json_to({'type': 'start_game'})
+            await self.receive(host, 'game_started')
+            await self.close_all(players + [host])
+        async_to_sync(run)()
+
+        self.game.refresh_from_db()
+        self.assertTrue(self.game.is_started)
+        self.assertEqual(
+            set(self.game.players.values_list('id', flat=True)),
+            {self.guests[0].id, self.guests[1].id}
+        )
+
+    def test_team_games_cannot_start(self):
+        GameSession.objects.filter(pk=self.game.pk).update(game_type='team')
+
+        async def run():
+            players, host = await self.open_lobby(self.guests[:1])
+            await host.send_json_to({'type': 'start_game'})
+            error = await self.receive(host, 'error')
+            await self.close_all(players + [host])
+            return error
+        self.assertIn('not supported', async_to_sync(run)()['message'])
+        self.game.refresh_from_db()
+        self.assertFalse(self.game.is_started)
+
+@override_settings(QUIZ_ENGINE_IDLE_SECONDS=0.05, QUIZ_RECONNECT_GRACE_SECONDS=0)
+class EngineIdleTests(GameSocketTestCase):
+    def test_unloaded_after_the_last_socket_leaves(self):
+        async def run():
+            player = await self.open(self.lobby, self.guests[0])
+            spectator = await self.open(f"/ws/game/{self.game.pin}/spectate/", greeting='spectator_state')
+            engine = engine_registry[self.game.pin]
+            await player.disconnect()
+            await asyncio.sleep(0.1)
+            self.assertIs(engine_registry.get(self.game.pin), engine)
+            await spectator.disconnect()
+            await asyncio.sleep(0.1)
+            self.assertNotIn(self.game.pin, engine_registry)
+        async_to_sync(run)()
+
+    def test_reconnect_keeps_the_engine(self):
+        async def run():
+            player = await self.open(self.lobby, self.guests[0])
+            engine = engine_registry[self.game.pin]
+            await player.disconnect()
+            player = await self.open(self.lobby, self.guests[0])
+            await asyncio.sleep(0.1)
+            self.assertIs(engine_registry.get(self.game.pin), engine)
+            await player.disconnect()
+        async_to_sync(run)()
+
+    def test_engine_loaded_without_sockets(self):
+        async def run():
+            await get_engine(self.game.pin)
+            await asyncio.sleep(0.1)
+            self.assertNotIn(self.game.pin, engine_registry)
+        async_to_sync(run)()
+
+    def test_running_game_is_flushed_and_resumed(self):
+        async def run():
+            players, host = await self.open_lobby(self.guests[:1])
+            await host.send_json_to({'type': 'start_game'})
+            await self.receive(host, 'game_started')
+            player = await self.open(self.room, self.guests[0], greeting='game_state')
+            await self.close_all(players + [host])
+            await player.send_json_to({'type': 'submit_answer', 'option': 0})
+            await self.receive(player, 'answer_received')
+            await player.disconnect()
+            await asyncio.sleep(0.1)
+            self.assertNotIn(self.game.pin, engine_registry)
+            return await get_engine(self.game.pin)
+
+        engine = async_to_sync(run)()
+        self.assertEqual((engine.state, engine.question_index), ('leaderboard', 0))
+        self.assertEqual(Answer.objects.filter(game_session=self.game).count(), 1)
+        # The open round was scored before the engine went away
+        score = Player.objects.get(id=self.guests[0].id).score
+        self.assertGreater(score, 0)
+        self.assertEqual(engine.leaderboard.score(self.guests[0].id), score)
+
+    def test_started_game_keeps_its_questions(self):
+        # Cached before the start, as the game page does while players join
+        self.client.get(reverse('game-session-detail', args=[self.game.pin]))
+        first = self.game.quiz.questions.order_by('id').first()
+        Question.objects.filter(id=first.id).update(text='Edited in the lobby')
+
+        async def run():
+            players, host = await self.open_lobby(self.guests[:1])
+            await host.send_json_to({'type': 'start_game'})
+            await self.receive(host, 'game_started')
+            await self.close_all(players + [host])
+            await database_sync_to_async(Question.objects.filter(id=first.id).update)(
+                text='Edited mid-game', correct_answer='B'
+            )
+            await asyncio.sleep(0.1)
+            self.assertNotIn(self.game.pin, engine_registry)
+            self.assertTrue(snapshot._snapshots.get(self.game.pin).frozen)
+            # Rebuilt from the stored questions even once the registry lost it
+            drop_snapshot(self.game.pin)
+            return await get_engine(self.game.pin)
+
+        engine = async_to_sync(run)()
+        question = engine.quiz.by_id[first.id]
+        self.assertEqual((question.text, question.correct_index), ('Edited in the lobby', 0))
+        self.assertEqual(GameSession.objects.get(id=self.game.id).question_snapshot[0]['id'], first.id)
+
+
+class Worker:
+    """Channel layer and process-wide registries of one simulated worker"""
+
+    def __init__(self):
+        self.layer = LocalBrokerChannelLayer(broker='workers')
+        self.engines = {}
+        self.remotes = {}
+        self.loading = {}
+        self.groups = {}
+
+
+class PerWorker(MutableMapping):
+    """Stands in for a module-level registry, with a separate one per simulated worker"""
+
+    def __init__(self, current, attribute):
+        self.current = current
+        self.attribute = attribute
+
+    @property
+    def registry(self):
+        return getattr(self.current.get(), self.attribute)
+
+    def __getitem__(self, key):
+        return self.registry[key]
+
+    def __setitem__(self, key, value):
+        self.registry[key] = value
+
+    def __delitem__(self, key):
+        del self.registry[key]
+
+    def __iter__(self):
+        return iter(self.registry)
+
+    def __len__(self):
+        return len(self.registry)
+
+
+class MultiWorkerTests(GameSocketTestCase):
+    """
+    Two workers on one broker. Sockets and the tasks they start belong to the
+    worker that was current when they were opened.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.workers = [Worker(), Worker()]
+        self.current = contextvars.ContextVar('worker', default=self.workers[0])
+        registries = (
+            ('quiz.engine._engines', 'engines'), ('quiz.engine._remotes', 'remotes'),
+            ('quiz.engine._loading', 'loading'), ('quiz.fanout._groups', 'groups'),
+        )
+        patches = [mock.patch(target, PerWorker(self.current, attribute)) for target, attribute in registries]
+        patches += [
+            mock.patch(f"{module}.get_channel_layer", lambda *args: self.current.get().layer)
+            for module in ('channels.consumer', 'quiz.engine', 'quiz.fanout')
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def tearDown(self):
+        for worker in self.workers:
+            with self.on(worker):
+                drop_engine(self.game.pin)
+        async_to_sync(self.workers[0].layer.flush)()
+        super().tearDown()
+
+    def communicator(self, path, headers):
+        # Communicators run the application in an empty context
+        worker = self.current.get()
+
+        async def on_worker(scope, receive, send):
+            self.current.set(worker)
+            await application(scope, receive, send)
+        return WebsocketCommunicator(on_worker, path, headers=headers)
+
+    @contextmanager
+    def on(self, worker):
+        token = self.current.set(worker)
+        try:
+            yield
+        finally:
+            self.current.reset(token)
+
+    async def answer(self, player, option):
+        await player.send_json_to({'type': 'submit_answer', 'option': option})
+        return await self.receive(player, 'answer_received')
+
+    def test_round_played_across_workers(self):
+        owner, other = self.workers
+
+        async def run():
+            with self.on(owner):
+                lobby_players = [await self.open(self.lobby, self.guests[0])]
+            with self.on(other):
+                lobby_players.append(await self.open(self.lobby, self.guests[1]))
+                lobby_host = await self.open(f"{self.lobby}?token={self.token}")
+            # Forwarded to the engine on the owning worker
+            await lobby_host.send_json_to({'type': 'start_game'})
+            for communicator in lobby_players + [lobby_host]:
+                await self.receive(communicator, 'game_started')
+
+            with self.on(owner):
+                players = [await self.open(self.room, self.guests[0], greeting='game_state')]
+            with self.on(other):
+                players.append(await self.open(self.room, self.guests[1], greeting='game_state'))
+                host = await self.open(f"{self.room}?token={self.token}", greeting='game_state')
+            await self.close_all(lobby_players + [lobby_host])
+            self.assertIsInstance(other.remotes[self.game.pin], RemoteEngine)
+            self.assertNotIn(self.game.pin, other.engines)
+
+            await self.answer(players[0], 1)
+            await self.answer(players[1], 0)
+            await host.send_json_to({'type': 'next'})
+            for player in players:
+                self.assertEqual((await self.receive(player, 'question_ended'))['data']['answer_count'], 2)
+            await host.send_json_to({'type': 'next'})
+            standings = [(await self.receive(player, 'leaderboard'))['data']['me'] for player in players]
+            await host.send_json_to({'type': 'end_game'})
+            for player in players:
+                await self.receive(player, 'game_ended')
+            await self.close_all(players + [host])
+            return standings
+
+        standings = async_to_sync(run)()
+        self.assertEqual([standing['player_id'] for standing in standings], [guest.id for guest in self.guests[:2]])
+        self.assertEqual([standing['rank'] for standing in standings], [2, 1])
+        self.assertEqual(standings[0]['score'], 0)
+        self.assertGreater(standings[1]['score'], 0)
+        self.assertEqual(
+            Player.objects.get(id=self.guests[1].id).score, standings[1]['score']
+        )
+
+    @override_settings(QUIZ_ENGINE_IDLE_SECONDS=0.05)
+    def test_engine_stays_loaded_for_sockets_on_other_workers(self):
+        owner, other = self.workers
+
+        async def run():
+            with self.on(owner):
+                first = await self.open(self.lobby, self.guests[0])
+            with self.on(other):
+                second = await self.open(self.lobby, self.guests[1])
+            await first.disconnect()
+            await asyncio.sleep(0.2)
+            self.assertIn(self.game.pin, owner.engines)
+            await second.disconnect()
+            await asyncio.sleep(0.2)
+            self.assertNotIn(self.game.pin, owner.engines)
+            self.assertNotIn(self.game.pin, other.remotes)
+            # The lease was handed back with the engine
+            with self.on(other):
+                third = await self.open(self.lobby, self.guests[2])
+                await third.disconnect()
+
+        async_to_sync(run)()
+        self.assertIn(self.game.pin, self.workers[1].engines)
+
+    @override_settings(QUIZ_ENGINE_CALL_SECONDS=0.1)
+    def test_sockets_reconnect_when_the_owner_stops_answering(self):
+        owner, other = self.workers
+
+        async def run():
+            with self.on(owner):
+                await self.open(self.lobby, self.guests[0])
+            with self.on(other):
+                host = await self.open(f"{self.lobby}?token={self.token}")
+            owner.engines[self.game.pin].release()
+            await host.send_json_to({'type': 'start_game'})
+            with self.assertLogs('quiz.engine', 'ERROR'):
+                while True:
+                    output = await host.receive_output(1)
+                    if output['type'] == 'websocket.close':
+                        return output['code']
+
+        self.assertEqual(async_to_sync(run)(), 1012)
+
+    @override_settings(QUIZ_ENGINE_LEASE_SECONDS=0.06)
+    def test_lost_lease_unloads_the_engine(self):
+        owner = self.workers[0]
+
+        async def run():
+            with self.on(owner):
+                player = await self.open(self.lobby, self.guests[0])
+            # Another worker took over, e.g. after this one stalled past the lease
+            owner.layer.leases[f"engine_{self.game.pin}"] = ('elsewhere', time.monotonic() + 60)
+            with self.assertLogs('quiz.engine', 'ERROR'):
+                self.assertEqual((await player.receive_output(1))['code'], 1012)
+            await player.disconnect()
+
+        async_to_sync(run)()
+        self.assertNotIn(self.game.pin, owner.engines)
+
+
+@override_settings(QUIZ_LOBBY_UPDATE_SECONDS=0.01, QUIZ_REPLAY_BUFFER_SIZE=2, QUIZ_RECONNECT_GRACE_SECONDS=0.2)
+class ReconnectTests(GameSocketTestCase):
+    async def three_joins(self):
+        """Host socket that saw a lobby_update (seq 1, 2, 3) for each guest joining"""
+        host = await self.open(f"{self.lobby}?token={self.token}")
+        players = []
+        for seq, guest in enumerate(self.guests, start=1):
+            players.append(await self.open(self.lobby, guest))
+            update = await self.receive(host, 'lobby_update')
+            self.assertEqual((update['seq'], update['data']['joined'][0]['player_id']), (seq, guest.id))
+        return host, players
+
+    def test_replays_missed_events(self):
+        async def run():
+            host, players = await self.three_joins()
+            await host.disconnect()
+            host = await self.open(f"{self.lobby}?token={self.token}&last_seq=1", greeting=None)
+            replayed = [await host.receive_json_from() for _ in range(2)]
+            self.assertTrue(await host.receive_nothing(0.05))
+            await self.close_all(players + [host])
+            return replayed
+        replayed = async_to_sync(run)()
+        self.assertEqual(
+            [(message['type'], message['seq']) for message in replayed],
+            [('lobby_update', 2), ('lobby_update', 3)]
+        )
+
+    def test_up_to_date_client_gets_nothing(self):
+        async def run():
+            host, players = await self.three_joins()
+            watcher = await self.open(f"{self.lobby}?token={self.token}&last_seq=3", greeting=None)
+            self.assertTrue(await watcher.receive_nothing(0.05))
+            await self.close_all(players + [host, watcher])
+        async_to_sync(run)()
+
+    def test_snapshot_when_too_far_behind_or_ahead(self):
+        async def run():
+            host, players = await self.three_joins()
+            greetings = []
+            # seq 1 has left the two-event buffer; seq 99 is from before a restart
+            for last_seq in (0, 99):
+                watcher = await self.open(f"{self.lobby}?token={self.token}&last_seq={last_seq}", greeting=None)
+                greetings.append([await watcher.receive_json_from() for _ in range(2)])
+                await watcher.disconnect()
+            await self.close_all(players + [host])
+            return greetings
+        for quiz_info, lobby_snapshot in async_to_sync(run)():
+            self.assertEqual((quiz_info['type'], lobby_snapshot['type']), ('quiz_info', 'lobby_snapshot'))
+            self.assertEqual((lobby_snapshot['data']['seq'], lobby_snapshot['data']['player_count']), (3, 3))
+
+    def test_reconnect_within_grace_period_is_silent(self):
+        async def run():
+            host = await self.open(f"{self.lobby}?token={self.token}")
+            player = await self.open(self.lobby, self.guests[0])
+            await self.receive(host, 'lobby_update')
+
+            await player.disconnect()
+            player = await self.open(f"{self.lobby}?last_seq=1", self.guests[0], greeting=None)
+            self.assertTrue(await host.receive_nothing(0.3))
+
+            await player.disconnect()
+            left = await self.receive(host, 'lobby_update')
+            await host.disconnect()
+            return left['data']
+        data = async_to_sync(run)()
+        self.assertEqual((data['joined'], data['left'], data['player_count']), ([], [self.guests[0].id], 0))
@@ -1,5 +1,11 @@
 from .models import Quiz, GameSession, Player
-from .serializers import QuizSerializer, GameSessionSerializer, AuthenticatedPlayerSerializer, GuestPlayerSerializer
+from .serializers import (
+    QuizSerializer, QuizSummarySerializer, GameSessionSerializer, AuthenticatedPlayerSerializer, GuestPlayerSerializer
+)
+from .pagination import QuizCursorPagination
+from .game_logic import SCORED_GAME_TYPES
+from .snapshot import get_snapshot
+from .guest_tokens import issue_guest_token
 from question.models import Question
 from rest_framework import generics
 from rest_framework import permissions
@@ -9,8 +15,9 @@ from rest_framework.exceptions import NotFound, PermissionDenied
 from rest_framework.views import APIView
 from django.shortcuts import get_object_or_404
 from django.db import transaction
-from django.utils import timezone
-from datetime import timedelta
+from django.db.models import Count
+from django.conf import settings
+from datetime import datetime, timezone
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
 
@@ -42,13 +49,27 @@ class QuizCreateView(generics.CreateAPIView):
 
 # class view to return all quiz
 class QuizListView(generics.ListAPIView):
-    serializer_class = QuizSerializer
+    serializer_class = QuizSummarySerializer
+    pagination_class = QuizCursorPagination
     permission_classes = [permissions.IsAuthenticated]
 
     @swagger_auto_schema(
-        operation_description="List all quizzes in the organization",
+        operation_description="List the quizzes of the organization, newest first. "
+                              "Questions are only returned by the quiz details endpoint.",
+        manual_parameters=[
+            openapi.Parameter(
+                'cursor', openapi.IN_QUERY,
+                description="Cursor from the 'next' or 'previous' link of the previous page",
+                type=openapi.TYPE_STRING
+            ),
+            openapi.Parameter(
+                'page_size', openapi.IN_QUERY,
+                description="Quizzes per page (default 50, at most 200)",
+                type=openapi.TYPE_INTEGER
+            )
+        ],
         responses={
-            200: openapi.Response('List of quizzes', QuizSerializer(many=True)),
+            200: openapi.Response('Page of quiz summaries', QuizSummarySerializer(many=True)),
             401: 'Unauthorized'
         },
         security=[{'Bearer': []}]
@@ -59,16 +80,18 @@ class QuizListView(generics.ListAPIView):
     def get_queryset(self):
         user = self.request.user
         organization = user.organizationmembership.organization
-        # Fetch all quizzes related to the user organization
-        return Quiz.objects.filter(organization=organization)
+        # Fetch the quizzes related to the user organization
+        return QuizSummarySerializer.setup_summary(Quiz.objects.filter(organization=organization))
 
     def list(self, request, *args, **kwargs):
-        queryset = self.get_queryset()
-        serializer = self.get_serializer(queryset, many=True)
+        page = self.paginate_queryset(self.get_queryset())
+        serializer = self.get_serializer(page, many=True)
 
         response = {
             'message': 'Request Successful',
-            'data': serializer.data
+            'data': serializer.data,
+            'next': self.paginator.get_next_link(),
+            'previous': self.paginator.get_previous_link()
         }
         return Response(data=response, status=status.HTTP_200_OK)
 
@@ -103,7 +126,7 @@ class QuizDetailView(generics.RetrieveAPIView):
         user = self.request.user
         organization = user.organizationmembership.organization
         try:
-            return Quiz.objects.get(id=quiz_id, organization=organization)
+            return QuizSerializer.setup_eager_loading(Quiz.objects).get(id=quiz_id, organization=organization)
         except Quiz.DoesNotExist:
             raise NotFound('Quiz not found or you do not have permission to view it')
 
@@ -254,10 +277,19 @@ class HostGameSessionView(generics.CreateAPIView):
                     status=status.HTTP_403_FORBIDDEN
                 )
 
+            # Refused here rather than when the host tries to start the game
+            game_type = request.data.get('game_type', 'classic')
+            if game_type not in SCORED_GAME_TYPES:
+                return Response(
+                    {'error': f"Unsupported game type: {game_type}"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+
             game_session = GameSession.objects.create(
                 quiz=quiz,
                 host=request.user,
-                question_time_limit=request.data.get('question_time_limit', 30)
+                question_time_limit=request.data.get('question_time_limit', 30),
+                game_type=game_type
             )
             serializer = self.get_serializer(game_session)
             response_data = {
@@ -382,7 +414,7 @@ class CreateGuestPlayerView(generics.CreateAPIView):
         Create a temporary guest player account for unauthenticated users.
         
         This endpoint allows users to participate in quizzes without creating a permanent account.
-        A guest token is generated and set as an HTTP-only cookie for session management.
+        A signed guest token is generated and set as an HTTP-only cookie for session management.
         Guest accounts expire after 24 hours.
         
         **Required Fields:**
@@ -428,8 +460,8 @@ class CreateGuestPlayerView(generics.CreateAPIView):
                         ),
                         "guest_token": openapi.Schema(
                             type=openapi.TYPE_STRING,
-                            description="Token for session management (also set as HTTP-only cookie)",
-                            example="abc123def456ghi789"
+                            description="Signed token for session management (also set as HTTP-only cookie)",
+                            example="eyJwbGF5ZXJfaWQiOjEyMywiZ3Vlc3RfaWQiOiJhYmMxMjMifQ:1tXyZ2:Q2hhbmdlTWU"
                         ),
                         "username": openapi.Schema(
                             type=openapi.TYPE_STRING,
@@ -465,13 +497,14 @@ class CreateGuestPlayerView(generics.CreateAPIView):
 
             player = serializer.save()
             
-            # Set guest token expiry (24 hours from now)
-            player.guest_token_expiry = timezone.now() + timedelta(hours=24)
-            player.save()
+            # The token carries its own expiry, the field only records it
+            guest_token, expires_at = issue_guest_token(player)
+            player.guest_token_expiry = datetime.fromtimestamp(expires_at, tz=timezone.utc)
+            player.save(update_fields=['guest_token_expiry'])
 
             response = Response({
                 "player_id": player.id,
-                "guest_token": player.guest_id,
+                "guest_token": guest_token,
                 "username": player.username,
                 "avatar": player.avatar,
                 "expires_at": player.guest_token_expiry.isoformat()
@@ -480,8 +513,8 @@ class CreateGuestPlayerView(generics.CreateAPIView):
             # Set guest_token as HTTP-only cookie
             response.set_cookie(
                 'guest_token',
-                player.guest_id,
-                max_age=24 * 60 * 60,  # 24 hours in seconds
+                guest_token,
+                max_age=settings.GUEST_TOKEN_LIFETIME_SECONDS,
                 httponly=True,
                 secure=True,  # Set to True in production with HTTPS
                 samesite='None',
@@ -574,7 +607,11 @@ class GameSessionDetailView(APIView):
         Accessible to unauthenticated users.
         """
         try:
-            game_session = GameSession.objects.get(pin=pin.upper())
+            game_session = (
+                GameSession.objects
+                .annotate(player_count=Count('players'))
+                .get(pin=pin.upper())
+            )
             
             # Check if game session is still active
             if not game_session.is_active:
@@ -583,22 +620,25 @@ class GameSessionDetailView(APIView):
                     status=status.HTTP_404_NOT_FOUND
                 )
             
+            # Quiz and host details come from the game's frozen snapshot
+            quiz = get_snapshot(game_session.pin, game_session)
+
             # Prepare response data
             response_data = {
                 "pin": game_session.pin,
                 "quiz": {
-                    "id": game_session.quiz.id,
-                    "name": game_session.quiz.name,
-                    "description": game_session.quiz.description,
-                    "difficulty": game_session.quiz.difficulty,
-                    "question_count": game_session.quiz.questions.count()
+                    "id": quiz.quiz_id,
+                    "name": quiz.name,
+                    "description": quiz.description,
+                    "difficulty": quiz.difficulty,
+                    "question_count": quiz.total_questions
                 },
                 "host": {
-                    "id": game_session.host.id,
-                    "username": game_session.host.username
+                    "id": quiz.host_id,
+                    "username": quiz.host_username
                 },
                 "status": self._get_game_status(game_session),
-                "player_count": game_session.players.count(),
+                "player_count": game_session.player_count,
                 "game_type": game_session.game_type,
                 "question_time_limit": game_session.question_time_limit,
                 "start_time": game_session.start_time.isoformat(),